@@ -1,6 +1,15 @@
 import frappe
 from frappe import _
 from frappe import utils
+from fateh_logistics.driver_allowance import (
+    get_default_company,
+    get_trip_allowance_component,
+    make_allowance_additional_salary,
+    reconcile_driver_allowances
+)
+from fateh_logistics.driver_search import search_drivers
+from fateh_logistics.job_fulfilment import get_job_items, get_ordered_qty
+from fateh_logistics.transporter_billing import is_consolidated_billing_enabled
 
 """
 TODO
@@ -204,49 +213,15 @@ def get_remaining_items_from_job(job_record_id, target_doctype):
     if target_doctype not in ['Purchase Order', 'Purchase Invoice', 'Sales Order', 'Sales Invoice', 'Quotation']:
         frappe.throw(_('Unsupported target doctype: {0}').format(target_doctype))
 
-    job = frappe.get_doc("Job Record", job_record_id)
-    if not job.items:
+    job_items = get_job_items(job_record_id)
+    if not job_items:
         return []
 
-    # Determine target doc's link field to Job Record
-    link_field = "custom_job_record"
-
-    # Get existing documents linked to this Job Record
-    existing_docs = frappe.get_all(target_doctype, {
-        link_field: job_record_id,
-        "docstatus": 1
-    }, pluck="name")
-
-    # Figure out child table name
-    child_table_map = {
-        "Purchase Order": "Purchase Order Item",
-        "Purchase Invoice": "Purchase Invoice Item",
-        "Sales Order": "Sales Order Item",
-        "Sales Invoice": "Sales Invoice Item",
-        "Quotation": "Quotation Item"
-    }
-
-    item_field_map = {
-        "item_code": "item_code",
-        "qty": "qty"
-    }
-
-    item_table = child_table_map.get(target_doctype)
-    if not item_table:
-        frappe.throw(_('Unknown child table for {0}').format(target_doctype))
-
-    ordered_qty = {}
-
-    if existing_docs:
-        item_rows = frappe.get_all(item_table, {
-            "parent": ["in", existing_docs]
-        }, [item_field_map["item_code"], item_field_map["qty"]])
-
-        for row in item_rows:
-            ordered_qty[row.item_code] = ordered_qty.get(row.item_code, 0) + row.qty
+    # Submitted quantities per item are maintained in the Job Fulfilment index
+    ordered_qty = get_ordered_qty(job_record_id, target_doctype)
 
     remaining_items = []
-    for row in job.items:
+    for row in job_items:
         already_ordered = ordered_qty.get(row.item, 0)
         remaining = row.quantity - already_ordered
         if remaining > 0:
@@ -283,45 +258,53 @@ def get_expense_entries_for_job(job_record_id):
     return data
 
 
+def get_job_record_progress(job_record):
+    """(% received, % delivered) of a Job Record from its submitted orders, in one aggregate query"""
+    row = frappe.db.sql("""
+        SELECT
+            jr.total_quantity,
+            (SELECT SUM(po.per_received * po.total_qty)
+                FROM `tabPurchase Order` po
+                WHERE po.custom_job_record = jr.name AND po.docstatus = 1) AS received,
+            (SELECT AVG(so.per_delivered)
+                FROM `tabSales Order` so
+                WHERE so.custom_job_record = jr.name AND so.docstatus = 1) AS delivered
+        FROM `tabJob Record` jr
+        WHERE jr.name = %(job_record)s
+    """, {"job_record": job_record}, as_dict=True)
+
+    if not row:
+        return 0, 0
+
+    return get_percent_received(row[0].received, row[0].total_quantity), utils.flt(row[0].delivered)
+
+
+def get_percent_received(received, total_quantity):
+    # total_quantity is a Data field on Job Record
+    total_quantity = utils.flt(total_quantity)
+    return utils.flt(received) / total_quantity if total_quantity else 0
+
+
+def update_job_record_progress(job_record):
+    """Recompute % received and % delivered of a Job Record; run coalesced from order events"""
+    received, delivered = get_job_record_progress(job_record)
+    frappe.db.set_value(
+        "Job Record", job_record,
+        {"_received": received, "_delivered": delivered},
+        update_modified=False
+    )
+
+
 @frappe.whitelist()
 def update_percent_purchased(job_record):
-    #get all POs under this JR
-    pos = frappe.db.get_all("Purchase Order",
-        filters={
-            "custom_job_record": job_record,
-            "status": ["!=", "Cancelled"]},
-        fields=['name', 'per_received', 'total_qty'])
-    
-    total_qty = frappe.db.get_value("Job Record", job_record, 'total_quantity')
-
-    if len(pos) > 0:
-        percent = 0
-        total = 0
-        for po in pos:
-            total += po['per_received']*po['total_qty']
-        percent = total/total_qty
-        frappe.db.set_value('Job Record', job_record, '_received', percent)
-    else:
-        frappe.db.set_value('Job Record', job_record, '_received', 0)
+    received, _delivered = get_job_record_progress(job_record)
+    frappe.db.set_value("Job Record", job_record, "_received", received, update_modified=False)
 
 
 @frappe.whitelist()
 def update_percent_delivered(job_record):
-    sos = frappe.db.get_all("Sales Order",
-        filters={
-            "custom_job_record": job_record,
-            "status": ["!=", "Cancelled"]},
-        fields=['name', 'per_delivered'])
-    
-    if len(sos) > 0:
-        percent = 0
-        total = 0
-        for so in sos:
-            total += so['per_delivered']
-        percent = total/len(sos)
-        frappe.db.set_value('Job Record', job_record, '_delivered', percent)
-    else:
-        frappe.db.set_value('Job Record', job_record, '_delivered', 0)
+    _received, delivered = get_job_record_progress(job_record)
+    frappe.db.set_value("Job Record", job_record, "_delivered", delivered, update_modified=False)
 
 
 @frappe.whitelist()
@@ -474,9 +457,9 @@ def get_journal_entries_for_vehicle(vehicle):
 @frappe.whitelist()
 def update_driver_allowances(driver_name):
     """
-    Sum up allowances from Trip Details and update Driver (only for internal drivers)
-    Calculate allowance_taken from Additional Salary records
-    Calculate balance (allowance - allowance_taken)
+    Reconcile the driver's allowance ledger with completed Trip Details and submitted
+    Additional Salary records, and reset allowance_balance from it (only for internal drivers).
+    Day-to-day the balance is maintained by ledger postings; this is the manual repair path.
     External drivers don't track allowances - they create Purchase Invoices from Trip Details
     """
     # Check if driver has employee (internal driver) - use db.get_value to avoid loading full doc
@@ -487,38 +470,7 @@ def update_driver_allowances(driver_name):
     if not employee:
         return {"status": "info", "message": "Allowance tracking is only for internal drivers"}
     
-    # Get all completed trips for this driver
-    trips = frappe.get_all(
-        "Trip Details",
-        filters={
-            "driver": driver_name,
-            "status": "Trip Completed"
-        },
-        fields=["name", "allowance"]
-    )
-    
-    # Sum allowances from trips
-    total_allowance = sum([trip.allowance or 0 for trip in trips])
-    
-    # Calculate allowance_taken from Additional Salary records
-    # Get all submitted Additional Salary records linked to this driver
-    additional_salaries = frappe.get_all(
-        "Additional Salary",
-        filters={
-            "ref_doctype": "Driver",
-            "ref_docname": driver_name,
-            "docstatus": 1  # Only submitted records
-        },
-        fields=["name", "amount"]
-    )
-    
-    # Sum amounts from Additional Salary records
-    total_allowance_taken = sum([sal.amount or 0 for sal in additional_salaries])
-    
-    # Update Driver - only update allowance_balance (allowance field doesn't exist)
-    # Use frappe.db.set_value to safely set the field
-    frappe.db.set_value("Driver", driver_name, "allowance_balance", total_allowance - total_allowance_taken)
-    frappe.db.commit()
+    reconcile_driver_allowances([driver_name])
     
     return {"status": "success", "message": "Allowances updated"}
 
@@ -583,31 +535,8 @@ def process_driver_allowance(driver_name, amount=None):
     if not employee:
         frappe.throw("This feature is only available for internal drivers (drivers with employee). External drivers should create Purchase Invoice from Trip Details.")
     
-    # Calculate current allowance from trips
-    trips = frappe.get_all(
-        "Trip Details",
-        filters={
-            "driver": driver_name,
-            "status": "Trip Completed"
-        },
-        fields=["name", "allowance"]
-    )
-    current_allowance = sum([trip.allowance or 0 for trip in trips])
-    
-    # Calculate current allowance_taken from Additional Salary records
-    additional_salaries = frappe.get_all(
-        "Additional Salary",
-        filters={
-            "ref_doctype": "Driver",
-            "ref_docname": driver_name,
-            "docstatus": 1  # Only submitted records
-        },
-        fields=["name", "amount"]
-    )
-    current_allowance_taken = sum([sal.amount or 0 for sal in additional_salaries])
-    
-    # Calculate current balance
-    current_balance = current_allowance - current_allowance_taken
+    # Current balance is maintained by the allowance ledger; lock the driver row while paying out
+    current_balance = utils.flt(frappe.db.get_value("Driver", driver_name, "allowance_balance", for_update=True))
     
     # Determine amount to process
     if amount is None:
@@ -640,17 +569,9 @@ def process_driver_allowance(driver_name, amount=None):
     
     # Internal driver - Create Additional Salary
     # Pass driver_name and employee instead of driver object to avoid loading full doc
+    # Submitting the Additional Salary posts the debit to the allowance ledger and balance
     result = create_additional_salary_from_driver_data(driver_name, driver_data.employee, driver_data.full_name, amount)
     
-    # Update allowance_balance after creating Additional Salary
-    # Recalculate allowance_taken (now includes the new Additional Salary)
-    new_allowance_taken = current_allowance_taken + amount
-    new_allowance_balance = current_allowance - new_allowance_taken
-    
-    # Update driver with new balance (allowance field doesn't exist, only allowance_balance)
-    frappe.db.set_value("Driver", driver_name, "allowance_balance", new_allowance_balance)
-    frappe.db.commit()
-    
     return result
 
 
@@ -743,33 +664,16 @@ def create_additional_salary_from_driver_data(driver_name, employee_name, driver
     Create Additional Salary for internal driver (from Driver doctype)
     Uses driver_name and employee_name instead of driver object to avoid loading full document
     """
-    employee = frappe.get_doc("Employee", employee_name)
-    company = getattr(employee, "company", None) or frappe.defaults.get_user_default("company") or frappe.db.get_single_value("Global Defaults", "default_company")
-    
-    # Get or create "Trip Allowance" salary component
-    salary_component = "Trip Allowance"
-    if not frappe.db.exists("Salary Component", salary_component):
-        component = frappe.new_doc("Salary Component")
-        component.salary_component = salary_component
-        component.type = "Earning"
-        component.insert()
-    
-    # Create Additional Salary
-    additional_salary = frappe.new_doc("Additional Salary")
-    additional_salary.employee = employee_name
-    additional_salary.company = company
-    additional_salary.salary_component = salary_component
-    additional_salary.amount = amount
-    additional_salary.payroll_date = utils.today()
-    additional_salary.overwrite_salary_structure_amount = 0
-    additional_salary.ref_doctype = "Driver"
-    additional_salary.ref_docname = driver_name
-    
-    # Add description
-    additional_salary.description = f"Driver Allowance - {driver_full_name}"
-    
-    additional_salary.insert()
-    additional_salary.submit()
+    company = frappe.db.get_value("Employee", employee_name, "company") or get_default_company()
+    
+    additional_salary = make_allowance_additional_salary(
+        driver_name,
+        employee_name,
+        driver_full_name,
+        amount,
+        company,
+        get_trip_allowance_component()
+    )
     
     return {
         "status": "success",
@@ -981,94 +885,20 @@ def create_purchase_invoice_from_assignment(job_record, assignment, driver, amou
 
 @frappe.whitelist()
 def get_drivers_by_type(doctype, txt, searchfield, start, page_len, filters=None):
-    """Filter drivers based on driver_type (Own/External)"""
-    # Handle filters - can be passed as dict or string
+    """Drivers for the Job Assignment picker, filtered by driver_type (Own/External), from the driver search index"""
     if isinstance(filters, str):
-        import json
-        try:
-            filters = json.loads(filters)
-        except:
-            filters = {}
-    
-    if not filters:
-        filters = {}
-    
-    # Get driver_type from filters dict
-    driver_type = None
-    if isinstance(filters, dict):
-        driver_type = filters.get("driver_type")
-    
-    if driver_type == "Own":
-        # Own drivers: employee field is not empty and not null
-        # Search by both name and full_name for better usability
-        return frappe.db.sql("""
-            SELECT name, full_name
-            FROM `tabDriver`
-            WHERE employee IS NOT NULL 
-            AND employee != ''
-            AND (name LIKE %(txt)s OR full_name LIKE %(txt)s)
-            ORDER BY 
-                CASE 
-                    WHEN name LIKE %(txt)s THEN 0
-                    ELSE 1
-                END,
-                name
-            LIMIT %(start)s, %(page_len)s
-        """, {
-            "txt": f"%{txt}%",
-            "start": start,
-            "page_len": page_len
-        }, as_list=True)
-    elif driver_type == "External":
-        # External drivers: employee field is empty or null
-        # Search by both name and full_name for better usability
-        return frappe.db.sql("""
-            SELECT name, full_name
-            FROM `tabDriver`
-            WHERE (employee IS NULL OR employee = '')
-            AND (name LIKE %(txt)s OR full_name LIKE %(txt)s)
-            ORDER BY 
-                CASE 
-                    WHEN name LIKE %(txt)s THEN 0
-                    ELSE 1
-                END,
-                name
-            LIMIT %(start)s, %(page_len)s
-        """, {
-            "txt": f"%{txt}%",
-            "start": start,
-            "page_len": page_len
-        }, as_list=True)
-    else:
-        # No filter - return all drivers
-        return frappe.get_all(
-            "Driver",
-            filters={
-                "name": ["like", f"%{txt}%"]
-            },
-            fields=["name"],
-            limit_start=start,
-            limit_page_length=page_len,
-            as_list=True
-        )
+        filters = frappe.parse_json(filters)
+
+    driver_type = filters.get("driver_type") if isinstance(filters, dict) else None
+
+    return search_drivers(txt, driver_type, start, page_len)
 
 @frappe.whitelist()
 def create_trip_details(job_record, job_assignment, driver, vehicle, trip_amount, allowance=0,vehicle_revenue=0):
 
     allowance = float(allowance or 0)
-    trip_amount = float(trip_amount or 0)
-    vehicle_revenue = float(vehicle_revenue or 0)
 
-   
-    trip = frappe.new_doc("Trip Details")
-    trip.job_records = job_record
-    trip.driver = driver
-    trip.vehicle = vehicle
-    trip.trip_amount = trip_amount
-    trip.allowance = allowance
-    trip.vehicle_revenue = vehicle_revenue
-    trip.status = "Trip Completed"
-    trip.insert(ignore_permissions=True)
+    trip = insert_trip_details(job_record, driver, vehicle, trip_amount, allowance, vehicle_revenue)
 
     frappe.db.set_value("Job Assignment", job_assignment, "trip_detail_status", "Created")
 
@@ -1080,37 +910,150 @@ def create_trip_details(job_record, job_assignment, driver, vehicle, trip_amount
         ["employee", "transporter"]
     )
 
-    if not driver_employee:
+    # With consolidated billing, external trips are invoiced per transporter by the billing run
+    if not driver_employee and not is_consolidated_billing_enabled():
 
         if not driver_transporter:
             frappe.throw("Transporter not linked in Driver master.")
 
-        ITEM = "Service Transportation"
-        supplier = driver_transporter
-        company = frappe.defaults.get_user_default("Company")
-
-       
-        pi = frappe.new_doc("Purchase Invoice")
-        pi.company = company
-        pi.supplier = supplier
-        pi.posting_date = frappe.utils.today()
-        pi.bill_date = frappe.utils.today()
-        pi.custom_job_record = trip.job_records
-
-        pi.append("items", {
-            "item_code": ITEM,
-            "qty": 1,
-            "rate": allowance,
-            "amount": allowance
-        })
+        make_transporter_purchase_invoice(trip, driver_transporter, allowance, frappe.defaults.get_user_default("Company"))
 
-        pi.insert(ignore_permissions=True)
 
-        frappe.db.set_value("Purchase Invoice", pi.name, "custom_trip_details", trip.name, update_modified=False)
-        frappe.db.set_value("Trip Details", trip.name, "custom_purchase_invoice", pi.name, update_modified=False)
-        frappe.db.set_value("Trip Details", trip.name, "custom_purchase_invoice_status", "Created", update_modified=False)
+    return {
+        "trip_name": trip.name
+    }
 
 
+@frappe.whitelist()
+def create_trip_details_bulk(job_record, rows):
+    """
+    Create Trip Details for many Job Assignment rows in one call and one transaction.
+    All rows are validated before anything is inserted; drivers are read in a single query.
+
+    Args:
+        job_record: Name of Job Record
+        rows: list of {job_assignment, driver, vehicle, trip_amount, allowance, vehicle_revenue}
+    """
+    rows = [frappe._dict(row) for row in frappe.parse_json(rows) or []]
+    if not rows:
+        frappe.throw("No Job Assignment rows to create trips for")
+
+    frappe.has_permission("Job Record", "write", job_record, throw=True)
+
+    # Lock the Job Record so concurrent calls for it validate one after the other
+    frappe.get_doc("Job Record", job_record, for_update=True)
+
+    assignments = {
+        row.name: row for row in frappe.get_all(
+            "Job Assignment",
+            filters={
+                "parent": job_record,
+                "parenttype": "Job Record",
+                "name": ["in", [row.job_assignment for row in rows]]
+            },
+            fields=["name", "idx", "trip_detail_status"]
+        )
+    }
+
+    drivers = {
+        d.name: d for d in frappe.get_all(
+            "Driver",
+            filters={"name": ["in", list({row.driver for row in rows if row.driver})]},
+            fields=["name", "employee", "transporter"]
+        )
+    }
+
+    errors = []
+    seen = set()
+    for row in rows:
+        assignment = assignments.get(row.job_assignment)
+        rn = assignment.idx if assignment else "?"
+
+        if not assignment:
+            errors.append(f"Row {rn}: Job Assignment {row.job_assignment} does not belong to {job_record}")
+            continue
+        if row.job_assignment in seen:
+            errors.append(f"Row {rn}: Job Assignment is listed more than once")
+            continue
+        seen.add(row.job_assignment)
+        if assignment.trip_detail_status == "Created":
+            errors.append(f"Row {rn}: Trip already created")
+        if not row.driver:
+            errors.append(f"Row {rn}: Missing Driver")
+        elif row.driver not in drivers:
+            errors.append(f"Row {rn}: Driver {row.driver} not found")
+        elif not drivers[row.driver].employee and not drivers[row.driver].transporter:
+            errors.append(f"Row {rn}: Transporter not linked in Driver master.")
+        if not row.vehicle:
+            errors.append(f"Row {rn}: Missing Vehicle")
+
+    if errors:
+        frappe.throw("<br>".join(errors), title="Validation Errors")
+
+    company = frappe.defaults.get_user_default("Company")
+    consolidated_billing = is_consolidated_billing_enabled()
+    trips = []
+    purchase_invoices = []
+
+    for row in rows:
+        allowance = float(row.allowance or 0)
+        trip = insert_trip_details(job_record, row.driver, row.vehicle, row.trip_amount, allowance, row.vehicle_revenue)
+        trips.append(trip.name)
+
+        driver = drivers[row.driver]
+        if not driver.employee and not consolidated_billing:
+            purchase_invoices.append(make_transporter_purchase_invoice(trip, driver.transporter, allowance, company))
+
+    frappe.db.sql("""
+        UPDATE `tabJob Assignment`
+        SET trip_detail_status = 'Created'
+        WHERE name IN %(names)s
+    """, {"names": tuple(row.job_assignment for row in rows)})
+
     return {
-        "trip_name": trip.name
+        "trip_names": trips,
+        "purchase_invoices": purchase_invoices
     }
+
+
+def insert_trip_details(job_record, driver, vehicle, trip_amount, allowance=0, vehicle_revenue=0):
+    trip = frappe.new_doc("Trip Details")
+    trip.job_records = job_record
+    trip.driver = driver
+    trip.vehicle = vehicle
+    trip.trip_amount = float(trip_amount or 0)
+    trip.allowance = float(allowance or 0)
+    trip.vehicle_revenue = float(vehicle_revenue or 0)
+    trip.status = "Trip Completed"
+    trip.insert(ignore_permissions=True)
+
+    return trip
+
+
+def make_transporter_purchase_invoice(trip, transporter, allowance, company):
+    """Purchase Invoice billing an external driver's transporter for a trip"""
+    ITEM = "Service Transportation"
+
+    pi = frappe.new_doc("Purchase Invoice")
+    pi.company = company
+    pi.supplier = transporter
+    pi.posting_date = frappe.utils.today()
+    pi.bill_date = frappe.utils.today()
+    pi.custom_job_record = trip.job_records
+
+    pi.append("items", {
+        "item_code": ITEM,
+        "qty": 1,
+        "rate": allowance,
+        "amount": allowance
+    })
+
+    pi.insert(ignore_permissions=True)
+
+    frappe.db.set_value("Purchase Invoice", pi.name, "custom_trip_details", trip.name, update_modified=False)
+    frappe.db.set_value("Trip Details", trip.name, {
+        "custom_purchase_invoice": pi.name,
+        "custom_purchase_invoice_status": "Created"
+    }, update_modified=False)
+
+    return pi.name
@@ -0,0 +1,167 @@
+"""
+Coalesced background recomputation.
+
+Document events call `mark_dirty(job, name)` instead of enqueueing a
+recomputation directly. After the transaction commits, a trigger counter for
+the key is incremented in redis and a short-lived "quiet" marker is
+refreshed. `flush_dirty_keys` runs every minute and enqueues a worker job,
+deduplicated by key, for every dirty key whose quiet marker has expired (no
+trigger for `DEBOUNCE_SECONDS`). The worker atomically takes the counter and
+runs the recomputation once for all the triggers it absorbed, so no worker
+sits waiting out a debounce window. Importing 200 trips for one Job Record
+therefore recomputes that Job Record once instead of 200 times.
+
+If the recomputation fails, the taken count is put back on the key so the
+next flush retries it.
+
+Redis is accessed through pipelines so reads bypass the per-request cache and
+the take-and-clear of a counter is atomic. Trigger, run and merge counts per
+job are available from `get_coalescing_stats`.
+"""
+
+from functools import partial
+
+import frappe
+from frappe.utils import cint
+
+# Coalesced job -> method called with the dirty document name
+COALESCED_JOBS = {
+    "job_assignment_allowances": "fateh_logistics.api.update_job_assignment_allowances",
+    "job_record_progress": "fateh_logistics.api.update_job_record_progress",
+    "job_financial_summary": "fateh_logistics.job_financials.update_job_financial_summary",
+    "item_valuation_rate": "fateh_logistics.item_rates.update_item_valuation_rate",
+}
+
+DEBOUNCE_SECONDS = 5
+
+DIRTY_KEY = "fateh_logistics:coalesce:dirty"
+QUIET_KEY = "fateh_logistics:coalesce:quiet"
+STATS_KEY = "fateh_logistics:coalesce:stats"
+
+
+def mark_dirty(job, name):
+    """Schedule a coalesced run of `job` for document `name` once the current transaction commits"""
+    if not name:
+        return
+
+    if job not in COALESCED_JOBS:
+        frappe.throw(f"Unknown coalesced job {job}")
+
+    frappe.db.after_commit.add(partial(flag_dirty, job, name))
+
+
+def flag_dirty(job, name):
+    field = get_dirty_field(job, name)
+
+    pipe = frappe.cache().pipeline()
+    pipe.incr(get_redis_key(DIRTY_KEY, field))
+    pipe.set(get_redis_key(QUIET_KEY, field), 1, px=DEBOUNCE_SECONDS * 1000)
+    pipe.hincrby(frappe.cache().make_key(STATS_KEY), f"{job}:triggers", 1)
+    pipe.execute()
+
+
+def enqueue_run(job, name):
+    frappe.enqueue(
+        "fateh_logistics.coalesce.run_coalesced",
+        queue="short",
+        job_id=f"{DIRTY_KEY}:{get_dirty_field(job, name)}",
+        deduplicate=True,
+        job=job,
+        name=name
+    )
+
+
+def run_coalesced(job, name):
+    """Worker: recompute once for all absorbed triggers; a key triggered again since the flush is left for the next one"""
+    field = get_dirty_field(job, name)
+    dirty_key = get_redis_key(DIRTY_KEY, field)
+
+    # Take the counter before running so triggers committed from now on start a new round
+    pipe = frappe.cache().pipeline()
+    pipe.exists(get_redis_key(QUIET_KEY, field))
+    pipe.get(dirty_key)
+    pipe.delete(dirty_key)
+    is_quiet_pending, triggers, _deleted = pipe.execute()
+    triggers = cint(triggers)
+
+    if not triggers:
+        return
+
+    if is_quiet_pending:
+        restore_triggers(dirty_key, triggers)
+        return
+
+    try:
+        frappe.get_attr(COALESCED_JOBS[job])(name)
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        restore_triggers(dirty_key, triggers)
+        frappe.log_error(frappe.get_traceback(), f"Coalesced {job} failed for {name}")
+        raise
+
+    pipe = frappe.cache().pipeline()
+    pipe.hincrby(frappe.cache().make_key(STATS_KEY), f"{job}:runs", 1)
+    pipe.hincrby(frappe.cache().make_key(STATS_KEY), f"{job}:merged", max(triggers - 1, 0))
+    pipe.execute()
+
+
+def restore_triggers(dirty_key, triggers):
+    """Put a taken count back on the key, adding to triggers received meanwhile"""
+    pipe = frappe.cache().pipeline()
+    pipe.incrby(dirty_key, triggers)
+    pipe.execute()
+
+
+def flush_dirty_keys():
+    """Scheduler: enqueue a run for every dirty key whose debounce window has passed"""
+    fields = [field for field in get_dirty_fields() if field.split("|", 1)[0] in COALESCED_JOBS]
+    if not fields:
+        return
+
+    pipe = frappe.cache().pipeline()
+    for field in fields:
+        pipe.exists(get_redis_key(QUIET_KEY, field))
+
+    for field, is_quiet_pending in zip(fields, pipe.execute()):
+        if not is_quiet_pending:
+            enqueue_run(*field.split("|", 1))
+
+
+def get_dirty_fields():
+    prefix = get_redis_key(DIRTY_KEY, "")
+    for key in frappe.cache().scan_iter(match=prefix + "*"):
+        yield frappe.safe_decode(key)[len(prefix):]
+
+
+def get_dirty_field(job, name):
+    return f"{job}|{name}"
+
+
+def get_redis_key(prefix, field):
+    return frappe.cache().make_key(f"{prefix}:{field}")
+
+
+@frappe.whitelist()
+def get_coalescing_stats(reset=False):
+    """Triggers received, recomputations run, triggers merged and keys pending, per job"""
+    frappe.only_for("System Manager")
+
+    stats_key = frappe.cache().make_key(STATS_KEY)
+    pipe = frappe.cache().pipeline()
+    pipe.hgetall(stats_key)
+    if cint(reset):
+        pipe.delete(stats_key)
+    counters = pipe.execute()[0]
+
+    stats = {job: {"triggers": 0, "runs": 0, "merged": 0, "pending": 0} for job in COALESCED_JOBS}
+    for counter, value in counters.items():
+        job, metric = frappe.safe_decode(counter).rsplit(":", 1)
+        stats.setdefault(job, {})[metric] = cint(frappe.safe_decode(value))
+
+    for field in get_dirty_fields():
+        job = field.split("|", 1)[0]
+        stats.setdefault(job, {})
+        stats[job]["pending"] = stats[job].get("pending", 0) + 1
+
+    return stats
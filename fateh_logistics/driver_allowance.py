@@ -0,0 +1,390 @@
+"""
+Driver allowance ledger.
+
+Trip allowances credited to an internal driver and allowances paid out through
+Additional Salary are recorded as append-only `Driver Allowance Ledger Entry`
+rows. An event posts only the difference between what its voucher should
+contribute and what is already posted against it, and moves
+`Driver.allowance_balance` by the same amount, so the cost of a trip save does
+not grow with the driver's history. `rebuild_driver_allowance_ledger`
+reconciles the ledger and balances against the source documents.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import flt, getdate, now, nowdate
+
+TRIP_DETAILS = "Trip Details"
+ADDITIONAL_SALARY = "Additional Salary"
+TRIP_ALLOWANCE_COMPONENT = "Trip Allowance"
+
+LEDGER_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by",
+    "driver", "posting_date", "amount", "voucher_type", "voucher_no"
+]
+
+
+def get_trip_allowance(trip):
+    """{driver: amount} a trip should credit. Only completed trips of internal drivers count."""
+    if trip.get("status") != "Trip Completed" or not trip.get("driver") or not flt(trip.get("allowance")):
+        return {}
+
+    if not frappe.db.get_value("Driver", trip.driver, "employee"):
+        return {}
+
+    return {trip.driver: flt(trip.allowance)}
+
+
+def post_trip_allowance(trip, method=None):
+    """Post the change in a trip's allowance credit; called from Trip Details on_update and on_trash"""
+    expected = {} if method == "on_trash" else get_trip_allowance(trip)
+    post_voucher(TRIP_DETAILS, trip.name, expected, trip.get("posting_date"))
+
+
+def post_additional_salary(doc, method=None):
+    """doc_events handler: Additional Salary against a Driver debits the allowance on submit, reverses on cancel"""
+    if doc.ref_doctype != "Driver" or not doc.ref_docname:
+        return
+
+    expected = {doc.ref_docname: -flt(doc.amount)} if doc.docstatus == 1 else {}
+    post_voucher(ADDITIONAL_SALARY, doc.name, expected, doc.payroll_date)
+
+
+def post_voucher(voucher_type, voucher_no, expected, posting_date=None):
+    """Append entries so the voucher's net posting per driver equals `expected`"""
+    posted = get_posted_amounts(voucher_type, voucher_no)
+
+    entries = []
+    for driver in set(expected) | set(posted):
+        delta = flt(expected.get(driver)) - flt(posted.get(driver))
+        if flt(delta, 6):
+            entries.append((driver, posting_date or nowdate(), delta, voucher_type, voucher_no))
+
+    make_ledger_entries(entries)
+
+
+def get_posted_amounts(voucher_type, voucher_no):
+    return dict(frappe.db.sql("""
+        SELECT driver, SUM(amount)
+        FROM `tabDriver Allowance Ledger Entry`
+        WHERE voucher_type = %s AND voucher_no = %s
+        GROUP BY driver
+    """, (voucher_type, voucher_no)))
+
+
+def make_ledger_entries(entries):
+    """Insert (driver, posting_date, amount, voucher_type, voucher_no) entries and move each driver's balance"""
+    if not entries:
+        return
+
+    timestamp = now()
+    user = frappe.session.user
+    frappe.db.bulk_insert(
+        "Driver Allowance Ledger Entry",
+        fields=LEDGER_FIELDS,
+        values=[(frappe.generate_hash(length=10), timestamp, timestamp, user, user) + tuple(entry) for entry in entries]
+    )
+
+    balance_deltas = {}
+    for driver, _posting_date, amount, _voucher_type, _voucher_no in entries:
+        balance_deltas[driver] = balance_deltas.get(driver, 0) + amount
+
+    for driver, delta in balance_deltas.items():
+        frappe.db.sql("""
+            UPDATE `tabDriver`
+            SET allowance_balance = IFNULL(allowance_balance, 0) + %s
+            WHERE name = %s
+        """, (delta, driver))
+
+
+@frappe.whitelist()
+def get_allowance_summary(driver=None, job_record=None):
+    """
+    Lightweight read of current allowances for display after a save.
+    Driver balance is the maintained running balance; Job Record allowances are summed per
+    driver from its completed trips, so they are current even before the deferred
+    Job Assignment recomputation has run.
+    """
+    summary = {}
+
+    if driver:
+        frappe.has_permission("Driver", "read", driver, throw=True)
+        summary["driver_balance"] = flt(frappe.db.get_value("Driver", driver, "allowance_balance"))
+
+    if job_record:
+        frappe.has_permission("Job Record", "read", job_record, throw=True)
+        summary["job_record_allowances"] = dict(frappe.db.sql("""
+            SELECT driver, SUM(allowance)
+            FROM `tabTrip Details`
+            WHERE job_records = %s
+                AND status = 'Trip Completed'
+                AND IFNULL(driver, '') != ''
+            GROUP BY driver
+        """, job_record))
+
+    return summary
+
+
+def get_source_postings(drivers=None):
+    """Expected net posting per (driver, voucher_type, voucher_no) computed from the source documents"""
+    values = {"trip_details": TRIP_DETAILS, "additional_salary": ADDITIONAL_SALARY}
+    trip_condition = salary_condition = ""
+    if drivers:
+        values["drivers"] = tuple(drivers)
+        trip_condition = "AND td.driver IN %(drivers)s"
+        salary_condition = "AND sal.ref_docname IN %(drivers)s"
+
+    rows = frappe.db.sql("""
+        SELECT td.driver, %(trip_details)s, td.name, IFNULL(td.posting_date, DATE(td.creation)), td.allowance
+        FROM `tabTrip Details` td
+        JOIN `tabDriver` d ON d.name = td.driver
+        WHERE td.status = 'Trip Completed'
+            AND IFNULL(td.allowance, 0) != 0
+            AND IFNULL(d.employee, '') != ''
+            {trip_condition}
+        UNION ALL
+        SELECT sal.ref_docname, %(additional_salary)s, sal.name, sal.payroll_date, -sal.amount
+        FROM `tabAdditional Salary` sal
+        WHERE sal.ref_doctype = 'Driver'
+            AND sal.docstatus = 1
+            AND IFNULL(sal.amount, 0) != 0
+            {salary_condition}
+    """.format(trip_condition=trip_condition, salary_condition=salary_condition), values)
+
+    return {(driver, voucher_type, voucher_no): (posting_date, flt(amount))
+            for driver, voucher_type, voucher_no, posting_date, amount in rows}
+
+
+def get_ledger_postings(drivers=None):
+    values = {}
+    condition = ""
+    if drivers:
+        values["drivers"] = tuple(drivers)
+        condition = "WHERE driver IN %(drivers)s"
+
+    rows = frappe.db.sql("""
+        SELECT driver, voucher_type, voucher_no, SUM(amount)
+        FROM `tabDriver Allowance Ledger Entry`
+        {condition}
+        GROUP BY driver, voucher_type, voucher_no
+    """.format(condition=condition), values)
+
+    return {(driver, voucher_type, voucher_no): flt(amount) for driver, voucher_type, voucher_no, amount in rows}
+
+
+def verify_driver_allowance_ledger(drivers=None):
+    """
+    Compare source documents, ledger and Driver.allowance_balance.
+    Returns one row per driver where any of the three disagree.
+    """
+    source_totals = {}
+    for (driver, _voucher_type, _voucher_no), (_posting_date, amount) in get_source_postings(drivers).items():
+        source_totals[driver] = source_totals.get(driver, 0) + amount
+
+    ledger_totals = {}
+    for (driver, _voucher_type, _voucher_no), amount in get_ledger_postings(drivers).items():
+        ledger_totals[driver] = ledger_totals.get(driver, 0) + amount
+
+    balances = dict(frappe.get_all(
+        "Driver",
+        filters={"name": ["in", drivers]} if drivers else {"employee": ["is", "set"]},
+        fields=["name", "allowance_balance"],
+        as_list=True
+    ))
+
+    mismatches = []
+    for driver in set(source_totals) | set(ledger_totals) | set(balances):
+        expected = flt(source_totals.get(driver), 2)
+        ledger = flt(ledger_totals.get(driver), 2)
+        balance = flt(balances.get(driver), 2)
+        if not (expected == ledger == balance):
+            mismatches.append(frappe._dict(driver=driver, expected=expected, ledger=ledger, balance=balance))
+
+    return mismatches
+
+
+@frappe.whitelist()
+def rebuild_driver_allowance_ledger(drivers=None, enqueue=True):
+    """
+    Reconcile the ledger with Trip Details and Additional Salary by posting correcting entries,
+    then reset Driver.allowance_balance from the ledger. Runs in the background unless `enqueue` is falsy.
+    """
+    frappe.only_for("System Manager")
+
+    drivers = frappe.parse_json(drivers) if drivers else None
+    if isinstance(drivers, str):
+        drivers = [drivers]
+
+    if frappe.parse_json(enqueue):
+        frappe.enqueue(
+            "fateh_logistics.driver_allowance.rebuild_driver_allowance_ledger",
+            queue="long",
+            timeout=3600,
+            drivers=drivers,
+            enqueue=False
+        )
+        return {"status": "queued", "message": "Driver allowance ledger rebuild queued"}
+
+    reconcile_driver_allowances(drivers)
+    return {"status": "success", "message": "Driver allowance ledger rebuilt"}
+
+
+def reconcile_driver_allowances(drivers=None):
+    source = get_source_postings(drivers)
+    ledger = get_ledger_postings(drivers)
+
+    entries = []
+    for key in set(source) | set(ledger):
+        posting_date, expected = source.get(key, (None, 0))
+        delta = expected - ledger.get(key, 0)
+        if flt(delta, 6):
+            driver, voucher_type, voucher_no = key
+            entries.append((driver, posting_date or nowdate(), delta, voucher_type, voucher_no))
+
+    make_ledger_entries(entries)
+
+    # Balances are reset from the ledger so drift in the running balance itself is repaired too
+    values = {}
+    condition = "IFNULL(d.employee, '') != ''"
+    if drivers:
+        values["drivers"] = tuple(drivers)
+        condition = "d.name IN %(drivers)s"
+
+    frappe.db.sql("""
+        UPDATE `tabDriver` d
+        SET d.allowance_balance = (
+            SELECT IFNULL(SUM(l.amount), 0)
+            FROM `tabDriver Allowance Ledger Entry` l
+            WHERE l.driver = d.name
+        )
+        WHERE {condition}
+    """.format(condition=condition), values)
+
+
+def get_trip_allowance_component():
+    """Return the "Trip Allowance" salary component, creating it on first use"""
+    if not frappe.db.exists("Salary Component", TRIP_ALLOWANCE_COMPONENT):
+        component = frappe.new_doc("Salary Component")
+        component.salary_component = TRIP_ALLOWANCE_COMPONENT
+        component.type = "Earning"
+        component.insert()
+
+    return TRIP_ALLOWANCE_COMPONENT
+
+
+def get_default_company():
+    return frappe.defaults.get_user_default("company") or frappe.db.get_single_value("Global Defaults", "default_company")
+
+
+def make_allowance_additional_salary(driver, employee, driver_full_name, amount, company, salary_component, payroll_date=None):
+    """Create and submit the Additional Salary paying out a driver's allowance; submit posts the ledger debit"""
+    additional_salary = frappe.new_doc("Additional Salary")
+    additional_salary.employee = employee
+    additional_salary.company = company
+    additional_salary.salary_component = salary_component
+    additional_salary.amount = amount
+    additional_salary.payroll_date = payroll_date or nowdate()
+    additional_salary.overwrite_salary_structure_amount = 0
+    additional_salary.ref_doctype = "Driver"
+    additional_salary.ref_docname = driver
+    additional_salary.description = f"Driver Allowance - {driver_full_name}"
+
+    additional_salary.insert()
+    additional_salary.submit()
+
+    return additional_salary
+
+
+def get_payable_driver_balances(as_of_date):
+    """
+    Every internal driver with a positive allowance balance as of `as_of_date`, in one grouped pass
+    over the ledger. The payable amount never exceeds the current balance, so allowance already paid
+    out after the cut-off is not paid twice.
+    """
+    return frappe.db.sql("""
+        SELECT
+            d.name AS driver,
+            d.employee,
+            d.full_name,
+            e.company,
+            LEAST(
+                SUM(CASE WHEN l.posting_date <= %(as_of_date)s THEN l.amount ELSE 0 END),
+                IFNULL(d.allowance_balance, 0)
+            ) AS amount
+        FROM `tabDriver Allowance Ledger Entry` l
+        JOIN `tabDriver` d ON d.name = l.driver
+        JOIN `tabEmployee` e ON e.name = d.employee
+        WHERE IFNULL(d.employee, '') != ''
+        GROUP BY d.name, d.employee, d.full_name, e.company, d.allowance_balance
+        HAVING amount > 0
+        ORDER BY d.name
+    """, {"as_of_date": as_of_date}, as_dict=True)
+
+
+@frappe.whitelist()
+def process_all_driver_allowances(as_of_date=None, payroll_date=None):
+    """Queue one background run paying out every internal driver's allowance balance as of a date"""
+    frappe.only_for(["HR Manager", "System Manager"])
+
+    as_of_date = str(getdate(as_of_date or nowdate()))
+    frappe.enqueue(
+        "fateh_logistics.driver_allowance.run_bulk_allowance_processing",
+        queue="long",
+        timeout=3600,
+        job_id=f"fateh_logistics:bulk_allowance:{as_of_date}",
+        deduplicate=True,
+        as_of_date=as_of_date,
+        payroll_date=payroll_date or nowdate(),
+        user=frappe.session.user
+    )
+
+    return {"status": "queued", "message": _("Allowance processing queued for balances as of {0}").format(as_of_date)}
+
+
+def run_bulk_allowance_processing(as_of_date, payroll_date=None, user=None):
+    """
+    Background job: create an Additional Salary for each payable driver balance.
+    The salary component and default company are resolved once for the run; each driver is
+    committed on its own so a failure is logged and skipped without undoing the others.
+    """
+    balances = get_payable_driver_balances(as_of_date)
+    salary_component = get_trip_allowance_component()
+    default_company = get_default_company()
+    frappe.db.commit()
+
+    processed, failed = [], []
+    total = len(balances)
+
+    for idx, row in enumerate(balances, start=1):
+        try:
+            additional_salary = make_allowance_additional_salary(
+                row.driver,
+                row.employee,
+                row.full_name or row.driver,
+                flt(row.amount, 2),
+                row.company or default_company,
+                salary_component,
+                payroll_date
+            )
+            frappe.db.commit()
+            processed.append(additional_salary.name)
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), f"Bulk allowance processing failed for Driver {row.driver}")
+            failed.append(row.driver)
+
+        frappe.publish_progress(
+            idx * 100 / total,
+            title=_("Processing Driver Allowances"),
+            description=_("{0} of {1} drivers").format(idx, total)
+        )
+
+    summary = {
+        "as_of_date": as_of_date,
+        "processed": len(processed),
+        "failed": failed,
+        "total_amount": flt(sum(row.amount for row in balances if row.driver not in failed), 2)
+    }
+    frappe.publish_realtime("fateh_logistics_bulk_allowance_done", summary, user=user)
+
+    return summary
@@ -0,0 +1,143 @@
+"""
+Driver search index.
+
+Every Driver keeps its `Driver Search Token` rows: the normalized driver ID and
+its parts at position 0 and each word of the full name at positions 1
+onwards, with the driver category (Own when linked to an Employee, External
+otherwise) copied on every row. The table is indexed by (driver_category,
+token), so the driver picker answers a search with prefix range scans of that
+index instead of `LIKE '%txt%'` over Driver.
+
+A search matches drivers where every word typed is a prefix of one of their
+tokens; exact tokens rank first, then matches on the ID, then earlier words of
+the name.
+"""
+
+import re
+import unicodedata
+
+import frappe
+from frappe.utils import cint, now
+
+DRIVER_CATEGORIES = ("Own", "External")
+
+# Words of a search beyond this are ignored
+MAX_SEARCH_TOKENS = 5
+
+TOKEN_LENGTH = 140
+
+TOKEN_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by",
+    "driver", "driver_category", "full_name", "token", "position"
+]
+
+
+def normalize(text):
+    """Lowercase, accents stripped, anything but letters and digits as separators"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    return re.sub(r"[^0-9a-z\u0600-\u06ff]+", " ", text).strip()
+
+
+def get_driver_category(employee):
+    return "Own" if employee else "External"
+
+
+def get_token_rows(driver, timestamp=None):
+    timestamp = timestamp or now()
+    user = frappe.session.user
+    category = get_driver_category(driver.employee)
+
+    # The ID is indexed whole (separators dropped) and by its parts, all at position 0
+    id_words = normalize(driver.name).split()
+    words = [("".join(id_words), 0)] + [(word, 0) for word in id_words]
+    words += [(word, position) for position, word in enumerate(normalize(driver.full_name).split(), start=1)]
+
+    tokens, seen = [], set()
+    for word, position in words:
+        if word not in seen:
+            seen.add(word)
+            tokens.append((word, position))
+
+    return [
+        (frappe.generate_hash(length=10), timestamp, timestamp, user, user,
+            driver.name, category, driver.full_name, token[:TOKEN_LENGTH], position)
+        for token, position in tokens if token
+    ]
+
+
+def update_driver_search_index(doc, method=None):
+    """doc_events handler on Driver update/delete"""
+    if method == "on_trash":
+        frappe.db.delete("Driver Search Token", {"driver": doc.name})
+        return
+
+    if not (doc.has_value_changed("full_name") or doc.has_value_changed("employee")):
+        return
+
+    frappe.db.delete("Driver Search Token", {"driver": doc.name})
+    rows = get_token_rows(doc)
+    if rows:
+        frappe.db.bulk_insert("Driver Search Token", fields=TOKEN_FIELDS, values=rows)
+
+
+def rename_driver_search_tokens(doc, method=None, old=None, new=None, merge=False):
+    """doc_events handler on Driver after_rename; the ID token changes with the name"""
+    frappe.db.delete("Driver Search Token", {"driver": ["in", [old, new]]})
+    rows = get_token_rows(doc)
+    if rows:
+        frappe.db.bulk_insert("Driver Search Token", fields=TOKEN_FIELDS, values=rows)
+
+
+def rebuild_driver_search_index():
+    """Rebuild every token from Driver; used for backfill and repair"""
+    frappe.db.delete("Driver Search Token")
+
+    timestamp = now()
+    rows = []
+    for driver in frappe.get_all("Driver", fields=["name", "full_name", "employee"]):
+        rows.extend(get_token_rows(driver, timestamp))
+
+    if rows:
+        frappe.db.bulk_insert("Driver Search Token", fields=TOKEN_FIELDS, values=rows)
+
+
+def search_drivers(txt, driver_category=None, start=0, page_len=20):
+    """[[driver, full_name]] matching every word of `txt` as a token prefix, ranked"""
+    values = {"start": cint(start), "page_len": cint(page_len) or 20}
+
+    category_condition = ""
+    if driver_category in DRIVER_CATEGORIES:
+        category_condition = "AND driver_category = %(driver_category)s"
+        values["driver_category"] = driver_category
+
+    words = normalize(txt).split()[:MAX_SEARCH_TOKENS]
+    if not words:
+        return frappe.db.sql("""
+            SELECT driver, MAX(full_name) AS full_name
+            FROM `tabDriver Search Token`
+            WHERE position = 0 {category_condition}
+            GROUP BY driver
+            ORDER BY driver
+            LIMIT %(start)s, %(page_len)s
+        """.format(category_condition=category_condition), values, as_list=True)
+
+    for i, word in enumerate(words):
+        values[f"word_{i}"] = word
+        values[f"prefix_{i}"] = f"{word}%"
+
+    return frappe.db.sql("""
+        SELECT driver, MAX(full_name) AS full_name
+        FROM `tabDriver Search Token`
+        WHERE ({matches}) {category_condition}
+        GROUP BY driver
+        HAVING {all_words} = {word_count}
+        ORDER BY MAX(token IN ({exact})) DESC, MIN(position), driver
+        LIMIT %(start)s, %(page_len)s
+    """.format(
+        matches=" OR ".join(f"token LIKE %(prefix_{i})s" for i in range(len(words))),
+        category_condition=category_condition,
+        all_words=" + ".join(f"MAX(token LIKE %(prefix_{i})s)" for i in range(len(words))),
+        word_count=len(words),
+        exact=", ".join(f"%(word_{i})s" for i in range(len(words)))
+    ), values, as_list=True)
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class DriverAllowanceLedgerEntry(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Driver Allowance Ledger Entry", ["voucher_type", "voucher_no"])
@@ -0,0 +1,148 @@
+# Copyright (c) 2026, ramees@enfono.com and Contributors
+# See license.txt
+
+import frappe
+from erpnext.setup.doctype.employee.test_employee import make_employee
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import flt, nowdate
+
+from fateh_logistics.driver_allowance import (
+	ADDITIONAL_SALARY,
+	TRIP_DETAILS,
+	post_additional_salary,
+	reconcile_driver_allowances,
+	verify_driver_allowance_ledger,
+)
+
+
+class TestDriverAllowanceLedgerEntry(FrappeTestCase):
+	def setUp(self):
+		self.employee = make_employee(f"_test_allowance_{frappe.generate_hash(length=6)}@example.com")
+		self.driver = frappe.get_doc({
+			"doctype": "Driver",
+			"full_name": "_Test Allowance Driver",
+			"employee": self.employee,
+			"status": "Active",
+		}).insert().name
+
+	def test_ledger_matches_balance_through_post_edit_trash_cancel(self):
+		trip = make_trip(self.driver, 100)
+		self.assert_ledger_consistent(100)
+
+		trip.allowance = 150
+		trip.save()
+		self.assert_ledger_consistent(150)
+
+		# A trip that is no longer completed stops crediting the driver
+		trip.status = "In Progress"
+		trip.save()
+		self.assert_ledger_consistent(0)
+
+		trip.status = "Trip Completed"
+		trip.save()
+		self.assert_ledger_consistent(150)
+
+		salary = make_additional_salary(self.driver, self.employee, 60)
+		self.assert_ledger_consistent(90)
+
+		trip.delete()
+		self.assert_ledger_consistent(-60)
+		self.assertEqual(get_voucher_total(TRIP_DETAILS, trip.name), 0)
+
+		salary.db_set("docstatus", 2)
+		post_additional_salary(salary, "on_cancel")
+		self.assert_ledger_consistent(0)
+		self.assertEqual(get_voucher_total(ADDITIONAL_SALARY, salary.name), 0)
+
+	def test_edits_only_append_the_difference(self):
+		trip = make_trip(self.driver, 100)
+		trip.allowance = 120
+		trip.save()
+
+		# Saving without a change posts nothing
+		trip.save()
+
+		amounts = frappe.get_all(
+			"Driver Allowance Ledger Entry",
+			filters={"voucher_type": TRIP_DETAILS, "voucher_no": trip.name},
+			pluck="amount"
+		)
+		self.assertEqual(sorted(amounts), [20, 100])
+
+	def test_rebuild_repairs_a_drifted_balance(self):
+		make_trip(self.driver, 100)
+		frappe.db.set_value("Driver", self.driver, "allowance_balance", 40)
+
+		mismatches = verify_driver_allowance_ledger([self.driver])
+		self.assertEqual(len(mismatches), 1)
+		self.assertEqual(
+			(mismatches[0].expected, mismatches[0].ledger, mismatches[0].balance),
+			(100, 100, 40)
+		)
+
+		reconcile_driver_allowances([self.driver])
+		self.assert_ledger_consistent(100)
+
+	def assert_ledger_consistent(self, expected):
+		"""Ledger sum, Driver.allowance_balance and the source documents agree, and a rebuild changes nothing"""
+		ledger = get_ledger_total(self.driver)
+		balance = flt(frappe.db.get_value("Driver", self.driver, "allowance_balance"))
+
+		self.assertEqual(flt(ledger, 2), flt(expected, 2))
+		self.assertEqual(flt(balance, 2), flt(expected, 2))
+		self.assertEqual(verify_driver_allowance_ledger([self.driver]), [])
+
+		entries = frappe.db.count("Driver Allowance Ledger Entry", {"driver": self.driver})
+		reconcile_driver_allowances([self.driver])
+		self.assertEqual(frappe.db.count("Driver Allowance Ledger Entry", {"driver": self.driver}), entries)
+		self.assertEqual(flt(frappe.db.get_value("Driver", self.driver, "allowance_balance"), 2), flt(expected, 2))
+
+
+def make_trip(driver, allowance):
+	return frappe.get_doc({
+		"doctype": "Trip Details",
+		"driver": driver,
+		"status": "Trip Completed",
+		"allowance": allowance,
+		"posting_date": nowdate(),
+	}).insert()
+
+
+def make_additional_salary(driver, employee, amount):
+	"""
+	A submitted Additional Salary against the driver. Submitting through payroll needs a
+	salary structure assignment, so the row is written directly and the submit event is
+	replayed on it; the source query reads it like any submitted salary.
+	"""
+	salary = frappe.get_doc({
+		"doctype": "Additional Salary",
+		"employee": employee,
+		"company": frappe.db.get_value("Employee", employee, "company"),
+		"salary_component": "_Test Trip Allowance",
+		"amount": amount,
+		"payroll_date": nowdate(),
+		"ref_doctype": "Driver",
+		"ref_docname": driver,
+		"docstatus": 1,
+	})
+	salary.set_new_name()
+	salary.db_insert()
+
+	post_additional_salary(salary, "on_submit")
+	return salary
+
+
+def get_ledger_total(driver):
+	return flt(frappe.db.sql("""
+		SELECT SUM(amount)
+		FROM `tabDriver Allowance Ledger Entry`
+		WHERE driver = %s
+	""", driver)[0][0])
+
+
+def get_voucher_total(voucher_type, voucher_no):
+	return flt(frappe.db.sql("""
+		SELECT SUM(amount)
+		FROM `tabDriver Allowance Ledger Entry`
+		WHERE voucher_type = %s AND voucher_no = %s
+	""", (voucher_type, voucher_no))[0][0])
@@ -0,0 +1,14 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class DriverSearchToken(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Driver Search Token", ["driver_category", "token"])
+	frappe.db.add_index("Driver Search Token", ["driver_category", "position", "driver"])
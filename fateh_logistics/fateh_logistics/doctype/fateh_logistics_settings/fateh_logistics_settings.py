@@ -0,0 +1,13 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+from fateh_logistics.job_invoicing import clear_tax_template_search_cache
+
+
+class FatehLogisticsSettings(Document):
+	def on_update(self):
+		if self.has_value_changed("tax_template_parent_account"):
+			clear_tax_template_search_cache()
@@ -0,0 +1,15 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class JobFulfilment(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Job Fulfilment", ["job_record", "item_code", "target_doctype"], constraint_name="job_item_target"
+	)
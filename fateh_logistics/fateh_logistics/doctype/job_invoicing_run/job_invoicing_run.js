@@ -0,0 +1,29 @@
+// Copyright (c) 2026, ramees@enfono.com and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Job Invoicing Run", {
+	refresh(frm) {
+		if (frm.is_new()) return;
+
+		if (frm.doc.status === "Draft") {
+			frm.add_custom_button(__("Get Jobs"), () => {
+				frm.call("get_jobs").then(() => frm.reload_doc());
+			});
+		}
+
+		const pending = (frm.doc.jobs || []).some(row => row.status === "Pending");
+		const failed = (frm.doc.jobs || []).some(row => row.status === "Failed");
+
+		if (pending) {
+			frm.add_custom_button(frm.doc.status === "Draft" ? __("Start") : __("Resume"), () => {
+				frm.call("start").then(() => frm.reload_doc());
+			}).addClass("btn-primary");
+		}
+
+		if (failed) {
+			frm.add_custom_button(__("Retry Failed"), () => {
+				frm.call("start", { retry_failed: 1 }).then(() => frm.reload_doc());
+			});
+		}
+	}
+});
@@ -0,0 +1,62 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import cint, getdate
+from frappe.utils.background_jobs import is_job_enqueued
+
+from fateh_logistics.job_invoicing import enqueue_job_invoicing, get_invoiceable_jobs, get_run_job_id
+
+
+class JobInvoicingRun(Document):
+	def validate(self):
+		if getdate(self.from_date) > getdate(self.to_date):
+			frappe.throw(_("From Date cannot be after To Date"))
+
+		self.validate_not_processing()
+		self.set_counts()
+
+	def validate_not_processing(self):
+		"""The background job writes rows and counts of a Queued or In Progress run; block edits meanwhile"""
+		if self.is_new():
+			return
+
+		if frappe.db.get_value(self.doctype, self.name, "status") in ("Queued", "In Progress"):
+			frappe.throw(_("This run is being processed and cannot be edited"))
+
+	def set_counts(self):
+		self.total_jobs = len(self.jobs)
+		self.invoiced_jobs = len([row for row in self.jobs if row.status == "Invoiced"])
+		self.failed_jobs = len([row for row in self.jobs if row.status == "Failed"])
+
+	@frappe.whitelist()
+	def get_jobs(self):
+		"""Fill the run with the Job Records matching its filters that are not invoiced yet"""
+		self.check_permission("write")
+
+		if self.status != "Draft":
+			frappe.throw(_("Jobs can only be fetched for a Draft run"))
+
+		self.set("jobs", [])
+		for job in get_invoiceable_jobs(self.company, self.from_date, self.to_date, self.job_status, self.branch):
+			self.append("jobs", {"job_record": job.name, "customer": job.customer})
+
+		self.save()
+
+	@frappe.whitelist()
+	def start(self, retry_failed=0):
+		"""Queue the run; pending jobs (and failed ones with `retry_failed`) are invoiced in the background"""
+		self.check_permission("write")
+		frappe.has_permission("Sales Invoice", "create", throw=True)
+
+		if self.status in ("Queued", "In Progress") and is_job_enqueued(get_run_job_id(self.name)):
+			frappe.throw(_("This run is already being processed"))
+
+		statuses = ("Pending", "Failed") if cint(retry_failed) else ("Pending",)
+		if not any(row.status in statuses for row in self.jobs):
+			frappe.throw(_("There are no jobs left to invoice in this run"))
+
+		self.db_set("status", "Queued")
+		enqueue_job_invoicing(self.name, cint(retry_failed))
@@ -132,6 +132,8 @@ frappe.ui.form.on("Job Record", {
 
     refresh(frm) {
 
+        frm._financial_summary = null;
+
         if (frm.is_new()) return;
 
         frm.add_custom_button(__('View Trips'), () => {
@@ -169,64 +171,43 @@ frappe.ui.form.on("Job Record", {
                 return;
             }
 
-            function create_trip(index) {
-
-                if (index >= pending_rows.length) {
-
-                    frm.save().then(() => {
-                        frappe.msgprint("All Trips Created Successfully");
-                        frm.reload_doc();
-                    });
-
-                    return;
-                }
-
-                let row = pending_rows[index];
-
-                frappe.call({
-                    method: 'fateh_logistics.api.create_trip_details',
-                    args: {
-                        job_record: frm.doc.name,
-                        job_assignment: row.name,   
-                        driver: row.driver,
-                        vehicle: row.vehicle,
-                        trip_amount: row.trip_amount,
-                        allowance: row.allowance || 0,
-                        vehicle_revenue: row.vehicle_revenue || 0
-                    },
-                    callback(r) {
-
-                        if (!r.message) {
-                            frappe.msgprint("Trip created but server did not return any ID.");
-                            return;
-                        }
-                    
-                        row.__creating_trip = true;
-                    
-                        frappe.model.set_value(row.doctype, row.name, "trip_detail_status", "Created");
-                    
-                        frappe.show_alert({
-                            message: __('Trip Created: ' + r.message.trip_name),
-                            indicator: 'green'
-                        }, 5);
-                    
-                        setTimeout(() => { delete row.__creating_trip; }, 500);
-                    
-                        if (index === pending_rows.length - 1) {
-                            frm.save().then(() => {
-                                frappe.set_route("Form", "Trip Details", r.message.trip_name);
-
-                            });
-                        }
-                    
-                        create_trip(index + 1);
+            // Rows are re-read after any save, since saving renames newly added rows
+            const create_trips = () => frappe.call({
+                method: 'fateh_logistics.api.create_trip_details_bulk',
+                args: {
+                    job_record: frm.doc.name,
+                    rows: (frm.doc.job_assignment || [])
+                        .filter(r => r.trip_detail_status === "Pending")
+                        .map(row => ({
+                            job_assignment: row.name,
+                            driver: row.driver,
+                            vehicle: row.vehicle,
+                            trip_amount: row.trip_amount,
+                            allowance: row.allowance || 0,
+                            vehicle_revenue: row.vehicle_revenue || 0
+                        }))
+                },
+                freeze: true,
+                freeze_message: __('Creating {0} Trips...', [pending_rows.length])
+            }).then(r => {
+
+                const trip_names = (r.message && r.message.trip_names) || [];
+
+                frm.reload_doc().then(() => {
+                    if (trip_names.length === 1) {
+                        frappe.set_route("Form", "Trip Details", trip_names[0]);
+                        return;
                     }
-                    
+                    frappe.msgprint(__('All Trips Created Successfully: {0}', [trip_names.join(", ")]));
                 });
-                
-            }
+            });
 
-            create_trip(0);
+            // Unsaved edits to the assignments are saved first so the server sees the same rows
+            if (frm.is_dirty()) {
+                frm.save().then(create_trips);
+            } else {
+                create_trips();
+            }
         });
 
         frappe.model.with_doctype("Expense Entry", () => {
@@ -261,9 +242,20 @@ frappe.ui.form.on("Job Record", {
             });
         });
 
-        setTimeout(() => {
-            if (frm.dashboard) frm.events.set_dashboard_indicators(frm);
-        }, 2000);
+        frm.events.set_dashboard_indicators(frm);
+    },
+
+    get_financial_summary(frm) {
+        // One request per form load, shared by the indicators and the dashboard client scripts
+        if (!frm._financial_summary || frm._financial_summary.name !== frm.doc.name) {
+            frm._financial_summary = {
+                name: frm.doc.name,
+                promise: frappe.xcall("fateh_logistics.job_financials.get_job_financial_summary", {
+                    job_record: frm.doc.name
+                })
+            };
+        }
+        return frm._financial_summary.promise;
     },
 
     set_dashboard_indicators(frm) {
@@ -272,41 +264,17 @@ frappe.ui.form.on("Job Record", {
 
         const currency = frm.doc.currency || frappe.defaults.get_default("currency") || "SAR";
 
-        function sum(rows, key) {
-            return (rows || []).reduce((a, r) => a + (r[key] || 0), 0);
-        }
-
-        frappe.client.get_list('Sales Invoice', {
-            filters: { custom_job_record: frm.doc.name, docstatus: 1 },
-            fields: ['base_grand_total']
-        }).then(salesRes => {
-
-            const sales = sum(salesRes, 'base_grand_total');
-
-            frappe.client.get_list('Purchase Invoice', {
-                filters: { custom_job_record: frm.doc.name, docstatus: 1 },
-                fields: ['base_grand_total']
-            }).then(purchaseRes => {
-
-                const purchase = sum(purchaseRes, 'base_grand_total');
+        frm.events.get_financial_summary(frm).then(summary => {
 
-                frappe.client.get_list('Expense Entry', {
-                    filters: { custom_job_record: frm.doc.name, docstatus: 1, status: 'Approved' },
-                    fields: ['total']
-                }).then(expRes => {
+            const profit = summary.sales - (summary.purchase + summary.expenses);
 
-                    const other = sum(expRes, 'total');
-                    const profit = sales - (purchase + other);
-
-                    frm.dashboard.add_indicator(`Sales: ${format_currency(sales, currency)}`, "blue");
-                    frm.dashboard.add_indicator(`Purchase: ${format_currency(purchase, currency)}`, "orange");
-                    frm.dashboard.add_indicator(`Other Expenses: ${format_currency(other, currency)}`, "purple");
-                    frm.dashboard.add_indicator(
-                        `${profit >= 0 ? 'Profit' : 'Loss'}: ${format_currency(profit, currency)}`,
-                        profit >= 0 ? "green" : "red"
-                    );
-                });
-            });
+            frm.dashboard.add_indicator(`Sales: ${format_currency(summary.sales, currency)}`, "blue");
+            frm.dashboard.add_indicator(`Purchase: ${format_currency(summary.purchase, currency)}`, "orange");
+            frm.dashboard.add_indicator(`Other Expenses: ${format_currency(summary.expenses, currency)}`, "purple");
+            frm.dashboard.add_indicator(
+                `${profit >= 0 ? 'Profit' : 'Loss'}: ${format_currency(profit, currency)}`,
+                profit >= 0 ? "green" : "red"
+            );
         });
     },
 
@@ -474,30 +442,45 @@ frappe.ui.form.on('Job Assignment', {
                 frappe.model.set_value(cdt, cdn, 'transporter', '');
             }
 
-          
-            if (employee) {
-                frappe.db.get_list('Vehicle', {
-                    filters: { employee: employee },
-                    fields: ['name'],
-                    limit: 1
-                }).then(v => {
-                    frappe.model.set_value(cdt, cdn, 'vehicle', v.length ? v[0].name : '');
-                });
-            }
-
-            if (!employee && transporter) {
-                frappe.db.get_list('Vehicle', {
-                    filters: { custom_transporter: transporter },
-                    fields: ['name'],
-                    limit: 1
-                }).then(v => {
+            // FIRST VEHICLE OF THE DRIVER THAT IS FREE AT PICKUP TIME,
+            // ELSE THE DRIVER'S OWN VEHICLE WITH A WARNING
+            if (employee || transporter) {
+                const filters = employee ? { employee: employee } : { custom_transporter: transporter };
 
-                    frappe.model.set_value(cdt, cdn, 'vehicle', v.length ? v[0].name : '');
+                frappe.call({
+                    method: 'fateh_logistics.trip_booking.find_available',
+                    args: {
+                        from_datetime: row.pickup_time,
+                        employee: employee || null,
+                        transporter: employee ? null : transporter,
+                        limit: 1
+                    }
+                }).then(res => {
+                    const vehicles = res.message || [];
 
-                    if (!v.length) {
-                        frappe.msgprint(__('No vehicle linked to this transporter'));
+                    if (vehicles.length) {
+                        frappe.model.set_value(cdt, cdn, 'vehicle', vehicles[0].name);
+                        return;
                     }
 
+                    frappe.db.get_list('Vehicle', {
+                        filters: filters,
+                        fields: ['name'],
+                        limit: 1
+                    }).then(v => {
+
+                        frappe.model.set_value(cdt, cdn, 'vehicle', v.length ? v[0].name : '');
+
+                        if (!v.length) {
+                            frappe.msgprint(employee
+                                ? __('No vehicle linked to this driver')
+                                : __('No vehicle linked to this transporter'));
+                        } else {
+                            frappe.msgprint(__('Vehicle {0} is already booked at the pickup time', [v[0].name]));
+                        }
+
+                    });
+
                 });
             }
 
@@ -535,6 +518,13 @@ frappe.ui.form.on("Job Record", {
 
     refresh(frm) {
 
+        frm.set_query("item_tax_template", "invoice_item", function () {
+            return {
+                query: "fateh_logistics.fateh_logistics.doctype.job_record.job_record.get_item_tax_template_filtered",
+                filters: { company: frm.doc.company }
+            };
+        });
+
         if (frm.doc.__islocal) return;
 
         if (frm.doc.invoice_status !== "Invoice Created") {
@@ -542,160 +532,29 @@ frappe.ui.form.on("Job Record", {
                 frm.events.create_sales_invoice(frm);
             });
         }
-
-        // ------------------------------------------------
-        // FILTER ITEM TAX TEMPLATE BY COMPANY (CHILD TABLE)
-        // ------------------------------------------------
-        frm.set_query("item_tax_template", "invoice_item", function (doc, cdt, cdn) {
-            if (!frm.doc.company) return {};
-            return {
-                filters: {
-                    company: frm.doc.company
-                }
-            };
-        });
-    },
-
-        refresh(frm) {
-       
-        frm.set_query("item_tax_template", "invoice_item", function () {
-            return {
-                query: "fateh_logistics.fateh_logistics.doctype.job_record.job_record.get_item_tax_template_filtered"
-            };
-        });
-
     },
 
     async create_sales_invoice(frm) {
 
-        // ---------------------------
-        // CHECK DUPLICATE
-        // ---------------------------
-        const existing_invoice = await frappe.db.get_list("Sales Invoice", {
-            filters: { custom_job_record: frm.doc.name },
-            fields: ["name", "docstatus"],
-            limit: 1
-        });
-
-        if (existing_invoice.length && existing_invoice[0].docstatus !== 2) {
-            frappe.msgprint({
-                title: __("Duplicate Invoice"),
-                message: __("A Sales Invoice already exists for this Job Record."),
-                indicator: "red"
-            });
-            return;
-        }
-
-        // ---------------------------
-        // BASIC VALIDATION
-        // ---------------------------
-        if (!frm.doc.invoice_item || !frm.doc.invoice_item.length) {
-            frappe.msgprint({
-                title: __("No Items"),
-                message: __("Please add at least one row in Invoice Items."),
-                indicator: "red"
-            });
-            return;
-        }
-
-        if (!frm.doc.company || !frm.doc.customer) {
-            frappe.msgprint({
-                title: __("Missing Data"),
-                message: __("Company and Customer are required."),
-                indicator: "red"
-            });
-            return;
-        }
-
-        // ---------------------------
-        // BUILD ITEMS + ITEM-WISE TAX
-        // ---------------------------
-        let items = [];
-        let tax_accounts = {};   // tax heads for header
-
-        for (let row of frm.doc.invoice_item) {
-
-            if (!row.item || !row.qty || !row.rate) {
-                frappe.throw(__("Item, Qty and Rate are mandatory in Invoice Items"));
-            }
-
-            let item_tax_rate = null;
-
-            if (row.item_tax_template) {
-
-                const tax_doc = await frappe.db.get_doc(
-                    "Item Tax Template",
-                    row.item_tax_template
-                );
-
-                if (tax_doc.taxes && tax_doc.taxes.length) {
-
-                    let tax_map = {};
-
-                    tax_doc.taxes.forEach(t => {
-                        tax_map[t.tax_type] = t.tax_rate;
-                        tax_accounts[t.tax_type] = true; // collect header tax head
-                    });
-
-                    item_tax_rate = JSON.stringify(tax_map);
-                }
-            }
-
-            items.push({
-                item_code: row.item,
-                qty: row.qty,
-                rate: row.rate,
-                item_tax_template: row.item_tax_template || null,
-                item_tax_rate: item_tax_rate,   // ✅ item-wise VAT
-                custom_container_no: frm.doc.custom_container_no
-            });
+        if (frm.is_dirty()) {
+            await frm.save();
         }
 
-        // ---------------------------
-        // HEADER TAX ROWS (RATE = 0)
-        // ---------------------------
-        let taxes = Object.keys(tax_accounts).map(acc => ({
-            charge_type: "On Net Total",
-            account_head: acc,
-            description: acc,
-            rate: 0,                     // item-wise tax will apply
-            included_in_print_rate: 0
-        }));
-
-        // ---------------------------
-        // CREATE SALES INVOICE
-        // ---------------------------
+        // Built server-side: duplicate check under a row lock, cached tax templates, status set atomically
         frappe.call({
-            method: "frappe.client.insert",
-            args: {
-                doc: {
-                    doctype: "Sales Invoice",
-                    company: frm.doc.company,
-                    customer: frm.doc.customer,
-                    cost_center: frm.doc.branch,
-                    posting_date: frappe.datetime.get_today(),
-                    due_date: frappe.datetime.add_days(frappe.datetime.get_today(), 30),
-                    custom_job_record: frm.doc.name,
-                    items: items,
-                    taxes: taxes
-                }
-            },
+            method: "fateh_logistics.job_invoicing.make_sales_invoice_from_job",
+            args: { job_record: frm.doc.name },
+            freeze: true,
+            freeze_message: __("Creating Sales Invoice..."),
             callback(r) {
-                if (!r.exc) {
-
-                    frappe.db.set_value(
-                        "Job Record",
-                        frm.doc.name,
-                        "invoice_status",
-                        "Invoice Created"
-                    );
+                if (!r.exc && r.message) {
 
                     frappe.msgprint({
                         message: __("Sales Invoice created successfully (Draft)"),
                         indicator: "green"
                     });
 
-                    frappe.set_route("Form", "Sales Invoice", r.message.name);
+                    frappe.set_route("Form", "Sales Invoice", r.message);
                 }
             }
         });
@@ -706,3 +565,55 @@ frappe.ui.form.on("Job Record", {
 
 
 
+
+
+frappe.ui.form.on("Job Record", {
+
+    refresh(frm) {
+        if (frm.is_new()) return;
+        render_fulfilment(frm);
+    }
+});
+
+// ------------------------------------------------
+// FULFILMENT GRID - SUBMITTED QTY PER ITEM AND DOCUMENT TYPE
+// ------------------------------------------------
+function render_fulfilment(frm) {
+
+    frappe.call({
+        method: "fateh_logistics.job_fulfilment.get_job_fulfilment",
+        args: { job_record: frm.doc.name }
+    }).then(r => {
+
+        const wrapper = frm.get_field("fulfilment_html").$wrapper;
+        const data = r.message || { targets: [], rows: [] };
+
+        if (!data.rows.length) {
+            wrapper.html(`<p class="text-muted">${__("No submitted documents linked to this Job Record yet.")}</p>`);
+            return;
+        }
+
+        const header = [__("Item"), __("Required")]
+            .concat(data.targets.map(t => __(t)))
+            .map(label => `<th>${label}</th>`)
+            .join("");
+
+        const body = data.rows.map(row => {
+            const cells = data.targets.map(t => {
+                const qty = row[frappe.scrub(t)] || 0;
+                const short = row.required_qty && qty < row.required_qty;
+                return `<td class="text-right ${short ? "text-warning" : ""}">${format_number(qty)}</td>`;
+            }).join("");
+            return `<tr>
+                <td>${frappe.utils.escape_html(row.item_code)}</td>
+                <td class="text-right">${format_number(row.required_qty)}</td>
+                ${cells}
+            </tr>`;
+        }).join("");
+
+        wrapper.html(`<table class="table table-bordered table-sm">
+            <thead><tr>${header}</tr></thead>
+            <tbody>${body}</tbody>
+        </table>`);
+    });
+}
@@ -3,6 +3,10 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import cint, flt
+
+from fateh_logistics.item_rates import VALUATION_SOURCES, get_latest_rates
+from fateh_logistics.job_invoicing import get_eligible_tax_templates
 
 
 class JobRecord(Document):
@@ -11,78 +15,82 @@ class JobRecord(Document):
 		item_profit = 0
 		if not hasattr(self, 'items') or not self.items:
 			return
+
+		rates = get_valuation_rates(self.get_valuation_rate_from, [row.item for row in self.items if row.item])
+
 		for row in self.items:
 			if not row.item:
 				continue
 
-			if self.get_valuation_rate_from == "Latest Purchase":
-				row.valuation_rate = get_latest_purchase_rate(row.item)
-				row.valuation_amount = row.quantity * row.valuation_rate
-				row.profit = row.amount - row.valuation_amount
-
-			elif self.get_valuation_rate_from == "Stock Ledger":
-				row.valuation_rate = get_stock_valuation_rate(row.item)
-				row.valuation_amount = row.quantity * row.valuation_rate
-				row.profit = row.amount - row.valuation_amount
-
-			else:
-				row.valuation_rate = 0.0
-				row.valuation_amount = row.quantity * row.valuation_rate
-				row.profit = row.amount - row.valuation_amount
-				
+			row.valuation_rate = rates.get(row.item, 0.0)
+			row.valuation_amount = row.quantity * row.valuation_rate
+			row.profit = row.amount - row.valuation_amount
+
 			total_value += row.valuation_amount
 			item_profit += row.profit
 		self.total_valuation = total_value
 		self.item_profit = item_profit
 
 
+def get_valuation_rates(source, item_codes):
+    """
+    Latest rate per item for the valuation source, read from Item Latest Rate in
+    one query for all items not seen yet in this request and memoized on frappe.local.
+    """
+    rate_column = VALUATION_SOURCES.get(source)
+    if not rate_column:
+        return {}
+
+    if not hasattr(frappe.local, "job_record_valuation_rates"):
+        frappe.local.job_record_valuation_rates = {}
+    cache = frappe.local.job_record_valuation_rates.setdefault(source, {})
+
+    missing = {item_code for item_code in item_codes if item_code not in cache}
+    if missing:
+        rates = get_latest_rates(missing, rate_column)
+        for item_code in missing:
+            cache[item_code] = flt(rates.get(item_code))
+
+    return {item_code: cache[item_code] for item_code in item_codes}
+
+
 def get_latest_purchase_rate(item_code):
-    result = frappe.db.sql("""
-        SELECT pi_item.rate
-        FROM `tabPurchase Invoice Item` pi_item
-        JOIN `tabPurchase Invoice` pi ON pi.name = pi_item.parent
-        WHERE pi_item.item_code = %s AND pi.docstatus = 1
-        ORDER BY pi.posting_date DESC, pi.creation DESC
-        LIMIT 1
-    """, (item_code,), as_dict=1)
-    return result[0].rate if result else 0.0
+    return get_valuation_rates("Latest Purchase", [item_code])[item_code]
 
 
 def get_stock_valuation_rate(item_code):
-    result = frappe.db.sql("""
-        SELECT valuation_rate
-        FROM `tabStock Ledger Entry`
-        WHERE item_code = %s AND valuation_rate IS NOT NULL
-        ORDER BY posting_date DESC, posting_time DESC, creation DESC
-        LIMIT 1
-    """, (item_code,), as_dict=1)
-    return result[0].valuation_rate if result else 0.0
+    return get_valuation_rates("Stock Ledger", [item_code])[item_code]
 
 
 @frappe.whitelist()
 def get_item_tax_template_filtered(doctype, txt, searchfield, start, page_len, filters):
+    """
+    Tax templates for the invoice items, from the cached per-company list;
+    exact and prefix matches rank before word-start and other matches.
+    """
+    filters = frappe.parse_json(filters) if isinstance(filters, str) else filters or {}
+    names = get_eligible_tax_templates(filters.get("company"))
+
+    txt = (txt or "").strip().lower()
+    if txt:
+        ranked = []
+        for name in names:
+            lowered = name.lower()
+            position = lowered.find(txt)
+            if position == -1:
+                continue
+
+            if lowered == txt:
+                rank = 0
+            elif position == 0:
+                rank = 1
+            elif f" {txt}" in lowered or f"-{txt}" in lowered:
+                rank = 2
+            else:
+                rank = 3
+            ranked.append((rank, position, name))
+
+        names = [name for rank, position, name in sorted(ranked)]
 
-    parent = frappe.db.get_value(
-        "Account",
-        "Duties and Taxes - F",
-        ["lft", "rgt"],
-        as_dict=1
-    )
-
-    if not parent:
-        return []
-
-    return frappe.db.sql("""
-        SELECT DISTINCT itt.name
-        FROM `tabItem Tax Template` itt
-        JOIN `tabItem Tax Template Detail` ittd
-            ON ittd.parent = itt.name
-        JOIN `tabAccount` acc
-            ON acc.name = ittd.tax_type   
-        WHERE 
-            acc.lft >= %s AND acc.rgt <= %s
-            AND acc.account_type IN ('Tax', 'Chargeable', 'Income Account', 'Expense Account')
-            AND itt.name LIKE %s
-        LIMIT %s, %s
-    """, (parent.lft, parent.rgt, "%%%s%%" % txt, start, page_len))
-		
+    start = cint(start)
+    return [(name,) for name in names[start:start + cint(page_len)]]
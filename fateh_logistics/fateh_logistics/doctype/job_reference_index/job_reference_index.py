@@ -0,0 +1,13 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class JobReferenceIndex(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Job Reference Index", ["reference_doctype", "job"])
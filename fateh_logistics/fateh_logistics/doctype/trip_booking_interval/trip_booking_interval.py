@@ -0,0 +1,14 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class TripBookingInterval(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Trip Booking Interval", ["resource_type", "resource", "from_datetime"])
+	frappe.db.add_index("Trip Booking Interval", ["resource_type", "from_datetime"])
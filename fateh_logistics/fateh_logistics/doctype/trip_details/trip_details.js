@@ -13,9 +13,35 @@ frappe.ui.form.on('Trip Details', {
     },
     custom_container_number: function(frm) {
         calculate_rent(frm);
+    },
+    after_save: function(frm) {
+        show_allowance_summary(frm);
     }
 });
 
+/**
+ * Allowance recomputation runs in the background after save, so read the
+ * maintained balances directly to confirm the trip's effect to the user.
+ */
+function show_allowance_summary(frm) {
+    if (!frm.doc.driver || !frm.doc.allowance) return;
+
+    frappe.call({
+        method: "fateh_logistics.driver_allowance.get_allowance_summary",
+        args: {
+            driver: frm.doc.driver,
+            job_record: frm.doc.job_records
+        }
+    }).then(r => {
+        if (!r.message) return;
+
+        frappe.show_alert({
+            message: __("Driver allowance balance: {0}", [format_currency(r.message.driver_balance || 0)]),
+            indicator: "green"
+        });
+    });
+}
+
 /**
  * This function calculates the total rent for a trip based on
  * pickup and delivery date-time values.
@@ -3,7 +3,9 @@
 
 import frappe
 from frappe.model.document import Document
-from fateh_logistics.api import update_driver_allowances, update_job_assignment_allowances
+from fateh_logistics.coalesce import mark_dirty
+from fateh_logistics.driver_allowance import post_trip_allowance
+from fateh_logistics.trip_booking import remove_trip_booking, sync_trip_booking, validate_trip_booking
 from frappe.utils import today
 
 
@@ -59,82 +61,46 @@ def make_purchase_invoice(source_name, target_doc=None):
 
 
 class TripDetails(Document):
-	def before_save(self):
-		"""Auto-update driver and job assignment allowances when trip is completed (only for internal drivers)"""
-		if self.status == "Trip Completed" and self.driver and self.allowance:
-			# Check if driver is internal (has employee) before updating - use db.get_value to avoid loading full doc
-			employee = frappe.db.get_value("Driver", self.driver, "employee")
-			if employee:
-				# Update driver allowance synchronously when trip is completed
-				try:
-					update_driver_allowances(self.driver)
-				except Exception:
-					# Log error but don't block save
-					frappe.log_error(frappe.get_traceback(), "Error updating driver allowances for Trip Details")
-			
-			# Update Job Assignment allowances if job_records is linked
+	def validate(self):
+		"""Reject overlapping bookings of the same driver or vehicle"""
+		validate_trip_booking(self)
+
+	def on_update(self):
+		"""
+		Keep the save path O(1): book the trip, post the allowance delta to the driver ledger and
+		defer Job Assignment allowance recomputation to a coalesced after-commit background job
+		"""
+		sync_trip_booking(self)
+
+		# Post only the change in this trip's allowance credit to the driver allowance ledger
+		post_trip_allowance(self)
+
+		# Recompute Job Assignment allowances when the trip's allowance contribution may have changed
+		should_update = (self.has_value_changed("allowance") or self.has_value_changed("status")
+			or self.has_value_changed("driver") or self.has_value_changed("job_records"))
+
+		if should_update:
+			# Update Job Assignment allowances - handle both old and new job_records if changed
+			job_records_to_update = []
 			if self.job_records:
-				try:
-					update_job_assignment_allowances(self.job_records)
-				except Exception:
-					# Log error but don't block save
-					frappe.log_error(frappe.get_traceback(), "Error updating job assignment allowances for Trip Details")
-	
-	def after_insert(self):
-		"""Auto-update driver and job assignment allowances when trip is created with allowance (only for internal drivers)"""
-		if self.driver and self.allowance:
-			# Check if driver is internal (has employee) before updating - use db.get_value to avoid loading full doc
-			employee = frappe.db.get_value("Driver", self.driver, "employee")
-			if employee:
-				# Update driver allowance in background
-				frappe.enqueue(
-					"fateh_logistics.api.update_driver_allowances",
-					driver_name=self.driver,
-					queue="short"
-				)
+				job_records_to_update.append(self.job_records)
 			
-			# Update Job Assignment allowances if job_records is linked
-			if self.job_records:
-				frappe.enqueue(
-					"fateh_logistics.api.update_job_assignment_allowances",
-					job_record_name=self.job_records,
-					queue="short"
-				)
-	
-	def on_update(self):
-		"""Update driver and job assignment allowances when trip allowance or status is changed (only for internal drivers)"""
-		if self.driver:
-			# Update if allowance changed or status changed to completed
-			should_update = (self.has_value_changed("allowance") or 
-				(self.has_value_changed("status") and self.status == "Trip Completed"))
+			# If job_records changed, also update the old one
+			if self.has_value_changed("job_records") and self.get_doc_before_save():
+				old_job_records = self.get_doc_before_save().job_records
+				if old_job_records and old_job_records != self.job_records:
+					job_records_to_update.append(old_job_records)
 			
-			if should_update:
-				# Check if driver is internal (has employee) before updating - use db.get_value to avoid loading full doc
-				employee = frappe.db.get_value("Driver", self.driver, "employee")
-				if employee:
-					# Update driver allowance in background
-					frappe.enqueue(
-						"fateh_logistics.api.update_driver_allowances",
-						driver_name=self.driver,
-						queue="short"
-					)
-				
-				# Update Job Assignment allowances - handle both old and new job_records if changed
-				job_records_to_update = []
-				if self.job_records:
-					job_records_to_update.append(self.job_records)
-				
-				# If job_records changed, also update the old one
-				if self.has_value_changed("job_records") and self.get_doc_before_save():
-					old_job_records = self.get_doc_before_save().job_records
-					if old_job_records and old_job_records != self.job_records:
-						job_records_to_update.append(old_job_records)
-				
-				# Update all relevant job records
-				for job_record_name in job_records_to_update:
-					frappe.enqueue(
-						"fateh_logistics.api.update_job_assignment_allowances",
-						job_record_name=job_record_name,
-						queue="short"
-					)
+			# Update all relevant job records - repeated saves collapse into one run per job record
+			for job_record_name in job_records_to_update:
+				mark_dirty("job_assignment_allowances", job_record_name)
+
+	def on_trash(self):
+		remove_trip_booking(self)
+		post_trip_allowance(self, "on_trash")
+		mark_dirty("job_assignment_allowances", self.job_records)
+
 
+def on_doctype_update():
+	frappe.db.add_index("Trip Details", ["driver", "posting_date"])
+	frappe.db.add_index("Trip Details", ["job_records", "status"])
@@ -0,0 +1,143 @@
+# Copyright (c) 2026, ramees@enfono.com and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from fateh_logistics.vehicle_pl import (
+	JOURNAL_ENTRY,
+	PURCHASE_INVOICE,
+	TRIP_CREDIT,
+	apply_rollup_deltas,
+	rebuild_vehicle_daily_pl,
+	update_vehicle_daily_pl,
+)
+
+TEST_DATE = "2099-01-15"
+OTHER_DATE = "2099-01-16"
+
+
+class TestVehicleDailyPL(FrappeTestCase):
+	def setUp(self):
+		self.vehicle = make_vehicle()
+
+	def test_purchase_invoice_submit_and_cancel(self):
+		invoice = frappe.get_doc({
+			"doctype": "Purchase Invoice",
+			"posting_date": TEST_DATE,
+			"items": [
+				{"custom_vehicle": self.vehicle, "base_amount": 100, "amount": 100},
+				# Falls back to the transaction amount when the base amount is missing
+				{"custom_vehicle": self.vehicle, "base_amount": 0, "amount": 40},
+				{"custom_vehicle": None, "base_amount": 999, "amount": 999},
+			],
+		})
+
+		update_vehicle_daily_pl(invoice, "on_submit")
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, PURCHASE_INVOICE): 140})
+
+		update_vehicle_daily_pl(invoice, "on_cancel")
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, PURCHASE_INVOICE): 0})
+
+	def test_journal_entry_submit_and_cancel(self):
+		entry = frappe.get_doc({
+			"doctype": "Journal Entry",
+			"posting_date": TEST_DATE,
+			"accounts": [
+				{"custom_vehicle": self.vehicle, "debit": 75, "debit_in_account_currency": 75},
+				{"custom_vehicle": self.vehicle, "credit": 75, "credit_in_account_currency": 75},
+			],
+		})
+
+		update_vehicle_daily_pl(entry, "on_submit")
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, JOURNAL_ENTRY): 75})
+
+		update_vehicle_daily_pl(entry, "on_cancel")
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, JOURNAL_ENTRY): 0})
+
+	def test_job_record_update_applies_only_the_diff(self):
+		other_vehicle = make_vehicle()
+		before = make_job_record(TEST_DATE, [(self.vehicle, 100), (self.vehicle, 50)], insert=False)
+		update_vehicle_daily_pl(before, "on_update")
+
+		# Amount changed on one row, the other moved to another vehicle, then the date moves
+		after = make_job_record(TEST_DATE, [(self.vehicle, 120), (other_vehicle, 50)], insert=False)
+		after._doc_before_save = before
+		update_vehicle_daily_pl(after, "on_update")
+
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, TRIP_CREDIT): 120})
+		self.assertEqual(get_rollup(other_vehicle), {(TEST_DATE, TRIP_CREDIT): 50})
+
+		moved = make_job_record(OTHER_DATE, [(self.vehicle, 120), (other_vehicle, 50)], insert=False)
+		moved._doc_before_save = after
+		update_vehicle_daily_pl(moved, "on_update")
+
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, TRIP_CREDIT): 0, (OTHER_DATE, TRIP_CREDIT): 120})
+
+		update_vehicle_daily_pl(moved, "on_trash")
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, TRIP_CREDIT): 0, (OTHER_DATE, TRIP_CREDIT): 0})
+		self.assertEqual(get_rollup(other_vehicle), {(TEST_DATE, TRIP_CREDIT): 0, (OTHER_DATE, TRIP_CREDIT): 0})
+
+	def test_upsert_adds_into_one_row_per_key(self):
+		key = (self.vehicle, TEST_DATE, PURCHASE_INVOICE)
+
+		apply_rollup_deltas({key: 10})
+		apply_rollup_deltas({key: 15})
+		apply_rollup_deltas({key: -5})
+
+		self.assertEqual(frappe.db.count("Vehicle Daily PL", {"vehicle": self.vehicle}), 1)
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, PURCHASE_INVOICE): 20})
+
+	def test_zero_delta_does_not_create_a_row(self):
+		apply_rollup_deltas({(self.vehicle, TEST_DATE, JOURNAL_ENTRY): 0})
+		self.assertFalse(frappe.db.exists("Vehicle Daily PL", {"vehicle": self.vehicle}))
+
+	def test_rebuild_matches_incremental_rollup(self):
+		job_record = make_job_record(TEST_DATE, [(self.vehicle, 100), (self.vehicle, 25)])
+
+		job_record.job_assignment[0].trip_amount = 80
+		job_record.append("job_assignment", {"vehicle": self.vehicle, "trip_amount": 30})
+		job_record.save()
+
+		incremental = get_rollup(self.vehicle)
+		self.assertEqual(incremental, {(TEST_DATE, TRIP_CREDIT): 135})
+
+		rebuild_vehicle_daily_pl(from_date=TEST_DATE, to_date=TEST_DATE, enqueue=False)
+		self.assertEqual(get_rollup(self.vehicle), incremental)
+
+		job_record.delete()
+		self.assertEqual(get_rollup(self.vehicle), {(TEST_DATE, TRIP_CREDIT): 0})
+
+		rebuild_vehicle_daily_pl(from_date=TEST_DATE, to_date=TEST_DATE, enqueue=False)
+		self.assertEqual(get_rollup(self.vehicle), {})
+
+
+def make_vehicle():
+	return frappe.get_doc({
+		"doctype": "Vehicle",
+		"license_plate": "_T-" + frappe.generate_hash(length=8).upper(),
+		"custom_is_external": "External",
+	}).insert().name
+
+
+def make_job_record(date, assignments, insert=True):
+	job_record = frappe.get_doc({
+		"doctype": "Job Record",
+		"name": "_Test Job PL " + frappe.generate_hash(length=8),
+		"date": date,
+		"job_assignment": [{"vehicle": vehicle, "trip_amount": amount} for vehicle, amount in assignments],
+	})
+
+	return job_record.insert() if insert else job_record
+
+
+def get_rollup(vehicle):
+	"""{(posting_date, source_type): amount} of the vehicle's rollup rows"""
+	return {
+		(str(row.posting_date), row.source_type): row.amount
+		for row in frappe.get_all(
+			"Vehicle Daily PL",
+			filters={"vehicle": vehicle},
+			fields=["posting_date", "source_type", "amount"]
+		)
+	}
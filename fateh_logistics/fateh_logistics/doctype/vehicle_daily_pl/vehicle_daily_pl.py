@@ -0,0 +1,15 @@
+# Copyright (c) 2026, ramees@enfono.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class VehicleDailyPL(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Vehicle Daily PL", ["vehicle", "posting_date", "source_type"], constraint_name="vehicle_date_source"
+	)
@@ -28,8 +28,58 @@ frappe.query_reports["Vehicle Driver Assignment"] = {
             "fieldtype": "Date",
             "default": frappe.datetime.get_today(),
             "reqd": 1
+        },
+        {
+            "fieldname": "prepare_in_background",
+            "label": __("Prepare in Background"),
+            "fieldtype": "Check",
+            "default": 0
+        },
+        {
+            "fieldname": "after_driver",
+            "fieldtype": "Data",
+            "hidden": 1
+        },
+        {
+            "fieldname": "after_posting_date",
+            "fieldtype": "Date",
+            "hidden": 1
+        },
+        {
+            "fieldname": "after_name",
+            "fieldtype": "Data",
+            "hidden": 1
         }
-    ]
+    ],
+    "onload": function(report) {
+        report.page.add_inner_button(__("Next Page"), function() {
+            let rows = report.data || [];
+            if (!rows.length) {
+                frappe.msgprint(__("No more trips"));
+                return;
+            }
+            let last = rows[rows.length - 1];
+            report.set_filter_value({
+                "after_driver": last.driver,
+                "after_posting_date": last.posting_date,
+                "after_name": last.trip_details
+            });
+        });
+        report.page.add_inner_button(__("First Page"), function() {
+            report.set_filter_value({
+                "after_driver": "",
+                "after_posting_date": "",
+                "after_name": ""
+            });
+        });
+
+        frappe.realtime.off("fateh_logistics_report_ready");
+        frappe.realtime.on("fateh_logistics_report_ready", function(data) {
+            if (data && data.report_name === report.report_name) {
+                report.refresh();
+            }
+        });
+    }
 };
 
 
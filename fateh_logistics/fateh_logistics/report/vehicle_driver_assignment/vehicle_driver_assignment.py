@@ -3,12 +3,33 @@
 
 import frappe
 from frappe import _
+from frappe.utils import cint
+from fateh_logistics.report_cache import get_report_result
+
+# Rows per page; the UI and get_trip_page fetch following pages by keyset cursor. Exports are not paged.
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+EXPORT_METHOD = "frappe.desk.query_report.export_query"
 
 
 def execute(filters=None):
-    columns = get_columns()
-    data = get_data(filters)
-    return columns, data
+    filters = frappe._dict(filters or {})
+    if frappe.form_dict.get("cmd") == EXPORT_METHOD:
+        # The full result, computed inline and cached apart from the paged view
+        filters.update({"export": 1, "prepare_in_background": 0})
+
+    result = get_report_result("Vehicle Driver Assignment", filters, get_columns, get_data)
+    columns, data = result[:2]
+
+    page_size = get_page_size(filters)
+    if len(result) == 2 and page_size and len(data) >= page_size:
+        return columns, data, _(
+            "Showing the first {0} trips from this position. Use Next Page for the following trips, "
+            "or export the report to get all of them."
+        ).format(page_size)
+
+    return result
 
 
 def get_columns():
@@ -50,64 +71,110 @@ def get_columns():
 
 
 def get_data(filters):
-    # Build Trip Details filter
-    trip_filter = {"docstatus": ["!=", 2]}
-    
-    # Vehicle filter
+    """
+    One page of trips ordered by (driver, posting_date desc, name desc).
+    The hidden after_* filters carry the cursor of the last row of the previous page;
+    an export returns every trip from the first one.
+    """
+    filters = frappe._dict(filters or {})
+    after = None
+    if filters.get("after_driver") and not filters.get("export"):
+        after = {
+            "driver": filters.after_driver,
+            "posting_date": filters.after_posting_date,
+            "name": filters.after_name
+        }
+
+    return get_trips(filters, get_page_size(filters), after)
+
+
+def get_page_size(filters):
+    """Rows per page of the report view, or None for an export"""
+    if filters.get("export"):
+        return None
+
+    return min(cint(filters.get("page_size")) or PAGE_SIZE, MAX_PAGE_SIZE)
+
+
+def get_trips(filters, page_size=PAGE_SIZE, after=None):
+    """Trips in report order after the cursor; all of them when `page_size` is None"""
+    # Only trips that have both vehicle and driver assigned
+    conditions = [
+        "td.docstatus != 2",
+        "IFNULL(td.vehicle, '') != ''",
+        "IFNULL(td.driver, '') != ''",
+        "td.posting_date IS NOT NULL"
+    ]
+    values = {}
+
+    if page_size:
+        values["page_size"] = min(page_size, MAX_PAGE_SIZE)
+
     if filters.get("vehicle"):
-        trip_filter["vehicle"] = filters.get("vehicle")
-    
-    # Driver filter
+        conditions.append("td.vehicle = %(vehicle)s")
+        values["vehicle"] = filters.get("vehicle")
+
     if filters.get("driver"):
-        trip_filter["driver"] = filters.get("driver")
-    
-    # Date filter - using posting_date
-    from_date = filters.get("from_date")
-    to_date = filters.get("to_date")
-    
-    if from_date and to_date:
-        trip_filter["posting_date"] = ["between", [from_date, to_date]]
-    elif from_date:
-        trip_filter["posting_date"] = [">=", from_date]
-    elif to_date:
-        trip_filter["posting_date"] = ["<=", to_date]
-    
-    # Get Trip Details - only vehicles and drivers that are assigned
-    trip_details = frappe.get_all(
-        "Trip Details",
-        filters=trip_filter,
-        fields=[
-            "name",
-            "posting_date",
-            "vehicle",
-            "driver"
-        ],
-        order_by="driver, posting_date desc, vehicle"
-    )
-    
-    data = []
-    
-    for trip in trip_details:
-        # Only include trips that have both vehicle and driver assigned
-        if not trip.vehicle or not trip.driver:
-            continue
-            
-        # Get driver name
-        driver_name = ""
-        if trip.driver:
-            try:
-                driver_doc = frappe.get_cached_doc("Driver", trip.driver)
-                driver_name = driver_doc.full_name or trip.driver
-            except:
-                driver_name = trip.driver
-        
-        data.append({
-            "driver": trip.driver,
-            "driver_name": driver_name,
-            "vehicle": trip.vehicle,
-            "posting_date": trip.posting_date,
-            "trip_details": trip.name
+        conditions.append("td.driver = %(driver)s")
+        values["driver"] = filters.get("driver")
+
+    if filters.get("from_date"):
+        conditions.append("td.posting_date >= %(from_date)s")
+        values["from_date"] = filters.get("from_date")
+
+    if filters.get("to_date"):
+        conditions.append("td.posting_date <= %(to_date)s")
+        values["to_date"] = filters.get("to_date")
+
+    # Keyset: rows strictly after the cursor in (driver asc, posting_date desc, name desc) order
+    if after:
+        conditions.append("""(
+            td.driver > %(after_driver)s
+            OR (td.driver = %(after_driver)s AND (
+                td.posting_date < %(after_posting_date)s
+                OR (td.posting_date = %(after_posting_date)s AND td.name < %(after_name)s)
+            ))
+        )""")
+        values.update({
+            "after_driver": after.get("driver"),
+            "after_posting_date": after.get("posting_date"),
+            "after_name": after.get("name")
         })
-    
-    return data
 
+    return frappe.db.sql("""
+        SELECT
+            td.driver,
+            COALESCE(NULLIF(d.full_name, ''), NULLIF(td.driver_name, ''), td.driver) AS driver_name,
+            td.vehicle,
+            td.posting_date,
+            td.name AS trip_details
+        FROM `tabTrip Details` td
+        LEFT JOIN `tabDriver` d ON d.name = td.driver
+        WHERE {conditions}
+        ORDER BY td.driver, td.posting_date DESC, td.name DESC
+        {limit}
+    """.format(
+        conditions=" AND ".join(conditions),
+        limit="LIMIT %(page_size)s" if page_size else ""
+    ), values, as_dict=True)
+
+
+@frappe.whitelist()
+def get_trip_page(filters=None, page_size=PAGE_SIZE, after=None):
+    """
+    Stream the report page by page. Pass back `next_cursor` as `after` to fetch the following page;
+    it is None once the last page has been returned.
+    """
+    frappe.has_permission("Trip Details", "read", throw=True)
+
+    filters = frappe._dict(frappe.parse_json(filters) or {})
+    after = frappe.parse_json(after) if after else None
+    page_size = min(cint(page_size) or PAGE_SIZE, MAX_PAGE_SIZE)
+
+    rows = get_trips(filters, page_size, after)
+    next_cursor = None
+    if len(rows) == page_size:
+        last = rows[-1]
+        next_cursor = {"driver": last.driver, "posting_date": str(last.posting_date), "name": last.trip_details}
+
+    return {"rows": rows, "next_cursor": next_cursor}
@@ -28,8 +28,22 @@ frappe.query_reports["Vehicle PL Report"] = {
             "fieldtype": "Date",
             "default": frappe.datetime.get_today(),
             "reqd": 1
+        },
+        {
+            "fieldname": "prepare_in_background",
+            "label": __("Prepare in Background"),
+            "fieldtype": "Check",
+            "default": 0
         }
     ],
+    "onload": function(report) {
+        frappe.realtime.off("fateh_logistics_report_ready");
+        frappe.realtime.on("fateh_logistics_report_ready", function(data) {
+            if (data && data.report_name === report.report_name) {
+                report.refresh();
+            }
+        });
+    },
     "formatter": function(value, row, column, data, default_formatter) {
         value = default_formatter(value, row, column, data);
         
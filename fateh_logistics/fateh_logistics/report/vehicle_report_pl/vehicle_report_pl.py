@@ -3,12 +3,16 @@
 
 import frappe
 from frappe import _
+from frappe.utils import create_batch
+from fateh_logistics.vehicle_pl import get_vehicle_totals
+from fateh_logistics.report_cache import get_report_result
+
+# Upper bound on vehicles per statement when looking up debits
+VEHICLE_CHUNK_SIZE = 500
 
 
 def execute(filters=None):
-    columns = get_columns()
-    data = get_data(filters)
-    return columns, data
+    return get_report_result("Vehicle Report PL", filters, get_columns, get_data)
 
 
 def get_columns():
@@ -97,101 +101,26 @@ def get_data(filters):
     driver_filter     = parse_multivalue(filters.get("driver")) 
     job_record_filter = parse_multivalue(filters.get("job_record"))
 
-   
-    jr_filters = {"docstatus": ["<", 2]}
-    if from_date and to_date:
-        jr_filters["date"] = ["between", [from_date, to_date]]
-    elif from_date:
-        jr_filters["date"] = [">=", from_date]
-    elif to_date:
-        jr_filters["date"] = ["<=", to_date]
-
-    if job_record_filter:
-        jr_filters["name"] = job_record_filter[0] if len(job_record_filter) == 1 else ["in", job_record_filter]
-
-    job_records = frappe.get_all("Job Record", filters=jr_filters, fields=["name", "date"])
-    if not job_records:
-        return []
-
-    jr_names = [jr.name for jr in job_records]
-    jr_date_map = {jr.name: jr.date for jr in job_records}
-
-    #Job Assignments
-    ja_filters = {"parent": ["in", jr_names], "parenttype": "Job Record"}
-
-    if vehicle_filter:
-        ja_filters["vehicle"] = vehicle_filter[0] if len(vehicle_filter) == 1 else ["in", vehicle_filter]
-
-    if driver_filter:
-        ja_filters["driver"] = driver_filter[0] if len(driver_filter) == 1 else ["in", driver_filter]
-
-    job_assignments = frappe.get_all(
-        "Job Assignment",
-        filters=ja_filters,
-        fields=["parent", "vehicle", "driver", "driver_name", "driver_type", "trip_amount"]
-    )
+    #Job Assignments joined to their Job Record date - no intermediate name lists
+    job_assignments = get_job_assignments(from_date, to_date, vehicle_filter, driver_filter, job_record_filter)
     if not job_assignments:
         return []
 
-    vehicles_in_report = list({ja.get("vehicle") for ja in job_assignments if ja.get("vehicle")})
+    vehicles_in_report = sorted({ja.get("vehicle") for ja in job_assignments if ja.get("vehicle")})
 
-    #Purchase Invoice debit per vehicle
+    #Purchase Invoice debit per vehicle, pre-summed in the Vehicle Daily PL rollup
     pi_debit_map = {}
-    pi_date_filter = {"docstatus": 1}
-    if from_date and to_date:
-        pi_date_filter["posting_date"] = ["between", [from_date, to_date]]
-    elif from_date:
-        pi_date_filter["posting_date"] = [">=", from_date]
-    elif to_date:
-        pi_date_filter["posting_date"] = ["<=", to_date]
-
-    pi_list = frappe.get_all("Purchase Invoice", filters=pi_date_filter, fields=["name"])
-    if pi_list:
-        pi_names = [p.name for p in pi_list]
-        pi_items = frappe.get_all(
-            "Purchase Invoice Item",
-            filters={
-                "parent": ["in", pi_names],
-                "parenttype": "Purchase Invoice",
-                "vehicle": ["in", vehicles_in_report]
-            },
-            fields=["vehicle", "base_amount", "amount"]
-        )
-        for item in pi_items:
-            v = item.vehicle
-            pi_debit_map[v] = pi_debit_map.get(v, 0) + (item.base_amount or item.amount or 0)
-
     #Journal Entry detail per vehicle
     je_detail_map = {}
     je_used_vehicles = set()
 
-    je_date_filter = {"docstatus": 1}
-    if from_date and to_date:
-        je_date_filter["posting_date"] = ["between", [from_date, to_date]]
-    elif from_date:
-        je_date_filter["posting_date"] = [">=", from_date]
-    elif to_date:
-        je_date_filter["posting_date"] = ["<=", to_date]
+    # Vehicles are looked up in bounded chunks so statement size stays flat as the fleet grows
+    for vehicles in create_batch(vehicles_in_report, VEHICLE_CHUNK_SIZE):
+        vehicle_totals = get_vehicle_totals(from_date, to_date, {"vehicles": vehicles})
+        for v, totals in vehicle_totals.items():
+            pi_debit_map[v] = totals.total_purchase
 
-    je_list = frappe.get_all("Journal Entry", filters=je_date_filter, fields=["name"])
-    if je_list:
-        je_names = [j.name for j in je_list]
-        je_names_fmt   = ", ".join(frappe.db.escape(n) for n in je_names)
-        vehicles_fmt   = ", ".join(frappe.db.escape(v) for v in vehicles_in_report)
-        je_accounts = frappe.db.sql("""
-            SELECT
-                parent,
-                vehicle,
-                account,
-                debit,
-                debit_in_account_currency
-            FROM `tabJournal Entry Account`
-            WHERE
-                parenttype = 'Journal Entry'
-                AND parent IN ({je_names})
-                AND vehicle IN ({vehicles})
-        """.format(je_names=je_names_fmt, vehicles=vehicles_fmt), as_dict=True)
-        for acc in je_accounts:
+        for acc in get_journal_entry_accounts(from_date, to_date, vehicles):
             v = acc.vehicle
             debit_amt = acc.debit or acc.debit_in_account_currency or 0
             if debit_amt <= 0:
@@ -210,10 +139,7 @@ def get_data(filters):
         v = ja.get("vehicle") or ""
         vehicle_total_credit_map[v] = vehicle_total_credit_map.get(v, 0) + (ja.get("trip_amount") or 0)
 
-    #Build report rows
-   
-    job_assignments = sorted(job_assignments, key=lambda x: (x.get('vehicle') or '', jr_date_map.get(x.get('parent'), '')))
-
+    #Build report rows (job_assignments are already ordered by vehicle and job date)
     data = []
     vehicle_first_row = set()
 
@@ -280,3 +206,68 @@ def get_data(filters):
             })
 
     return data
+
+
+def get_job_assignments(from_date, to_date, vehicles=None, drivers=None, job_records=None):
+    conditions = ["ja.parenttype = 'Job Record'", "jr.docstatus < 2"]
+    values = {}
+
+    if from_date:
+        conditions.append("jr.date >= %(from_date)s")
+        values["from_date"] = from_date
+    if to_date:
+        conditions.append("jr.date <= %(to_date)s")
+        values["to_date"] = to_date
+    if job_records:
+        conditions.append("jr.name IN %(job_records)s")
+        values["job_records"] = tuple(job_records)
+    if vehicles:
+        conditions.append("ja.vehicle IN %(vehicles)s")
+        values["vehicles"] = tuple(vehicles)
+    if drivers:
+        conditions.append("ja.driver IN %(drivers)s")
+        values["drivers"] = tuple(drivers)
+
+    return frappe.db.sql("""
+        SELECT
+            ja.parent,
+            ja.vehicle,
+            ja.driver,
+            ja.driver_name,
+            ja.driver_type,
+            ja.trip_amount
+        FROM `tabJob Assignment` ja
+        JOIN `tabJob Record` jr ON jr.name = ja.parent
+        WHERE {conditions}
+        ORDER BY IFNULL(ja.vehicle, ''), jr.date, ja.parent, ja.idx
+    """.format(conditions=" AND ".join(conditions)), values, as_dict=True)
+
+
+def get_journal_entry_accounts(from_date, to_date, vehicles):
+    """Journal Entry Account rows for the given vehicles, dated by the parent Journal Entry"""
+    conditions = [
+        "jea.parenttype = 'Journal Entry'",
+        "je.docstatus = 1",
+        "jea.custom_vehicle IN %(vehicles)s"
+    ]
+    values = {"vehicles": tuple(vehicles)}
+
+    if from_date:
+        conditions.append("je.posting_date >= %(from_date)s")
+        values["from_date"] = from_date
+    if to_date:
+        conditions.append("je.posting_date <= %(to_date)s")
+        values["to_date"] = to_date
+
+    return frappe.db.sql("""
+        SELECT
+            jea.parent,
+            jea.custom_vehicle AS vehicle,
+            jea.account,
+            jea.debit,
+            jea.debit_in_account_currency
+        FROM `tabJournal Entry Account` jea
+        JOIN `tabJournal Entry` je ON je.name = jea.parent
+        WHERE {conditions}
+        ORDER BY je.posting_date, jea.parent, jea.idx
+    """.format(conditions=" AND ".join(conditions)), values, as_dict=True)
@@ -29,7 +29,8 @@ app_license = "mit"
 app_include_js = [
     "assets/fateh_logistics/js/driver_quick_entry.js",
     "assets/fateh_logistics/js/vehicle_quick_entry.js",
-    "assets/fateh_logistics/js/general_ledger_override.js"
+    "assets/fateh_logistics/js/general_ledger_override.js",
+    "assets/fateh_logistics/js/job_reference_search.js"
 ]
 
 # include js, css files in header of web template
@@ -54,7 +55,10 @@ doctype_js = {
     "Vehicle": "public/js/vehicle.js",
     "Driver": "public/js/driver.js"
 }
-# doctype_list_js = {"doctype" : "public/js/doctype_list.js"}
+doctype_list_js = {
+    "Driver": "public/js/driver_list.js",
+    "Trip Details": "public/js/trip_details_list.js"
+}
 # doctype_tree_js = {"doctype" : "public/js/doctype_tree.js"}
 # doctype_calendar_js = {"doctype" : "public/js/doctype_calendar.js"}
 
@@ -150,59 +154,169 @@ override_doctype_class = {
 doc_events = {
 	"Expense Request": {
 		"on_update": "fateh_logistics.api.setup"
+	},
+	"Expense Entry": {
+		"on_submit": "fateh_logistics.job_financials.invalidate_job_financial_summary",
+		"on_cancel": "fateh_logistics.job_financials.invalidate_job_financial_summary",
+		"on_update_after_submit": "fateh_logistics.job_financials.invalidate_job_financial_summary"
+	},
+	"Purchase Order": {
+		"on_submit": [
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent"
+		],
+		"on_cancel": [
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent"
+		]
+	},
+	"Purchase Invoice": {
+		"on_submit": [
+			"fateh_logistics.vehicle_pl.update_vehicle_daily_pl",
+			"fateh_logistics.report_cache.invalidate_report_cache",
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.item_rates.update_latest_purchase_rates",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		],
+		"on_cancel": [
+			"fateh_logistics.vehicle_pl.update_vehicle_daily_pl",
+			"fateh_logistics.report_cache.invalidate_report_cache",
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.item_rates.update_latest_purchase_rates",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		]
+	},
+	"Purchase Receipt": {
+		"on_submit": [
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		],
+		"on_cancel": [
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		]
+	},
+	"Sales Order": {
+		"on_submit": [
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent"
+		],
+		"on_cancel": [
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent"
+		]
+	},
+	"Sales Invoice": {
+		"on_submit": [
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		],
+		"on_cancel": [
+			"fateh_logistics.job_fulfilment.update_job_fulfilment",
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		]
+	},
+	"Delivery Note": {
+		"on_submit": [
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		],
+		"on_cancel": [
+			"fateh_logistics.po_hooks.update_job_record_percent",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		]
+	},
+	"Quotation": {
+		"on_submit": "fateh_logistics.job_fulfilment.update_job_fulfilment",
+		"on_cancel": "fateh_logistics.job_fulfilment.update_job_fulfilment"
+	},
+	"Journal Entry": {
+		"on_submit": [
+			"fateh_logistics.vehicle_pl.update_vehicle_daily_pl",
+			"fateh_logistics.report_cache.invalidate_report_cache",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		],
+		"on_cancel": [
+			"fateh_logistics.vehicle_pl.update_vehicle_daily_pl",
+			"fateh_logistics.report_cache.invalidate_report_cache",
+			"fateh_logistics.job_financials.invalidate_job_financial_summary"
+		]
+	},
+	"Payment Entry": {
+		"on_submit": "fateh_logistics.job_financials.invalidate_job_financial_summary",
+		"on_cancel": "fateh_logistics.job_financials.invalidate_job_financial_summary"
+	},
+	"Job Record": {
+		"on_update": [
+			"fateh_logistics.vehicle_pl.update_vehicle_daily_pl",
+			"fateh_logistics.report_cache.invalidate_report_cache",
+			"fateh_logistics.job_financials.sync_job_financial_summary",
+			"fateh_logistics.job_references.update_job_reference_index"
+		],
+		"on_trash": [
+			"fateh_logistics.vehicle_pl.update_vehicle_daily_pl",
+			"fateh_logistics.report_cache.invalidate_report_cache",
+			"fateh_logistics.job_financials.sync_job_financial_summary",
+			"fateh_logistics.job_references.update_job_reference_index"
+		],
+		"after_rename": [
+			"fateh_logistics.job_references.rename_job_reference_index",
+			"fateh_logistics.job_financials.rename_job_financial_summary"
+		]
+	},
+	"Warehouse Job Record": {
+		"on_update": "fateh_logistics.job_references.update_job_reference_index",
+		"on_trash": "fateh_logistics.job_references.update_job_reference_index",
+		"after_rename": "fateh_logistics.job_references.rename_job_reference_index"
+	},
+	"Trip Details": {
+		"on_update": "fateh_logistics.report_cache.invalidate_report_cache",
+		"on_trash": "fateh_logistics.report_cache.invalidate_report_cache"
+	},
+	"Item Tax Template": {
+		"on_update": "fateh_logistics.job_invoicing.clear_tax_template_cache",
+		"on_trash": "fateh_logistics.job_invoicing.clear_tax_template_cache",
+		"after_rename": "fateh_logistics.job_invoicing.clear_tax_template_cache"
+	},
+	"Account": {
+		"on_update": "fateh_logistics.job_invoicing.clear_tax_template_search_cache",
+		"on_trash": "fateh_logistics.job_invoicing.clear_tax_template_search_cache",
+		"after_rename": "fateh_logistics.job_invoicing.clear_tax_template_search_cache"
+	},
+	"Driver": {
+		"on_update": "fateh_logistics.driver_search.update_driver_search_index",
+		"on_trash": "fateh_logistics.driver_search.update_driver_search_index",
+		"after_rename": "fateh_logistics.driver_search.rename_driver_search_tokens"
+	},
+	"Stock Ledger Entry": {
+		"after_insert": "fateh_logistics.item_rates.update_latest_valuation_rate"
+	},
+	"Additional Salary": {
+		"on_submit": "fateh_logistics.driver_allowance.post_additional_salary",
+		"on_cancel": "fateh_logistics.driver_allowance.post_additional_salary"
 	}
-    # "Purchase Order": {
-    #     "on_submit": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_cancel": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_amend": "fateh_logistics.po_hooks.update_job_record_percent"
-    # },
-    # "Purchase Invoice": {
-    #     "on_submit": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_cancel": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_amend": "fateh_logistics.po_hooks.update_job_record_percent"
-    # },
-    # "Purchase Receipt": {
-    #     "on_submit": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_cancel": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_amend": "fateh_logistics.po_hooks.update_job_record_percent"
-    # },
-    # "Sales Order": {
-    #     "on_submit": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_cancel": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_amend": "fateh_logistics.po_hooks.update_job_record_percent"
-    # },
-    # "Sales Invoice": {
-    #     "on_submit": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_cancel": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_amend": "fateh_logistics.po_hooks.update_job_record_percent"
-    # },
-    # "Delivery Note": {
-    #     "on_submit": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_cancel": "fateh_logistics.po_hooks.update_job_record_percent",
-    #     "on_amend": "fateh_logistics.po_hooks.update_job_record_percent"
-    # }
 }
 
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-# 	"all": [
-# 		"fateh_logistics.tasks.all"
-# 	],
-# 	"daily": [
-# 		"fateh_logistics.tasks.daily"
-# 	],
-# 	"hourly": [
-# 		"fateh_logistics.tasks.hourly"
-# 	],
-# 	"weekly": [
-# 		"fateh_logistics.tasks.weekly"
-# 	],
-# 	"monthly": [
-# 		"fateh_logistics.tasks.monthly"
-# 	],
-# }
+scheduler_events = {
+	"cron": {
+		"* * * * *": [
+			"fateh_logistics.coalesce.flush_dirty_keys"
+		],
+		"0 1-5 * * *": [
+			"fateh_logistics.voucher_sync.resync_voucher_totals"
+		]
+	},
+	"daily_long": [
+		"fateh_logistics.item_rates.refresh_latest_valuation_rates"
+	]
+}
 
 # Testing
 # -------
@@ -230,7 +344,10 @@ override_doctype_dashboards = {
 # Ignore links to specified DocTypes when deleting documents
 # -----------------------------------------------------------
 
-# ignore_links_on_delete = ["Communication", "ToDo"]
+ignore_links_on_delete = [
+    "Driver Allowance Ledger Entry", "Trip Booking Interval", "Item Latest Rate", "Job Financial Summary",
+    "Driver Search Token", "Job Reference Index"
+]
 
 # Request Events
 # ----------------
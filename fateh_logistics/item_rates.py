@@ -0,0 +1,302 @@
+"""
+Latest item rate index.
+
+`Item Latest Rate` holds, per item, the rate of the latest submitted Purchase
+Invoice and the valuation rate of the latest Stock Ledger Entry (with the
+company and warehouse it was posted in). Purchase Invoice submit moves a row
+forward only when the new posting is later than the stored one; cancelling
+the invoice behind a stored rate re-reads the previous rate from history.
+Stock Ledger Entry inserts, cancellations included, queue a coalesced reload
+of the item's valuation from the committed ledger, since an entry's rate is
+only final after its voucher is reposted. The reload reads only the item's
+newest non-cancelled entry and, like purchase rates, only moves the row
+forward unless the stored entry has been cancelled. The daily refresh
+reloads only items whose ledger entries changed or were reposted since its
+last run. Valuation on Job Record and quoting screens read one indexed row
+per item instead of scanning the ledgers.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import create_batch, flt, get_datetime, getdate, now, now_datetime
+
+from fateh_logistics.coalesce import mark_dirty
+
+# Source -> columns written for it, sort key columns last
+RATE_COLUMNS = {
+    "purchase": ["purchase_rate", "purchase_invoice", "purchase_date", "purchase_creation"],
+    "valuation": [
+        "valuation_rate", "stock_ledger_entry", "company", "warehouse",
+        "valuation_posting_datetime", "valuation_creation"
+    ],
+}
+
+# Job Record `get_valuation_rate_from` option -> rate column
+VALUATION_SOURCES = {
+    "Latest Purchase": "purchase_rate",
+    "Stock Ledger": "valuation_rate",
+}
+
+UPSERT_CHUNK_SIZE = 500
+
+
+def update_latest_purchase_rates(doc, method=None):
+    """doc_events handler on Purchase Invoice submit/cancel"""
+    item_codes = {row.item_code for row in doc.get("items") or [] if row.item_code}
+    if not item_codes:
+        return
+
+    if method == "on_cancel":
+        stale = frappe.get_all(
+            "Item Latest Rate",
+            filters={"name": ["in", list(item_codes)], "purchase_invoice": doc.name},
+            pluck="name"
+        )
+        if stale:
+            refresh_item_latest_rates(stale, ["purchase"])
+        return
+
+    values = {}
+    for row in doc.items:
+        if row.item_code:
+            values[row.item_code] = {
+                "purchase_rate": flt(row.rate),
+                "purchase_invoice": doc.name,
+                "purchase_date": getdate(doc.posting_date),
+                "purchase_creation": get_datetime(doc.creation),
+            }
+
+    apply_latest_rates("purchase", values)
+
+
+def update_latest_valuation_rate(doc, method=None):
+    """
+    doc_events handler on Stock Ledger Entry insert. The entry's valuation rate
+    is only computed by the repost after insert, so the item is reloaded from
+    the committed ledger by a coalesced job instead of trusting the document.
+    """
+    if doc.item_code:
+        mark_dirty("item_valuation_rate", doc.item_code)
+
+
+def update_item_valuation_rate(item_code):
+    """Coalesced job: move the item's valuation columns to its newest non-cancelled entry"""
+    latest = frappe.db.sql("""
+        SELECT valuation_rate, name AS stock_ledger_entry, company, warehouse,
+            TIMESTAMP(posting_date, posting_time) AS valuation_posting_datetime,
+            creation AS valuation_creation
+        FROM `tabStock Ledger Entry`
+        WHERE item_code = %(item_code)s AND is_cancelled = 0 AND valuation_rate IS NOT NULL
+        ORDER BY posting_date DESC, posting_time DESC, creation DESC
+        LIMIT 1
+    """, {"item_code": item_code}, as_dict=True)
+
+    if not latest:
+        # Every entry of the item is cancelled: clear its valuation
+        refresh_item_latest_rates([item_code], ["valuation"])
+        return
+
+    latest = latest[0]
+    ensure_rate_rows([item_code])
+
+    current = frappe.db.sql("""
+        SELECT rate.valuation_posting_datetime, rate.valuation_creation, IFNULL(sle.is_cancelled, 1) AS is_cancelled
+        FROM `tabItem Latest Rate` rate
+        LEFT JOIN `tabStock Ledger Entry` sle ON sle.name = rate.stock_ledger_entry
+        WHERE rate.name = %(item_code)s
+        FOR UPDATE
+    """, {"item_code": item_code}, as_dict=True)[0]
+
+    # A cancelled stored entry is replaced even by an earlier posting
+    if current.valuation_posting_datetime and not current.is_cancelled and (
+        get_datetime(current.valuation_posting_datetime), get_datetime(current.valuation_creation)
+    ) > (get_datetime(latest.valuation_posting_datetime), get_datetime(latest.valuation_creation)):
+        return
+
+    frappe.db.set_value("Item Latest Rate", item_code, latest)
+
+
+def apply_latest_rates(source, values):
+    """Write `values` ({item_code: columns}) for items whose stored posting is not later than the new one"""
+    ensure_rate_rows(list(values))
+
+    date_column, creation_column = RATE_COLUMNS[source][-2:]
+    current = frappe.db.sql("""
+        SELECT name, {date_column}, {creation_column}
+        FROM `tabItem Latest Rate`
+        WHERE name IN %(item_codes)s
+        FOR UPDATE
+    """.format(date_column=date_column, creation_column=creation_column),
+        {"item_codes": tuple(values)}, as_dict=True)
+
+    for row in current:
+        new = values[row.name]
+        if row[date_column] and (
+            get_datetime(row[date_column]), get_datetime(row[creation_column])
+        ) > (get_datetime(new[date_column]), get_datetime(new[creation_column])):
+            continue
+
+        frappe.db.set_value("Item Latest Rate", row.name, new)
+
+
+def ensure_rate_rows(item_codes):
+    timestamp = now()
+    user = frappe.session.user
+
+    for batch in create_batch(item_codes, UPSERT_CHUNK_SIZE):
+        frappe.db.sql("""
+            INSERT IGNORE INTO `tabItem Latest Rate`
+                (name, creation, modified, owner, modified_by, item_code)
+            VALUES {rows}
+        """.format(rows=", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))),
+            [v for item_code in batch for v in (item_code, timestamp, timestamp, user, user, item_code)])
+
+
+def get_latest_purchase_history(item_codes=None):
+    condition = "AND pi_item.item_code IN %(item_codes)s" if item_codes else ""
+
+    return frappe.db.sql("""
+        SELECT item_code, rate AS purchase_rate, parent AS purchase_invoice,
+            posting_date AS purchase_date, creation AS purchase_creation
+        FROM (
+            SELECT pi_item.item_code, pi_item.rate, pi_item.parent, pi.posting_date, pi.creation,
+                ROW_NUMBER() OVER (
+                    PARTITION BY pi_item.item_code
+                    ORDER BY pi.posting_date DESC, pi.creation DESC, pi_item.idx DESC
+                ) AS row_no
+            FROM `tabPurchase Invoice Item` pi_item
+            JOIN `tabPurchase Invoice` pi ON pi.name = pi_item.parent
+            WHERE pi.docstatus = 1 AND IFNULL(pi_item.item_code, '') != '' {condition}
+        ) latest
+        WHERE row_no = 1
+    """.format(condition=condition), {"item_codes": tuple(item_codes or ())}, as_dict=True)
+
+
+def get_latest_valuation_history(item_codes=None):
+    condition = "AND item_code IN %(item_codes)s" if item_codes else ""
+
+    return frappe.db.sql("""
+        SELECT item_code, valuation_rate, name AS stock_ledger_entry, company, warehouse,
+            TIMESTAMP(posting_date, posting_time) AS valuation_posting_datetime,
+            creation AS valuation_creation
+        FROM (
+            SELECT name, item_code, valuation_rate, company, warehouse, posting_date, posting_time, creation,
+                ROW_NUMBER() OVER (
+                    PARTITION BY item_code
+                    ORDER BY posting_date DESC, posting_time DESC, creation DESC
+                ) AS row_no
+            FROM `tabStock Ledger Entry`
+            WHERE is_cancelled = 0 AND valuation_rate IS NOT NULL {condition}
+        ) latest
+        WHERE row_no = 1
+    """.format(condition=condition), {"item_codes": tuple(item_codes or ())}, as_dict=True)
+
+
+HISTORY_QUERIES = {
+    "purchase": get_latest_purchase_history,
+    "valuation": get_latest_valuation_history,
+}
+
+
+def refresh_item_latest_rates(item_codes=None, sources=None):
+    """Reset the given sources for the items (all items when None) and reload them from history"""
+    timestamp = now()
+    user = frappe.session.user
+
+    for source in sources or list(RATE_COLUMNS):
+        columns = RATE_COLUMNS[source]
+
+        condition = "WHERE name IN %(item_codes)s" if item_codes else ""
+        frappe.db.sql("""
+            UPDATE `tabItem Latest Rate`
+            SET {reset}
+            {condition}
+        """.format(
+            reset=", ".join(f"{column} = {'0' if column.endswith('_rate') else 'NULL'}" for column in columns),
+            condition=condition
+        ), {"item_codes": tuple(item_codes or ())})
+
+        for batch in create_batch(HISTORY_QUERIES[source](item_codes), UPSERT_CHUNK_SIZE):
+            frappe.db.sql("""
+                INSERT INTO `tabItem Latest Rate`
+                    (name, creation, modified, owner, modified_by, item_code, {columns})
+                VALUES {rows}
+                ON DUPLICATE KEY UPDATE {updates}, modified = VALUES(modified)
+            """.format(
+                columns=", ".join(columns),
+                rows=", ".join(["({0})".format(", ".join(["%s"] * (len(columns) + 6)))] * len(batch)),
+                updates=", ".join(f"{column} = VALUES({column})" for column in columns)
+            ), [
+                v for row in batch
+                for v in [row.item_code, timestamp, timestamp, user, user, row.item_code] + [row[c] for c in columns]
+            ])
+
+
+@frappe.whitelist()
+def rebuild_item_latest_rates(item_codes=None):
+    """Rebuild the index from Purchase Invoice and Stock Ledger history, for the given items or all of them"""
+    frappe.only_for("System Manager")
+
+    item_codes = frappe.parse_json(item_codes) if isinstance(item_codes, str) else item_codes
+    refresh_item_latest_rates(item_codes or None)
+
+    return {"status": "success", "message": _("Item Latest Rate rebuilt")}
+
+
+def refresh_latest_valuation_rates():
+    """Scheduler: reposting rewrites valuation rates of existing entries without document events"""
+    last_run = frappe.db.get_single_value("Fateh Logistics Settings", "valuation_refresh_last_run")
+    started = now_datetime()
+
+    if not last_run:
+        refresh_item_latest_rates(sources=["valuation"])
+    else:
+        item_codes = get_revalued_items(last_run)
+        for batch in create_batch(item_codes, UPSERT_CHUNK_SIZE):
+            refresh_item_latest_rates(batch, ["valuation"])
+
+    frappe.db.set_single_value("Fateh Logistics Settings", "valuation_refresh_last_run", started)
+
+
+def get_revalued_items(since):
+    """Items with ledger entries modified, or reposts completed, since `since`"""
+    return frappe.db.sql_list("""
+        SELECT DISTINCT item_code
+        FROM `tabStock Ledger Entry`
+        WHERE modified >= %(since)s
+        UNION
+        SELECT riv.item_code
+        FROM `tabRepost Item Valuation` riv
+        WHERE riv.modified >= %(since)s AND riv.status = 'Completed' AND IFNULL(riv.item_code, '') != ''
+        UNION
+        SELECT sle.item_code
+        FROM `tabRepost Item Valuation` riv
+        JOIN `tabStock Ledger Entry` sle ON sle.voucher_type = riv.voucher_type AND sle.voucher_no = riv.voucher_no
+        WHERE riv.modified >= %(since)s AND riv.status = 'Completed' AND riv.based_on = 'Transaction'
+    """, {"since": since})
+
+
+def get_latest_rates(item_codes, rate_column):
+    """{item_code: rate} from the index for one rate column"""
+    if not item_codes:
+        return {}
+
+    return dict(frappe.db.sql("""
+        SELECT name, {rate_column}
+        FROM `tabItem Latest Rate`
+        WHERE name IN %(item_codes)s
+    """.format(rate_column=rate_column), {"item_codes": tuple(item_codes)}))
+
+
+@frappe.whitelist()
+def get_item_latest_rates(item_codes, source="Latest Purchase"):
+    """Latest purchase or stock valuation rate per item, for quoting and costing screens"""
+    frappe.has_permission("Item", "read", throw=True)
+
+    if source not in VALUATION_SOURCES:
+        frappe.throw(_("Unknown rate source {0}").format(source))
+
+    item_codes = frappe.parse_json(item_codes) if isinstance(item_codes, str) else item_codes
+    rates = get_latest_rates(set(item_codes or []), VALUATION_SOURCES[source])
+
+    return {item_code: flt(rates.get(item_code)) for item_code in item_codes or []}
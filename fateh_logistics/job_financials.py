@@ -0,0 +1,306 @@
+"""
+Job Record financials.
+
+The Job Record dashboard (form indicators and the warehouse quantity cards)
+reads one summary built from a single UNION ALL of grouped queries over the
+vouchers linked through `custom_job_record`. The summary is cached per Job
+Record and dropped when any of those vouchers is submitted or cancelled.
+
+Purchase Invoices without a Job Record on the header (consolidated
+transporter invoices) are attributed per line through the item's
+`custom_job_record`: each job gets its lines' net amount and the same share
+of the invoice's grand total and outstanding amount.
+
+`Job Financial Summary` materializes the ledger side (sales, purchase, journal
+entry debit, outstanding receivable/payable) with one row per Job Record for
+the financial query reports. Invoice, Journal Entry and Payment Entry events
+queue a coalesced refresh of the affected rows; the reports filter on the
+indexed job date instead of aggregating the full voucher history.
+"""
+
+from functools import partial
+
+import frappe
+from frappe import _
+from frappe.utils import create_batch, flt, now
+
+from fateh_logistics.coalesce import mark_dirty
+
+CACHE_KEY = "fateh_logistics:job_financial_summary"
+
+# Safety net for changes that bypass document events
+CACHE_TTL = 6 * 60 * 60
+
+# Vouchers whose submit/cancel invalidates the summary
+SUMMARY_DOCTYPES = (
+    "Sales Invoice", "Purchase Invoice", "Journal Entry",
+    "Expense Entry", "Purchase Receipt", "Delivery Note"
+)
+
+# Vouchers that change the Job Financial Summary table, directly or through the invoices they settle
+LEDGER_DOCTYPES = ("Sales Invoice", "Purchase Invoice", "Journal Entry", "Payment Entry")
+
+SUMMARY_COLUMNS = [
+    "job_date", "company",
+    "sales_total", "sales_grand_total", "sales_outstanding",
+    "purchase_total", "purchase_grand_total", "purchase_outstanding",
+    "journal_entry_debit", "profit_and_loss"
+]
+
+UPSERT_CHUNK_SIZE = 500
+
+
+@frappe.whitelist()
+def get_job_financial_summary(job_record):
+    """Sales, purchase, journal entry, expense and received/delivered quantity totals of a Job Record"""
+    frappe.has_permission("Job Record", "read", job_record, throw=True)
+
+    key = get_cache_key(job_record)
+    summary = frappe.cache().get_value(key)
+    if summary is None:
+        summary = build_job_financial_summary(job_record)
+        frappe.cache().set_value(key, summary, expires_in_sec=CACHE_TTL)
+
+    return summary
+
+
+def build_job_financial_summary(job_record):
+    totals = frappe.db.sql("""
+        SELECT 'sales' AS source, SUM(base_grand_total) AS grand_total, SUM(base_total) AS net_total
+        FROM `tabSales Invoice`
+        WHERE custom_job_record = %(job_record)s AND docstatus = 1
+        UNION ALL
+        SELECT 'purchase', SUM(base_grand_total), SUM(base_total)
+        FROM `tabPurchase Invoice`
+        WHERE custom_job_record = %(job_record)s AND docstatus = 1
+        UNION ALL
+        SELECT 'purchase_lines',
+            SUM(pii.base_amount * pi.base_grand_total / pi.base_total), SUM(pii.base_amount)
+        FROM `tabPurchase Invoice Item` pii
+        JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent
+        WHERE pii.custom_job_record = %(job_record)s AND pi.docstatus = 1
+            AND IFNULL(pi.custom_job_record, '') = '' AND pi.base_total != 0
+        UNION ALL
+        SELECT 'journal_entry', SUM(total_debit), SUM(total_debit)
+        FROM `tabJournal Entry`
+        WHERE custom_job_record = %(job_record)s AND docstatus = 1
+        UNION ALL
+        SELECT 'expenses', SUM(total), SUM(total)
+        FROM `tabExpense Entry`
+        WHERE custom_job_record = %(job_record)s AND docstatus = 1 AND status = 'Approved'
+        UNION ALL
+        SELECT 'received_qty', SUM(total_qty), SUM(total_qty)
+        FROM `tabPurchase Receipt`
+        WHERE custom_job_record = %(job_record)s AND docstatus = 1
+        UNION ALL
+        SELECT 'delivered_qty', SUM(total_qty), SUM(total_qty)
+        FROM `tabDelivery Note`
+        WHERE custom_job_record = %(job_record)s AND docstatus = 1
+    """, {"job_record": job_record}, as_dict=True)
+
+    totals = {row.source: row for row in totals}
+
+    return {
+        "sales": flt(totals["sales"].grand_total),
+        "sales_net": flt(totals["sales"].net_total),
+        "purchase": flt(totals["purchase"].grand_total) + flt(totals["purchase_lines"].grand_total),
+        "purchase_net": flt(totals["purchase"].net_total) + flt(totals["purchase_lines"].net_total),
+        "journal_entries": flt(totals["journal_entry"].grand_total),
+        "expenses": flt(totals["expenses"].grand_total),
+        "received_qty": flt(totals["received_qty"].grand_total),
+        "delivered_qty": flt(totals["delivered_qty"].grand_total),
+    }
+
+
+def invalidate_job_financial_summary(doc, method=None):
+    """doc_events handler: drop the cached dashboard and queue a summary refresh for the affected Job Records"""
+    for job_record in get_affected_job_records(doc):
+        frappe.db.after_commit.add(partial(clear_job_financial_summary, job_record))
+        if doc.doctype in LEDGER_DOCTYPES:
+            mark_dirty("job_financial_summary", job_record)
+
+
+def get_affected_job_records(doc):
+    job_records = set()
+    if doc.doctype in SUMMARY_DOCTYPES and doc.get("custom_job_record"):
+        job_records.add(doc.custom_job_record)
+    elif doc.doctype == "Purchase Invoice":
+        job_records.update(row.custom_job_record for row in doc.get("items") or [] if row.get("custom_job_record"))
+
+    # Payments, journal entries and returns change the outstanding amount of the invoices they reference
+    if doc.doctype == "Payment Entry":
+        references = [(row.reference_doctype, row.reference_name) for row in doc.get("references") or []]
+    elif doc.doctype == "Journal Entry":
+        references = [(row.reference_type, row.reference_name) for row in doc.get("accounts") or []]
+    elif doc.get("return_against"):
+        references = [(doc.doctype, doc.return_against)]
+    else:
+        references = []
+
+    invoices = {}
+    for reference_doctype, reference_name in references:
+        if reference_doctype in ("Sales Invoice", "Purchase Invoice") and reference_name:
+            invoices.setdefault(reference_doctype, set()).add(reference_name)
+
+    for reference_doctype, names in invoices.items():
+        job_records.update(frappe.get_all(
+            reference_doctype,
+            filters={"name": ["in", list(names)], "custom_job_record": ["is", "set"]},
+            pluck="custom_job_record"
+        ))
+        if reference_doctype == "Purchase Invoice":
+            job_records.update(get_line_job_records(names))
+
+    return job_records
+
+
+def get_line_job_records(purchase_invoices):
+    """Job Records of the lines of Purchase Invoices that have no Job Record on the header"""
+    return frappe.db.sql_list("""
+        SELECT DISTINCT pii.custom_job_record
+        FROM `tabPurchase Invoice Item` pii
+        JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent
+        WHERE pii.parent IN %(invoices)s
+            AND IFNULL(pii.custom_job_record, '') != '' AND IFNULL(pi.custom_job_record, '') = ''
+    """, {"invoices": tuple(purchase_invoices)})
+
+
+def sync_job_financial_summary(doc, method=None):
+    """doc_events handler on Job Record: keep the summary row's date and company, drop it with the job"""
+    if method == "on_trash":
+        frappe.db.delete("Job Financial Summary", {"job_record": doc.name})
+        return
+
+    if doc.has_value_changed("date") or doc.has_value_changed("company"):
+        mark_dirty("job_financial_summary", doc.name)
+
+
+def rename_job_financial_summary(doc, method=None, old=None, new=None, merge=False):
+    """
+    doc_events handler on Job Record after_rename. The summary row is named by its
+    job, so the old row is dropped and the new job's row is rebuilt from its vouchers,
+    which also covers a merge into an existing job.
+    """
+    frappe.db.sql("""
+        DELETE FROM `tabJob Financial Summary`
+        WHERE name IN %(names)s OR job_record IN %(names)s
+    """, {"names": (old, new)})
+
+    update_job_financial_summary(new)
+
+    for job_record in (old, new):
+        frappe.db.after_commit.add(partial(clear_job_financial_summary, job_record))
+
+
+def update_job_financial_summary(job_record):
+    """Recompute one Job Financial Summary row; run coalesced from voucher events"""
+    jobs = frappe.get_all("Job Record", filters={"name": job_record}, fields=["name", "date", "company"])
+    if not jobs:
+        frappe.db.delete("Job Financial Summary", {"job_record": job_record})
+        return
+
+    write_job_financial_summaries(jobs, get_job_ledger_totals(job_record))
+
+
+def get_job_ledger_totals(job_record=None):
+    """{job_record: {column: amount}} from submitted invoices and journal entries, grouped per job"""
+    condition = "custom_job_record = %(job_record)s" if job_record else "IFNULL(custom_job_record, '') != ''"
+    line_condition = "pii.custom_job_record = %(job_record)s" if job_record \
+        else "IFNULL(pii.custom_job_record, '') != ''"
+
+    rows = frappe.db.sql("""
+        SELECT custom_job_record AS job_record, 'sales' AS source,
+            SUM(base_total) AS total, SUM(base_grand_total) AS grand_total, SUM(outstanding_amount) AS outstanding
+        FROM `tabSales Invoice`
+        WHERE docstatus = 1 AND {condition}
+        GROUP BY custom_job_record
+        UNION ALL
+        SELECT custom_job_record, 'purchase',
+            SUM(base_total), SUM(base_grand_total), SUM(outstanding_amount)
+        FROM `tabPurchase Invoice`
+        WHERE docstatus = 1 AND {condition}
+        GROUP BY custom_job_record
+        UNION ALL
+        SELECT pii.custom_job_record, 'purchase',
+            SUM(pii.base_amount),
+            SUM(pii.base_amount * pi.base_grand_total / pi.base_total),
+            SUM(pii.base_amount * pi.outstanding_amount / pi.base_total)
+        FROM `tabPurchase Invoice Item` pii
+        JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent
+        WHERE pi.docstatus = 1 AND IFNULL(pi.custom_job_record, '') = '' AND pi.base_total != 0
+            AND {line_condition}
+        GROUP BY pii.custom_job_record
+        UNION ALL
+        SELECT custom_job_record, 'journal_entry',
+            SUM(total_debit), SUM(total_debit), 0
+        FROM `tabJournal Entry`
+        WHERE docstatus = 1 AND {condition}
+        GROUP BY custom_job_record
+    """.format(condition=condition, line_condition=line_condition), {"job_record": job_record}, as_dict=True)
+
+    # Header-linked and line-linked purchases both come as 'purchase' rows and add up
+    totals = {}
+    for row in rows:
+        job_totals = totals.setdefault(row.job_record, {})
+        if row.source == "journal_entry":
+            job_totals["journal_entry_debit"] = flt(row.total)
+        else:
+            for column, value in (("total", row.total), ("grand_total", row.grand_total),
+                    ("outstanding", row.outstanding)):
+                key = f"{row.source}_{column}"
+                job_totals[key] = job_totals.get(key, 0) + flt(value)
+
+    return totals
+
+
+def write_job_financial_summaries(jobs, totals):
+    timestamp = now()
+    user = frappe.session.user
+
+    for batch in create_batch(jobs, UPSERT_CHUNK_SIZE):
+        values = []
+        for job in batch:
+            row = totals.get(job.name, {})
+            row["job_date"] = job.date
+            row["company"] = job.company
+            row["profit_and_loss"] = flt(row.get("sales_total")) - flt(row.get("purchase_total")) \
+                - flt(row.get("journal_entry_debit"))
+
+            values.extend([job.name, timestamp, timestamp, user, user, job.name])
+            values.extend(row.get(column) or (None if column in ("job_date", "company") else 0)
+                for column in SUMMARY_COLUMNS)
+
+        frappe.db.sql("""
+            INSERT INTO `tabJob Financial Summary`
+                (name, creation, modified, owner, modified_by, job_record, {columns})
+            VALUES {rows}
+            ON DUPLICATE KEY UPDATE {updates}, modified = VALUES(modified)
+        """.format(
+            columns=", ".join(SUMMARY_COLUMNS),
+            rows=", ".join(["({0})".format(", ".join(["%s"] * (len(SUMMARY_COLUMNS) + 6)))] * len(batch)),
+            updates=", ".join(f"{column} = VALUES({column})" for column in SUMMARY_COLUMNS)
+        ), values)
+
+
+@frappe.whitelist()
+def rebuild_job_financial_summaries():
+    """Rebuild the Job Financial Summary table for all Job Records with grouped queries"""
+    frappe.only_for("System Manager")
+
+    frappe.db.sql("""
+        DELETE FROM `tabJob Financial Summary`
+        WHERE job_record NOT IN (SELECT name FROM `tabJob Record`)
+    """)
+
+    jobs = frappe.get_all("Job Record", fields=["name", "date", "company"])
+    write_job_financial_summaries(jobs, get_job_ledger_totals())
+
+    return {"status": "success", "message": _("Job Financial Summary rebuilt for {0} Job Records").format(len(jobs))}
+
+
+def clear_job_financial_summary(job_record):
+    frappe.cache().delete_value(get_cache_key(job_record))
+
+
+def get_cache_key(job_record):
+    return f"{CACHE_KEY}:{job_record}"
@@ -0,0 +1,153 @@
+"""
+Per-job fulfilment index.
+
+`Job Fulfilment` keeps the submitted quantity per (job record, item, target
+doctype) for Purchase Orders, Purchase Invoices, Sales Orders, Sales Invoices
+and Quotations linked to a Job Record through `custom_job_record`. Rows are
+adjusted by delta on submit and cancel, so the remaining-items lookup and the
+fulfilment grid on the Job Record are single indexed reads.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import flt, now
+
+# Target doctype -> child table holding its items
+FULFILMENT_TARGETS = {
+    "Purchase Order": "Purchase Order Item",
+    "Purchase Invoice": "Purchase Invoice Item",
+    "Sales Order": "Sales Order Item",
+    "Sales Invoice": "Sales Invoice Item",
+    "Quotation": "Quotation Item",
+}
+
+
+def update_job_fulfilment(doc, method=None):
+    """doc_events handler: add the document's item quantities on submit, remove them on cancel"""
+    if doc.doctype not in FULFILMENT_TARGETS or not doc.get("custom_job_record"):
+        return
+
+    sign = -1 if method == "on_cancel" else 1
+    deltas = {}
+    for row in doc.get("items") or []:
+        if row.item_code and row.qty:
+            deltas[row.item_code] = deltas.get(row.item_code, 0) + sign * flt(row.qty)
+
+    apply_fulfilment_deltas(doc.custom_job_record, doc.doctype, deltas)
+
+
+def apply_fulfilment_deltas(job_record, target_doctype, deltas):
+    timestamp = now()
+    user = frappe.session.user
+
+    for item_code, qty in deltas.items():
+        if not flt(qty, 9):
+            continue
+
+        frappe.db.sql("""
+            INSERT INTO `tabJob Fulfilment`
+                (name, creation, modified, owner, modified_by, job_record, item_code, target_doctype, ordered_qty)
+            VALUES (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, %(job_record)s, %(item_code)s, %(target_doctype)s, %(qty)s)
+            ON DUPLICATE KEY UPDATE ordered_qty = ordered_qty + VALUES(ordered_qty), modified = VALUES(modified)
+        """, {
+            "name": frappe.generate_hash(length=12),
+            "now": timestamp,
+            "user": user,
+            "job_record": job_record,
+            "item_code": item_code,
+            "target_doctype": target_doctype,
+            "qty": qty,
+        })
+
+
+def get_ordered_qty(job_record, target_doctype=None):
+    """{item_code: qty} for one target doctype, or {target_doctype: {item_code: qty}} for all"""
+    filters = {"job_record": job_record}
+    if target_doctype:
+        filters["target_doctype"] = target_doctype
+
+    rows = frappe.get_all(
+        "Job Fulfilment",
+        filters=filters,
+        fields=["target_doctype", "item_code", "ordered_qty"]
+    )
+
+    if target_doctype:
+        return {row.item_code: flt(row.ordered_qty) for row in rows}
+
+    ordered = {}
+    for row in rows:
+        ordered.setdefault(row.target_doctype, {})[row.item_code] = flt(row.ordered_qty)
+    return ordered
+
+
+def get_job_items(job_record):
+    """Rows of the Job Record's items table, read directly from the child table"""
+    items_field = frappe.get_meta("Job Record").get_field("items")
+    if not items_field:
+        return []
+
+    return frappe.get_all(
+        items_field.options,
+        filters={"parent": job_record, "parenttype": "Job Record", "parentfield": "items"},
+        fields=["item", "item_name", "quantity", "uom", "rate"],
+        order_by="idx"
+    )
+
+
+@frappe.whitelist()
+def get_job_fulfilment(job_record):
+    """Required and submitted quantity per item and target doctype, for the Job Record fulfilment grid"""
+    frappe.has_permission("Job Record", "read", job_record, throw=True)
+
+    ordered = get_ordered_qty(job_record)
+    items = get_job_items(job_record)
+
+    required = {}
+    for row in items:
+        required[row.item] = required.get(row.item, 0) + flt(row.quantity)
+
+    rows = []
+    for item_code in list(required) + sorted({i for qty in ordered.values() for i in qty} - set(required)):
+        row = {"item_code": item_code, "required_qty": required.get(item_code, 0)}
+        for target_doctype in FULFILMENT_TARGETS:
+            row[frappe.scrub(target_doctype)] = ordered.get(target_doctype, {}).get(item_code, 0)
+        rows.append(row)
+
+    return {"targets": list(FULFILMENT_TARGETS), "rows": rows}
+
+
+@frappe.whitelist()
+def rebuild_job_fulfilment(job_record=None):
+    """Rebuild the index from submitted documents, for one Job Record or all of them"""
+    frappe.only_for("System Manager")
+
+    values = {"now": now(), "user": frappe.session.user}
+    condition = ""
+    if job_record:
+        values["job_record"] = job_record
+        condition = "AND parent_doc.custom_job_record = %(job_record)s"
+        frappe.db.delete("Job Fulfilment", {"job_record": job_record})
+    else:
+        frappe.db.delete("Job Fulfilment")
+
+    for target_doctype, item_doctype in FULFILMENT_TARGETS.items():
+        values["target_doctype"] = target_doctype
+        frappe.db.sql("""
+            INSERT INTO `tabJob Fulfilment`
+                (name, creation, modified, owner, modified_by, job_record, item_code, target_doctype, ordered_qty)
+            SELECT SUBSTRING(MD5(CONCAT_WS('|', src.job_record, src.item_code, %(target_doctype)s)), 1, 20),
+                %(now)s, %(now)s, %(user)s, %(user)s, src.job_record, src.item_code, %(target_doctype)s, src.qty
+            FROM (
+                SELECT parent_doc.custom_job_record AS job_record, item.item_code, SUM(item.qty) AS qty
+                FROM `tab{item_doctype}` item
+                JOIN `tab{target_doctype}` parent_doc ON parent_doc.name = item.parent
+                WHERE parent_doc.docstatus = 1
+                    AND IFNULL(parent_doc.custom_job_record, '') != ''
+                    AND IFNULL(item.item_code, '') != ''
+                    {condition}
+                GROUP BY parent_doc.custom_job_record, item.item_code
+            ) src
+        """.format(item_doctype=item_doctype, target_doctype=target_doctype, condition=condition), values)
+
+    return {"status": "success", "message": _("Job Fulfilment rebuilt")}
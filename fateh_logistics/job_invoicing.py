@@ -0,0 +1,334 @@
+"""
+Sales Invoice creation from the Invoice Item table of a Job Record.
+
+The invoice is built server-side in one call. Item-wise tax rates come from
+a per-company cache of Item Tax Templates, loaded with one query and dropped
+when a template changes. The Job Record row is locked while the duplicate
+check runs and `invoice_status` is set in the same transaction as the invoice
+insert.
+
+The tax template picker on the invoice items searches a cached, per-company
+list of the templates whose tax accounts sit under the parent account set in
+Fateh Logistics Settings. The list is dropped on any Account, Item Tax
+Template or settings change.
+
+A Job Invoicing Run applies the same builder to many jobs in a background
+worker. Jobs are processed in batches that share the customer and tax
+template lookups; each job runs under a savepoint so one failure is logged on
+its row without undoing the rest of the batch. Rows keep their status, so a
+stopped or partly failed run resumes from the remaining jobs.
+"""
+
+import json
+from functools import partial
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, create_batch, nowdate
+
+TAX_TEMPLATE_CACHE_KEY = "fateh_logistics:item_tax_templates"
+TAX_TEMPLATE_SEARCH_CACHE_KEY = "fateh_logistics:tax_template_search"
+
+# Used when Fateh Logistics Settings has no parent tax account
+DEFAULT_TAX_PARENT_ACCOUNT = "Duties and Taxes"
+
+TAX_ACCOUNT_TYPES = ("Tax", "Chargeable", "Income Account", "Expense Account")
+
+# Jobs invoiced per commit in a Job Invoicing Run
+INVOICING_BATCH_SIZE = 25
+
+
+@frappe.whitelist()
+def make_sales_invoice_from_job(job_record):
+    """Create a draft Sales Invoice from the Job Record's invoice items and mark the job invoiced"""
+    frappe.has_permission("Sales Invoice", "create", throw=True)
+    frappe.has_permission("Job Record", "write", job_record, throw=True)
+
+    return create_job_sales_invoice(job_record)
+
+
+def create_job_sales_invoice(job_record, templates=None, disabled_customers=None):
+    """Lock the job, check for an existing invoice and insert the draft Sales Invoice"""
+    # Lock the job so concurrent requests queue behind the duplicate check
+    job = frappe.get_doc("Job Record", job_record, for_update=True)
+
+    existing_invoice = frappe.db.get_value(
+        "Sales Invoice", {"custom_job_record": job.name, "docstatus": ["<", 2]}, "name"
+    )
+    if existing_invoice:
+        frappe.throw(
+            _("A Sales Invoice already exists for this Job Record: {0}").format(existing_invoice),
+            title=_("Duplicate Invoice")
+        )
+
+    if not job.get("invoice_item"):
+        frappe.throw(_("Please add at least one row in Invoice Items."), title=_("No Items"))
+
+    if not job.company or not job.customer:
+        frappe.throw(_("Company and Customer are required."), title=_("Missing Data"))
+
+    if disabled_customers and job.customer in disabled_customers:
+        frappe.throw(_("Customer {0} is disabled").format(job.customer))
+
+    si = build_sales_invoice(job, templates or get_company_tax_templates(job.company))
+    si.insert()
+
+    frappe.db.set_value("Job Record", job.name, "invoice_status", "Invoice Created")
+
+    return si.name
+
+
+def build_sales_invoice(job, templates):
+    si = frappe.new_doc("Sales Invoice")
+    si.company = job.company
+    si.customer = job.customer
+    si.cost_center = job.branch
+    si.posting_date = nowdate()
+    si.due_date = add_days(nowdate(), 30)
+    si.custom_job_record = job.name
+
+    tax_accounts = {}
+    for row in job.invoice_item:
+        if not row.item or not row.qty or not row.rate:
+            frappe.throw(_("Row {0}: Item, Qty and Rate are mandatory in Invoice Items").format(row.idx))
+
+        item_tax_rate = None
+        if row.item_tax_template:
+            if row.item_tax_template not in templates:
+                frappe.throw(_("Row {0}: Item Tax Template {1} does not belong to company {2}").format(
+                    row.idx, row.item_tax_template, job.company))
+
+            tax_map = templates[row.item_tax_template]
+            if tax_map:
+                tax_accounts.update(dict.fromkeys(tax_map))
+                item_tax_rate = json.dumps(tax_map)
+
+        si.append("items", {
+            "item_code": row.item,
+            "qty": row.qty,
+            "rate": row.rate,
+            "item_tax_template": row.item_tax_template or None,
+            "item_tax_rate": item_tax_rate,
+            "custom_container_no": job.get("custom_container_no")
+        })
+
+    # Header rows at rate 0; the item-wise rates apply the tax
+    for account in tax_accounts:
+        si.append("taxes", {
+            "charge_type": "On Net Total",
+            "account_head": account,
+            "description": account,
+            "rate": 0,
+            "included_in_print_rate": 0
+        })
+
+    return si
+
+
+def get_company_tax_templates(company):
+    """{template: {tax_type: tax_rate}} for all Item Tax Templates of the company, cached per company"""
+    templates = frappe.cache().hget(TAX_TEMPLATE_CACHE_KEY, company)
+    if templates is not None:
+        return templates
+
+    templates = {}
+    for row in frappe.db.sql("""
+        SELECT itt.name, ittd.tax_type, ittd.tax_rate
+        FROM `tabItem Tax Template` itt
+        LEFT JOIN `tabItem Tax Template Detail` ittd ON ittd.parent = itt.name
+        WHERE itt.company = %(company)s
+        ORDER BY itt.name, ittd.idx
+    """, {"company": company}, as_dict=True):
+        tax_map = templates.setdefault(row.name, {})
+        if row.tax_type:
+            tax_map[row.tax_type] = row.tax_rate
+
+    frappe.cache().hset(TAX_TEMPLATE_CACHE_KEY, company, templates)
+    return templates
+
+
+def clear_tax_template_cache(doc, method=None, *args):
+    """
+    doc_events handler on Item Tax Template change and rename. The entries of
+    the company, and of the previous company when it was changed, are dropped
+    after commit so a concurrent reader cannot refill them with the templates
+    as they were before this transaction.
+    """
+    before = doc.get_doc_before_save()
+    for company in {doc.company, before and before.company} - {None}:
+        frappe.db.after_commit.add(partial(frappe.cache().hdel, TAX_TEMPLATE_CACHE_KEY, company))
+
+    clear_tax_template_search_cache()
+
+
+def get_eligible_tax_templates(company=None):
+    """
+    Names of the Item Tax Templates with a tax account under the parent tax
+    account, sorted, for one company or all of them; cached per company.
+    """
+    key = company or ""
+    names = frappe.cache().hget(TAX_TEMPLATE_SEARCH_CACHE_KEY, key)
+    if names is not None:
+        return names
+
+    # The parent is configured by account name so one setting serves every company
+    parent_account = frappe.db.get_single_value("Fateh Logistics Settings", "tax_template_parent_account") \
+        or DEFAULT_TAX_PARENT_ACCOUNT
+    parents = frappe.get_all(
+        "Account",
+        filters={"account_name": parent_account, **({"company": company} if company else {})},
+        fields=["lft", "rgt"]
+    )
+
+    names = []
+    if parents:
+        bounds = " OR ".join(["(acc.lft >= %s AND acc.rgt <= %s)"] * len(parents))
+        values = [v for parent in parents for v in (parent.lft, parent.rgt)]
+        company_condition = ""
+        if company:
+            company_condition = "AND itt.company = %s"
+            values.append(company)
+
+        names = frappe.db.sql_list("""
+            SELECT DISTINCT itt.name
+            FROM `tabItem Tax Template` itt
+            JOIN `tabItem Tax Template Detail` ittd ON ittd.parent = itt.name
+            JOIN `tabAccount` acc ON acc.name = ittd.tax_type
+            WHERE ({bounds})
+                AND acc.account_type IN ({account_types})
+                {company_condition}
+            ORDER BY itt.name
+        """.format(
+            bounds=bounds,
+            account_types=", ".join(frappe.db.escape(account_type) for account_type in TAX_ACCOUNT_TYPES),
+            company_condition=company_condition
+        ), values)
+
+    frappe.cache().hset(TAX_TEMPLATE_SEARCH_CACHE_KEY, key, names)
+    return names
+
+
+def clear_tax_template_search_cache(doc=None, method=None):
+    """doc_events handler on Account change; also run on Item Tax Template and settings change. Cleared after commit."""
+    frappe.db.after_commit.add(partial(frappe.cache().delete_value, TAX_TEMPLATE_SEARCH_CACHE_KEY))
+
+
+def get_invoiceable_jobs(company, from_date, to_date, job_status=None, branch=None):
+    """Job Records in the period with invoice items, not marked invoiced and without an open Sales Invoice"""
+    conditions = [
+        "jr.company = %(company)s",
+        "jr.date BETWEEN %(from_date)s AND %(to_date)s",
+        "IFNULL(jr.invoice_status, '') != 'Invoice Created'",
+        """EXISTS (SELECT 1 FROM `tabInvoice Item` ii
+            WHERE ii.parent = jr.name AND ii.parenttype = 'Job Record' AND ii.parentfield = 'invoice_item')""",
+        """NOT EXISTS (SELECT 1 FROM `tabSales Invoice` si
+            WHERE si.custom_job_record = jr.name AND si.docstatus < 2)""",
+    ]
+    values = {"company": company, "from_date": from_date, "to_date": to_date}
+
+    if job_status:
+        conditions.append("jr.job_status = %(job_status)s")
+        values["job_status"] = job_status
+
+    if branch:
+        conditions.append("jr.branch = %(branch)s")
+        values["branch"] = branch
+
+    return frappe.db.sql("""
+        SELECT jr.name, jr.customer
+        FROM `tabJob Record` jr
+        WHERE {conditions}
+        ORDER BY jr.date, jr.name
+    """.format(conditions=" AND ".join(conditions)), values, as_dict=True)
+
+
+def get_run_job_id(run_name):
+    return f"fateh_logistics:job_invoicing:{run_name}"
+
+
+def enqueue_job_invoicing(run_name, retry_failed=0):
+    frappe.enqueue(
+        "fateh_logistics.job_invoicing.run_job_invoicing",
+        queue="long",
+        timeout=4 * 3600,
+        job_id=get_run_job_id(run_name),
+        deduplicate=True,
+        run_name=run_name,
+        retry_failed=retry_failed,
+        user=frappe.session.user
+    )
+
+
+def run_job_invoicing(run_name, retry_failed=0, user=None):
+    """Background job: invoice the run's remaining jobs batch by batch, committing after every batch"""
+    run = frappe.get_doc("Job Invoicing Run", run_name)
+    statuses = ("Pending", "Failed") if retry_failed else ("Pending",)
+    rows = [row for row in run.jobs if row.status in statuses]
+
+    run.db_set("status", "In Progress")
+    frappe.db.commit()
+
+    templates = get_company_tax_templates(run.company)
+    done = 0
+
+    for batch in create_batch(rows, INVOICING_BATCH_SIZE):
+        disabled_customers = set(frappe.get_all(
+            "Customer",
+            filters={"name": ["in", list({row.customer for row in batch if row.customer})], "disabled": 1},
+            pluck="name"
+        ))
+
+        for row in batch:
+            frappe.db.savepoint("job_invoicing")
+            try:
+                sales_invoice = create_job_sales_invoice(row.job_record, templates, disabled_customers)
+                values = {"status": "Invoiced", "sales_invoice": sales_invoice, "error": None}
+            except Exception as e:
+                frappe.db.rollback(save_point="job_invoicing")
+                error = str(e) if isinstance(e, frappe.ValidationError) else frappe.get_traceback()
+                values = {"status": "Failed", "error": frappe.utils.strip_html(error)}
+                frappe.local.message_log = []
+
+            frappe.db.set_value("Job Invoicing Run Item", row.name, values, update_modified=False)
+
+        set_run_counts(run_name)
+        frappe.db.commit()
+
+        done += len(batch)
+        frappe.publish_progress(
+            done * 100 / len(rows),
+            title=_("Invoicing Jobs"),
+            description=_("{0} of {1} jobs").format(done, len(rows)),
+            doctype="Job Invoicing Run",
+            docname=run_name
+        )
+
+    counts = set_run_counts(run_name)
+    frappe.db.set_value(
+        "Job Invoicing Run", run_name, "status",
+        "Partly Failed" if counts.get("Failed") else "Completed"
+    )
+    frappe.db.commit()
+
+    frappe.publish_realtime(
+        "fateh_logistics_job_invoicing_done",
+        {"run": run_name, "invoiced": counts.get("Invoiced", 0), "failed": counts.get("Failed", 0)},
+        user=user
+    )
+
+
+def set_run_counts(run_name):
+    counts = dict(frappe.db.sql("""
+        SELECT status, COUNT(*)
+        FROM `tabJob Invoicing Run Item`
+        WHERE parent = %(run)s AND parenttype = 'Job Invoicing Run'
+        GROUP BY status
+    """, {"run": run_name}))
+
+    frappe.db.set_value("Job Invoicing Run", run_name, {
+        "total_jobs": sum(counts.values()),
+        "invoiced_jobs": counts.get("Invoiced", 0),
+        "failed_jobs": counts.get("Failed", 0),
+    }, update_modified=False)
+
+    return counts
@@ -0,0 +1,209 @@
+"""
+Reference number lookup across Job Record and Warehouse Job Record.
+
+`Job Reference Index` keeps one row per token of every reference on a job
+(BL/AWB, PO/BL, TWB, truck and container numbers, HS code, consignee,
+shipper). A token is the reference lowercased with spaces and punctuation
+removed; references of several words also get a token per word. The rows of a
+job are rewritten when one of its reference fields changes, so a search is a
+prefix range scan of the indexed token column. Exact matches rank first, then
+the most recent jobs.
+"""
+
+import re
+
+import frappe
+from frappe.utils import cint, now
+
+# Job doctype -> {field: label} of the references indexed on the job itself
+REFERENCE_FIELDS = {
+    "Job Record": {
+        "blawb_no": "BAYAN/AWB No",
+        "pobl_no": "PO/BL No",
+        "twb_no": "TWB No",
+        "truck_no": "Truck No",
+        "custom_container_no": "Container No",
+        "hs_code": "HS Code",
+        "consignee": "Consignee",
+        "shipper": "Shipper",
+    },
+    "Warehouse Job Record": {
+        "bayanawb_no": "BAYAN/AWB No",
+        "pobl_no": "PO/BL No",
+        "twb_no": "TWB No",
+        "reference": "Reference",
+        "container_number": "Container No",
+        "consignee": "Consignee",
+        "shipper": "Shipper",
+    },
+}
+
+# Job doctype -> (table field, child doctype, {field: label}) of references in child tables
+REFERENCE_TABLES = {
+    "Warehouse Job Record": [
+        ("vehicle_information", "Vehicle Details", {"vehicle_no": "Truck No", "container_no": "Container No"}),
+    ],
+}
+
+INDEX_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by",
+    "reference_doctype", "job", "job_date", "customer_name", "reference_type", "reference", "token"
+]
+
+# Letters (Latin and Arabic) and digits; everything else separates words
+TOKEN_PATTERN = re.compile(r"[0-9a-z\u0600-\u06ff]+")
+
+TOKEN_LENGTH = 140
+
+MIN_WORD_LENGTH = 2
+
+MIN_SEARCH_LENGTH = 3
+
+
+def get_tokens(value):
+    """The whole value compacted, plus each word when there are several"""
+    words = TOKEN_PATTERN.findall((value or "").lower())
+    tokens = ["".join(words)] if words else []
+    if len(words) > 1:
+        tokens += [word for word in words if len(word) >= MIN_WORD_LENGTH]
+
+    return list(dict.fromkeys(token[:TOKEN_LENGTH] for token in tokens))
+
+
+def get_reference_fields(doctype):
+    """Indexed fields that exist on the doctype; custom fields may not be installed on every site"""
+    meta = frappe.get_meta(doctype)
+    return {field: label for field, label in REFERENCE_FIELDS[doctype].items() if meta.has_field(field)}
+
+
+def get_index_rows(doctype, job, references, timestamp=None):
+    """Index rows for a job from its (label, value) references"""
+    timestamp = timestamp or now()
+    user = frappe.session.user
+
+    rows = []
+    for label, value in references:
+        value = (value or "").strip()
+        for token in get_tokens(value):
+            rows.append((
+                frappe.generate_hash(length=10), timestamp, timestamp, user, user,
+                doctype, job.name, job.get("date"), job.get("customer_name"), label, value[:TOKEN_LENGTH], token
+            ))
+
+    return rows
+
+
+def get_doc_references(doc):
+    references = [(label, doc.get(field)) for field, label in get_reference_fields(doc.doctype).items()]
+    for table_field, _child_doctype, fields in REFERENCE_TABLES.get(doc.doctype, []):
+        for row in doc.get(table_field) or []:
+            references.extend((label, row.get(field)) for field, label in fields.items())
+
+    return references
+
+
+def update_job_reference_index(doc, method=None):
+    """doc_events handler on Job Record and Warehouse Job Record update/delete"""
+    if method != "on_trash":
+        before = doc.get_doc_before_save()
+        if before and get_doc_references(before) == get_doc_references(doc) and not (
+            doc.has_value_changed("date") or doc.has_value_changed("customer_name")
+        ):
+            return
+
+    frappe.db.delete("Job Reference Index", {"reference_doctype": doc.doctype, "job": doc.name})
+    if method == "on_trash":
+        return
+
+    rows = get_index_rows(doc.doctype, doc, get_doc_references(doc))
+    if rows:
+        frappe.db.bulk_insert("Job Reference Index", fields=INDEX_FIELDS, values=rows)
+
+
+def rename_job_reference_index(doc, method=None, old=None, new=None, merge=False):
+    """doc_events handler on after_rename"""
+    frappe.db.sql("""
+        UPDATE `tabJob Reference Index`
+        SET job = %(new)s
+        WHERE reference_doctype = %(doctype)s AND job = %(old)s
+    """, {"doctype": doc.doctype, "old": old, "new": new})
+
+
+def rebuild_job_reference_index():
+    """Rebuild the index from both job doctypes; used for backfill and repair"""
+    frappe.db.delete("Job Reference Index")
+
+    timestamp = now()
+    for doctype in REFERENCE_FIELDS:
+        fields = get_reference_fields(doctype)
+        references = {}
+
+        jobs = frappe.get_all(doctype, fields=["name", "date", "customer_name"] + list(fields))
+        for job in jobs:
+            references[job.name] = [(label, job.get(field)) for field, label in fields.items()]
+
+        for table_field, child_doctype, child_fields in REFERENCE_TABLES.get(doctype, []):
+            for row in frappe.get_all(
+                child_doctype,
+                filters={"parenttype": doctype, "parentfield": table_field},
+                fields=["parent"] + list(child_fields),
+                order_by="parent, idx"
+            ):
+                if row.parent in references:
+                    references[row.parent].extend((label, row.get(field)) for field, label in child_fields.items())
+
+        rows = []
+        for job in jobs:
+            rows.extend(get_index_rows(doctype, job, references[job.name], timestamp))
+
+        if rows:
+            frappe.db.bulk_insert("Job Reference Index", fields=INDEX_FIELDS, values=rows)
+
+
+@frappe.whitelist()
+def search_job_references(txt, doctype=None, limit=20):
+    """Jobs with a reference starting with `txt`, exact matches first, then the most recent jobs"""
+    token = "".join(TOKEN_PATTERN.findall((txt or "").lower()))
+    if len(token) < MIN_SEARCH_LENGTH:
+        return []
+
+    doctypes = [
+        dt for dt in REFERENCE_FIELDS
+        if (not doctype or dt == doctype) and frappe.has_permission(dt, "read")
+    ]
+    if not doctypes:
+        return []
+
+    limit = min(cint(limit) or 20, 100)
+    rows = frappe.db.sql("""
+        SELECT reference_doctype, job, job_date, customer_name, reference_type, reference, token = %(token)s AS exact
+        FROM `tabJob Reference Index`
+        WHERE token LIKE %(prefix)s AND reference_doctype IN %(doctypes)s
+        ORDER BY exact DESC, job_date DESC, job
+        LIMIT %(scan_limit)s
+    """, {"token": token, "prefix": f"{token}%", "doctypes": tuple(doctypes), "scan_limit": limit * 5}, as_dict=True)
+
+    # One match per job, then only the jobs the user can read
+    matches = {}
+    for row in rows:
+        matches.setdefault((row.reference_doctype, row.job), row)
+
+    permitted = set()
+    for dt in doctypes:
+        names = [job for reference_doctype, job in matches if reference_doctype == dt]
+        if names:
+            permitted.update((dt, name) for name in frappe.get_list(
+                dt, filters={"name": ["in", names]}, pluck="name", limit=len(names)
+            ))
+
+    return [
+        {
+            "doctype": row.reference_doctype,
+            "name": row.job,
+            "date": row.job_date,
+            "customer_name": row.customer_name,
+            "reference_type": row.reference_type,
+            "reference": row.reference,
+        }
+        for key, row in matches.items() if key in permitted
+    ][:limit]
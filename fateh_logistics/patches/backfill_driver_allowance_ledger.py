@@ -0,0 +1,5 @@
+from fateh_logistics.driver_allowance import reconcile_driver_allowances
+
+
+def execute():
+    reconcile_driver_allowances()
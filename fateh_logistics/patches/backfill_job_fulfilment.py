@@ -0,0 +1,5 @@
+from fateh_logistics.job_fulfilment import rebuild_job_fulfilment
+
+
+def execute():
+    rebuild_job_fulfilment()
@@ -0,0 +1,5 @@
+from fateh_logistics.po_hooks import rebuild_job_record_progress
+
+
+def execute():
+    rebuild_job_record_progress()
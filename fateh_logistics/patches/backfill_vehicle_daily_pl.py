@@ -0,0 +1,5 @@
+from fateh_logistics.vehicle_pl import rebuild_vehicle_daily_pl
+
+
+def execute():
+    rebuild_vehicle_daily_pl(enqueue=False)
@@ -0,0 +1,5 @@
+from fateh_logistics.driver_search import rebuild_driver_search_index
+
+
+def execute():
+    rebuild_driver_search_index()
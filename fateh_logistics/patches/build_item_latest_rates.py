@@ -0,0 +1,5 @@
+from fateh_logistics.item_rates import rebuild_item_latest_rates
+
+
+def execute():
+    rebuild_item_latest_rates()
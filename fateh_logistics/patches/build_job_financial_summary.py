@@ -0,0 +1,5 @@
+from fateh_logistics.job_financials import rebuild_job_financial_summaries
+
+
+def execute():
+    rebuild_job_financial_summaries()
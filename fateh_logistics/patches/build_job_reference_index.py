@@ -0,0 +1,5 @@
+from fateh_logistics.job_references import rebuild_job_reference_index
+
+
+def execute():
+    rebuild_job_reference_index()
@@ -0,0 +1,5 @@
+from fateh_logistics.trip_booking import rebuild_trip_booking_intervals
+
+
+def execute():
+    rebuild_trip_booking_intervals()
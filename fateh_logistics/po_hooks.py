@@ -1,15 +1,63 @@
 
 
 import frappe
-from fateh_logistics.api import update_percent_purchased, update_percent_delivered
-
-def update_job_record_percent(doc, method):
-    if doc.doctype in ["Purchase Order", "Purchase Invoice", "Purchase Receipt"] and doc.get("custom_job_record"):
-        update_percent_purchased(doc.custom_job_record)
-    elif doc.doctype in ["Sales Order", "Sales Invoice", "Delivery Note"] and doc.get("custom_job_record"):
-        update_percent_delivered(doc.custom_job_record)
-
+from frappe import _
+from frappe.utils import flt
 
+from fateh_logistics.api import get_percent_received
+from fateh_logistics.coalesce import mark_dirty
 
+PROGRESS_DOCTYPES = [
+    "Purchase Order", "Purchase Invoice", "Purchase Receipt",
+    "Sales Order", "Sales Invoice", "Delivery Note"
+]
 
 
+def update_job_record_percent(doc, method):
+    """doc_events handler: recompute the Job Record's progress once per burst of order events"""
+    if doc.doctype in PROGRESS_DOCTYPES and doc.get("custom_job_record"):
+        mark_dirty("job_record_progress", doc.custom_job_record)
+
+
+@frappe.whitelist()
+def rebuild_job_record_progress(job_record=None):
+    """Recompute % received and % delivered for one Job Record or all of them with grouped queries"""
+    frappe.only_for("System Manager")
+
+    condition, values = "", {}
+    if job_record:
+        condition = "AND custom_job_record = %(job_record)s"
+        values["job_record"] = job_record
+
+    received = dict(frappe.db.sql("""
+        SELECT custom_job_record, SUM(per_received * total_qty)
+        FROM `tabPurchase Order`
+        WHERE docstatus = 1 AND IFNULL(custom_job_record, '') != '' {condition}
+        GROUP BY custom_job_record
+    """.format(condition=condition), values))
+
+    delivered = dict(frappe.db.sql("""
+        SELECT custom_job_record, AVG(per_delivered)
+        FROM `tabSales Order`
+        WHERE docstatus = 1 AND IFNULL(custom_job_record, '') != '' {condition}
+        GROUP BY custom_job_record
+    """.format(condition=condition), values))
+
+    jobs = frappe.get_all(
+        "Job Record",
+        filters={"name": job_record} if job_record else None,
+        fields=["name", "total_quantity", "_received", "_delivered"]
+    )
+
+    updates = {}
+    for job in jobs:
+        progress = {
+            "_received": get_percent_received(received.get(job.name), job.total_quantity),
+            "_delivered": flt(delivered.get(job.name))
+        }
+        if flt(job._received, 6) != flt(progress["_received"], 6) or flt(job._delivered, 6) != flt(progress["_delivered"], 6):
+            updates[job.name] = progress
+
+    frappe.db.bulk_update("Job Record", updates, update_modified=False)
+
+    return {"status": "success", "message": _("Progress updated for {0} Job Records").format(len(updates))}
@@ -0,0 +1,63 @@
+// Copyright (c) 2026, Fateh Logistics and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Driver"] = {
+    onload: function(listview) {
+        if (!frappe.user.has_role(["HR Manager", "System Manager"])) return;
+
+        listview.page.add_inner_button(__("Process All Allowances"), function() {
+            const dialog = new frappe.ui.Dialog({
+                title: __("Process Allowances for All Internal Drivers"),
+                fields: [
+                    {
+                        fieldname: "as_of_date",
+                        fieldtype: "Date",
+                        label: __("Balances as of"),
+                        default: frappe.datetime.get_today(),
+                        reqd: 1
+                    },
+                    {
+                        fieldname: "payroll_date",
+                        fieldtype: "Date",
+                        label: __("Payroll Date"),
+                        default: frappe.datetime.get_today(),
+                        reqd: 1
+                    }
+                ],
+                primary_action_label: __("Create Additional Salaries"),
+                primary_action: function(values) {
+                    frappe.call({
+                        method: "fateh_logistics.driver_allowance.process_all_driver_allowances",
+                        args: values,
+                        callback: function(r) {
+                            if (r.message) {
+                                frappe.show_alert({
+                                    message: r.message.message,
+                                    indicator: "blue"
+                                });
+                            }
+                            dialog.hide();
+                        }
+                    });
+                }
+            });
+            dialog.show();
+        });
+
+        frappe.realtime.off("fateh_logistics_bulk_allowance_done");
+        frappe.realtime.on("fateh_logistics_bulk_allowance_done", function(summary) {
+            let message = __("Created {0} Additional Salaries totalling {1}", [
+                summary.processed, format_currency(summary.total_amount)
+            ]);
+            if (summary.failed && summary.failed.length) {
+                message += "<br>" + __("Failed for: {0}. See Error Log for details.", [summary.failed.join(", ")]);
+            }
+            frappe.msgprint({
+                title: __("Driver Allowances Processed"),
+                message: message,
+                indicator: summary.failed && summary.failed.length ? "orange" : "green"
+            });
+            listview.refresh();
+        });
+    }
+};
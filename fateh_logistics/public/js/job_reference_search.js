@@ -0,0 +1,58 @@
+// Awesomebar matches for Job Record / Warehouse Job Record reference numbers
+// (BL/AWB, PO/BL, TWB, truck, container, HS code, consignee, shipper).
+// Results are fetched once per search text; when they arrive the bar is
+// rebuilt so they show below the standard options.
+
+frappe.provide("fateh_logistics.job_reference_search");
+
+fateh_logistics.job_reference_search = {
+    min_length: 3,
+    txt: null,
+    pending: null,
+    options: [],
+
+    get_options(txt) {
+        if (txt.length < this.min_length) return [];
+        if (this.txt === txt) return this.options;
+
+        if (this.pending !== txt) {
+            this.pending = txt;
+            frappe.xcall("fateh_logistics.job_references.search_job_references", { txt, limit: 5 })
+                .then(matches => {
+                    if (this.pending !== txt) return;
+
+                    this.txt = txt;
+                    this.options = matches.map(match => this.make_option(match, txt));
+
+                    const $input = $("#navbar-search");
+                    if ($input.length && $input.val().trim().replace(/\s\s+/g, " ") === txt) {
+                        $input.trigger("input");
+                    }
+                });
+        }
+
+        return [];
+    },
+
+    make_option(match, txt) {
+        const description = [match.reference_type, match.customer_name].filter(Boolean).join(" · ");
+        return {
+            label: `<span class="ellipsis">${frappe.utils.escape_html(match.reference)}</span>
+                <span class="text-muted small"> ${__(match.doctype)} ${frappe.utils.escape_html(match.name)}
+                ${description ? " · " + frappe.utils.escape_html(description) : ""}</span>`,
+            value: `${match.reference} ${match.name}`,
+            route: ["Form", match.doctype, match.name],
+            match: txt,
+            index: 40
+        };
+    }
+};
+
+if (frappe.search && frappe.search.AwesomeBar) {
+    const build_options = frappe.search.AwesomeBar.prototype.build_options;
+
+    frappe.search.AwesomeBar.prototype.build_options = function (txt) {
+        const options = build_options.call(this, txt) || [];
+        return options.concat(fateh_logistics.job_reference_search.get_options(txt));
+    };
+}
@@ -0,0 +1,77 @@
+// Copyright (c) 2026, Fateh Logistics and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Trip Details"] = {
+    onload: function(listview) {
+        if (!frappe.model.can_create("Purchase Invoice")) return;
+
+        listview.page.add_inner_button(__("Bill Transporters"), function() {
+            const dialog = new frappe.ui.Dialog({
+                title: __("Consolidated Transporter Billing"),
+                fields: [
+                    {
+                        fieldname: "from_date",
+                        fieldtype: "Date",
+                        label: __("From Date"),
+                        default: frappe.datetime.month_start(),
+                        reqd: 1
+                    },
+                    {
+                        fieldname: "to_date",
+                        fieldtype: "Date",
+                        label: __("To Date"),
+                        default: frappe.datetime.month_end(),
+                        reqd: 1
+                    },
+                    {
+                        fieldname: "transporter",
+                        fieldtype: "Link",
+                        label: __("Transporter"),
+                        options: "Supplier",
+                        description: __("Leave empty to bill every transporter")
+                    },
+                    {
+                        fieldname: "company",
+                        fieldtype: "Link",
+                        label: __("Company"),
+                        options: "Company",
+                        default: frappe.defaults.get_user_default("Company")
+                    }
+                ],
+                primary_action_label: __("Create Purchase Invoices"),
+                primary_action: function(values) {
+                    frappe.call({
+                        method: "fateh_logistics.transporter_billing.run_transporter_billing",
+                        args: values,
+                        callback: function(r) {
+                            if (r.message) {
+                                frappe.show_alert({
+                                    message: r.message.message,
+                                    indicator: "blue"
+                                });
+                            }
+                            dialog.hide();
+                        }
+                    });
+                }
+            });
+            dialog.show();
+        });
+
+        frappe.realtime.off("fateh_logistics_transporter_billing_done");
+        frappe.realtime.on("fateh_logistics_transporter_billing_done", function(summary) {
+            let message = __("Created {0} Purchase Invoices: {1}", [
+                summary.invoices.length, summary.invoices.join(", ")
+            ]);
+            if (summary.failed && summary.failed.length) {
+                message += "<br>" + __("Failed for: {0}. See Error Log for details.", [summary.failed.join(", ")]);
+            }
+            frappe.msgprint({
+                title: __("Transporter Billing Completed"),
+                message: message,
+                indicator: summary.failed && summary.failed.length ? "orange" : "green"
+            });
+            listview.refresh();
+        });
+    }
+};
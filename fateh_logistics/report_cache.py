@@ -0,0 +1,192 @@
+"""
+Prepared (background) execution and result caching for the fleet reports.
+
+Report data is cached in redis under a hash of the normalized filters. Every
+cached entry is registered in an index with the vehicles and date range it
+covers, so submitting or cancelling a voucher only drops the entries it can
+actually change; index entries whose result has expired are pruned then too. With "Prepare in Background" ticked, a cache miss enqueues
+the report on the long queue and the user is notified when it is ready.
+"""
+
+import hashlib
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import cint, getdate
+
+CACHE_TTL = 24 * 60 * 60
+CACHE_KEY_PREFIX = "fateh_logistics:report_cache:"
+INDEX_KEY = "fateh_logistics:report_cache_index"
+
+# Report name -> module implementing get_data(filters)
+CACHED_REPORTS = {
+    "Vehicle PL Report": "fateh_logistics.fateh_logistics.report.vehicle_pl_report.vehicle_pl_report",
+    "Vehicle Report PL": "fateh_logistics.fateh_logistics.report.vehicle_report_pl.vehicle_report_pl",
+    "Vehicle Driver Assignment": "fateh_logistics.fateh_logistics.report.vehicle_driver_assignment.vehicle_driver_assignment",
+}
+
+# Filters that only control how the report is run, not what it returns
+EXECUTION_FILTERS = ("prepare_in_background",)
+
+
+def get_report_result(report_name, filters, get_columns, get_data):
+    """
+    Serve a report from the cache, computing (inline or in the background) on a miss.
+    Returns the (columns, data[, message]) tuple expected from a script report's execute.
+    """
+    filters = frappe._dict(filters or {})
+    columns = get_columns()
+    cache_key = get_cache_key(report_name, filters)
+
+    data = frappe.cache().get_value(cache_key)
+    if data is not None:
+        return columns, data
+
+    if cint(filters.get("prepare_in_background")):
+        frappe.enqueue(
+            "fateh_logistics.report_cache.prepare_report",
+            queue="long",
+            timeout=1800,
+            job_id=cache_key,
+            deduplicate=True,
+            report_name=report_name,
+            filters=normalize_filters(filters),
+            user=frappe.session.user
+        )
+        return columns, [], _("The report is being prepared in the background. It will refresh when ready.")
+
+    data = get_data(filters)
+    set_cached_result(report_name, filters, data)
+    return columns, data
+
+
+def prepare_report(report_name, filters, user=None):
+    """Background job: compute the report and store it in the cache"""
+    filters = frappe._dict(filters)
+    data = frappe.get_module(CACHED_REPORTS[report_name]).get_data(filters)
+    set_cached_result(report_name, filters, data)
+
+    frappe.publish_realtime(
+        "fateh_logistics_report_ready",
+        {"report_name": report_name},
+        user=user or frappe.session.user
+    )
+
+
+def normalize_filters(filters):
+    """Drop empty and execution-only filters and sort multi-value filters so equal requests hash equally"""
+    normalized = {}
+    for key, value in (filters or {}).items():
+        if key in EXECUTION_FILTERS or value in (None, "", []):
+            continue
+        if isinstance(value, list | tuple):
+            value = sorted(str(v).strip() for v in value if str(v).strip())
+        elif isinstance(value, str):
+            value = value.strip()
+        normalized[key] = value
+
+    return normalized
+
+
+def get_cache_key(report_name, filters):
+    payload = json.dumps([report_name, normalize_filters(filters)], sort_keys=True, default=str)
+    return CACHE_KEY_PREFIX + hashlib.md5(payload.encode()).hexdigest()
+
+
+def set_cached_result(report_name, filters, data):
+    cache_key = get_cache_key(report_name, filters)
+    frappe.cache().set_value(cache_key, data, expires_in_sec=CACHE_TTL)
+    frappe.cache().hset(INDEX_KEY, cache_key, {
+        "report_name": report_name,
+        "vehicles": get_filtered_vehicles(filters),
+        "from_date": filters.get("from_date"),
+        "to_date": filters.get("to_date"),
+    })
+
+
+def get_filtered_vehicles(filters):
+    """Vehicles a cached result is limited to, or None when it covers every vehicle"""
+    value = filters.get("vehicle")
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return sorted({v.strip() for v in value if v and v.strip()}) or None
+
+
+def invalidate_report_cache(doc, method=None):
+    """
+    doc_events handler for Purchase Invoice, Journal Entry, Trip Details and Job Record.
+    Drops the cached report results that cover any vehicle and date the document touches.
+    """
+    vehicles, dates = get_touched_vehicles_and_dates(doc)
+    previous = doc.get_doc_before_save() if method == "on_update" else None
+    if previous:
+        old_vehicles, old_dates = get_touched_vehicles_and_dates(previous)
+        vehicles |= old_vehicles
+        dates |= old_dates
+
+    if not vehicles:
+        return
+
+    frappe.db.after_commit.add(lambda: clear_cached_results(vehicles, dates))
+
+
+def get_touched_vehicles_and_dates(doc):
+    if doc.doctype == "Purchase Invoice":
+        vehicles = {row.custom_vehicle for row in doc.get("items") or [] if row.get("custom_vehicle")}
+        dates = {doc.posting_date}
+    elif doc.doctype == "Journal Entry":
+        vehicles = {row.custom_vehicle for row in doc.get("accounts") or [] if row.get("custom_vehicle")}
+        dates = {doc.posting_date}
+    elif doc.doctype == "Trip Details":
+        vehicles = {doc.vehicle} if doc.get("vehicle") else set()
+        dates = {doc.get("posting_date")}
+    elif doc.doctype == "Job Record":
+        vehicles = {row.vehicle for row in doc.get("job_assignment") or [] if row.get("vehicle")}
+        dates = {doc.get("date")}
+    else:
+        return set(), set()
+
+    return vehicles, {getdate(d) for d in dates if d}
+
+
+def clear_cached_results(vehicles, dates=None):
+    """
+    Delete cached results that include any of `vehicles` and whose date range contains any of `dates`.
+    Index entries of results that already expired are pruned on the way.
+    """
+    index = frappe.cache().hgetall(INDEX_KEY) or {}
+    cache_keys = [frappe.safe_decode(cache_key) for cache_key in index]
+
+    pipe = frappe.cache().pipeline()
+    for cache_key in cache_keys:
+        pipe.exists(frappe.cache().make_key(cache_key))
+    exists = pipe.execute() if cache_keys else []
+
+    stale = []
+    for cache_key, entry, is_cached in zip(cache_keys, index.values(), exists):
+        if not is_cached:
+            stale.append(cache_key)
+            continue
+
+        if entry.get("vehicles") is not None and not vehicles.intersection(entry["vehicles"]):
+            continue
+
+        if dates and not any(is_in_range(d, entry.get("from_date"), entry.get("to_date")) for d in dates):
+            continue
+
+        frappe.cache().delete_value(cache_key)
+        stale.append(cache_key)
+
+    if stale:
+        frappe.cache().pipeline().hdel(frappe.cache().make_key(INDEX_KEY), *stale).execute()
+
+
+def is_in_range(date, from_date=None, to_date=None):
+    if from_date and date < getdate(from_date):
+        return False
+    if to_date and date > getdate(to_date):
+        return False
+    return True
@@ -0,0 +1,187 @@
+"""
+Periodic consolidated invoicing of external transporters.
+
+Completed trips of external drivers (Driver.transporter set, no employee) that
+have no Purchase Invoice yet are collected for a period and billed with one
+Purchase Invoice per transporter, one line per trip. Each line carries its
+trip, Job Record and vehicle, so the cost still reaches the job and vehicle
+financials; the header Job Record is only set when every trip belongs to the
+same job. The run executes in the background; trips are locked while they
+are billed and back-linked to their invoice with chunked bulk updates.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import create_batch, flt, getdate, nowdate
+
+# Upper bound on lines per Purchase Invoice; larger transporters get several invoices
+MAX_LINES_PER_INVOICE = 500
+
+# Trips back-linked per UPDATE statement
+BACKLINK_CHUNK_SIZE = 500
+
+
+def is_consolidated_billing_enabled():
+    return bool(frappe.db.get_single_value("Fateh Logistics Settings", "consolidate_transporter_invoices"))
+
+
+def get_billing_item():
+    return frappe.db.get_single_value("Fateh Logistics Settings", "transporter_billing_item") or "Service Transportation"
+
+
+def get_unbilled_trip_conditions(from_date, to_date, transporter=None):
+    conditions = [
+        "td.status = 'Trip Completed'",
+        "IFNULL(td.custom_purchase_invoice, '') = ''",
+        "IFNULL(d.employee, '') = ''",
+        "IFNULL(d.transporter, '') != ''",
+        "td.posting_date BETWEEN %(from_date)s AND %(to_date)s"
+    ]
+    values = {"from_date": from_date, "to_date": to_date}
+
+    if transporter:
+        conditions.append("d.transporter = %(transporter)s")
+        values["transporter"] = transporter
+
+    return " AND ".join(conditions), values
+
+
+def get_unbilled_trips(from_date, to_date, transporter=None, for_update=False):
+    """Completed external trips in the period without a Purchase Invoice, ordered by transporter and date"""
+    conditions, values = get_unbilled_trip_conditions(from_date, to_date, transporter)
+
+    return frappe.db.sql("""
+        SELECT
+            td.name,
+            td.posting_date,
+            td.vehicle,
+            td.driver,
+            td.job_records,
+            td.allowance,
+            d.transporter
+        FROM `tabTrip Details` td
+        JOIN `tabDriver` d ON d.name = td.driver
+        WHERE {conditions}
+        ORDER BY d.transporter, td.posting_date, td.name
+        {lock}
+    """.format(conditions=conditions, lock="FOR UPDATE" if for_update else ""), values, as_dict=True)
+
+
+def get_unbilled_transporters(from_date, to_date):
+    conditions, values = get_unbilled_trip_conditions(from_date, to_date)
+
+    return frappe.db.sql_list("""
+        SELECT DISTINCT d.transporter
+        FROM `tabTrip Details` td
+        JOIN `tabDriver` d ON d.name = td.driver
+        WHERE {conditions}
+        ORDER BY d.transporter
+    """.format(conditions=conditions), values)
+
+
+@frappe.whitelist()
+def get_billing_preview(from_date, to_date, transporter=None):
+    """Trip count and amount per transporter that a billing run for the period would invoice"""
+    frappe.has_permission("Purchase Invoice", "create", throw=True)
+
+    preview = {}
+    for trip in get_unbilled_trips(from_date, to_date, transporter):
+        row = preview.setdefault(trip.transporter, {"transporter": trip.transporter, "trips": 0, "amount": 0})
+        row["trips"] += 1
+        row["amount"] += flt(trip.allowance)
+
+    return list(preview.values())
+
+
+@frappe.whitelist()
+def run_transporter_billing(from_date, to_date, transporter=None, company=None):
+    """Queue a consolidated billing run for the period"""
+    frappe.has_permission("Purchase Invoice", "create", throw=True)
+
+    from_date, to_date = str(getdate(from_date)), str(getdate(to_date))
+    if from_date > to_date:
+        frappe.throw(_("From Date cannot be after To Date"))
+
+    frappe.enqueue(
+        "fateh_logistics.transporter_billing.make_transporter_invoices",
+        queue="long",
+        timeout=3600,
+        job_id=f"fateh_logistics:transporter_billing:{from_date}:{to_date}:{transporter or ''}",
+        deduplicate=True,
+        from_date=from_date,
+        to_date=to_date,
+        transporter=transporter,
+        company=company,
+        user=frappe.session.user
+    )
+
+    return {"status": "queued", "message": _("Transporter billing queued for {0} to {1}").format(from_date, to_date)}
+
+
+def make_transporter_invoices(from_date, to_date, transporter=None, company=None, user=None):
+    """
+    Background job: one draft Purchase Invoice per transporter (split every MAX_LINES_PER_INVOICE trips).
+    Each transporter is committed separately so a failure does not undo invoices already built.
+    """
+    company = company or frappe.defaults.get_user_default("company") or \
+        frappe.db.get_single_value("Global Defaults", "default_company")
+    item_code = get_billing_item()
+
+    transporters = [transporter] if transporter else get_unbilled_transporters(from_date, to_date)
+
+    invoices, failed = [], []
+    for idx, supplier in enumerate(transporters, start=1):
+        try:
+            trips = get_unbilled_trips(from_date, to_date, supplier, for_update=True)
+            for batch in create_batch(trips, MAX_LINES_PER_INVOICE):
+                invoices.append(make_consolidated_invoice(supplier, batch, company, item_code, from_date, to_date))
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), f"Transporter billing failed for {supplier}")
+            failed.append(supplier)
+
+        frappe.publish_progress(
+            idx * 100 / len(transporters),
+            title=_("Billing Transporters"),
+            description=_("{0} of {1} transporters").format(idx, len(transporters))
+        )
+
+    summary = {"invoices": invoices, "failed": failed}
+    frappe.publish_realtime("fateh_logistics_transporter_billing_done", summary, user=user)
+
+    return summary
+
+
+def make_consolidated_invoice(supplier, trips, company, item_code, from_date, to_date):
+    pi = frappe.new_doc("Purchase Invoice")
+    pi.company = company
+    pi.supplier = supplier
+    pi.posting_date = nowdate()
+    pi.bill_date = nowdate()
+    job_records = {trip.job_records for trip in trips}
+    pi.custom_job_record = job_records.pop() if len(job_records) == 1 else None
+    pi.remarks = _("Transport services {0} to {1}").format(from_date, to_date)
+
+    for trip in trips:
+        pi.append("items", {
+            "item_code": item_code,
+            "qty": 1,
+            "rate": flt(trip.allowance),
+            "custom_vehicle": trip.vehicle,
+            "custom_job_record": trip.job_records,
+            "custom_trip_details": trip.name,
+            "description": _("Trip {0} - Vehicle {1} - {2}").format(trip.name, trip.vehicle or "", trip.posting_date)
+        })
+
+    pi.insert(ignore_permissions=True)
+
+    for batch in create_batch([trip.name for trip in trips], BACKLINK_CHUNK_SIZE):
+        frappe.db.sql("""
+            UPDATE `tabTrip Details`
+            SET custom_purchase_invoice = %(invoice)s,
+                custom_purchase_invoice_status = 'Created'
+            WHERE name IN %(trips)s
+        """, {"invoice": pi.name, "trips": tuple(batch)})
+
+    return pi.name
@@ -0,0 +1,213 @@
+"""
+Booking intervals for drivers and vehicles.
+
+Every active Trip Details keeps one `Trip Booking Interval` row per booked
+resource (its vehicle and its driver). The table is indexed by
+(resource_type, resource, from_datetime), so the intervals of one resource are
+kept sorted by start and an overlap check or availability lookup is a short
+range scan of that index instead of a read of the trips themselves.
+Intervals are half-open: a trip ending at 10:00 does not clash with one
+starting at 10:00.
+
+Only trips with both a pickup and a delivery datetime are booked. Start and
+end on Trip Details are dates without a time, so a trip scheduled by dates
+alone does not block its driver or vehicle.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, get_datetime, getdate, now, now_datetime
+
+INACTIVE_TRIP_STATUSES = ("Cancelled",)
+
+# Resource type -> Trip Details field holding it
+BOOKED_RESOURCES = {
+    "Vehicle": "vehicle",
+    "Driver": "driver",
+}
+
+TRIP_SCHEDULE_FIELDS = ["pickup_date_time", "delivery_date_time"]
+
+INTERVAL_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by",
+    "resource_type", "resource", "trip_details", "from_datetime", "to_datetime"
+]
+
+
+def get_trip_interval(trip):
+    """
+    Return (from, to) the trip occupies its driver and vehicle, or None unless both its
+    pickup and delivery datetimes are set.
+    """
+    if not (trip.get("pickup_date_time") and trip.get("delivery_date_time")):
+        return None
+
+    return get_datetime(trip.pickup_date_time), get_datetime(trip.delivery_date_time)
+
+
+def is_active_trip(trip):
+    return trip.get("docstatus") != 2 and trip.get("status") not in INACTIVE_TRIP_STATUSES
+
+
+def validate_trip_booking(trip):
+    """Throw if the trip's driver or vehicle is already booked on an overlapping trip"""
+    if not is_active_trip(trip):
+        return
+
+    interval = get_trip_interval(trip)
+    if not interval:
+        return
+
+    from_datetime, to_datetime = interval
+    if to_datetime <= from_datetime:
+        frappe.throw(_("Trip must end after it starts"), title=_("Invalid Schedule"))
+
+    for resource_type, fieldname in BOOKED_RESOURCES.items():
+        resource = trip.get(fieldname)
+        if not resource:
+            continue
+
+        clash = get_overlapping_booking(resource_type, resource, from_datetime, to_datetime, exclude_trip=trip.name)
+        if clash:
+            frappe.throw(
+                _("{0} {1} is already booked on Trip Details {2} from {3} to {4}").format(
+                    _(resource_type),
+                    frappe.bold(resource),
+                    frappe.bold(clash.trip_details),
+                    clash.from_datetime,
+                    clash.to_datetime
+                ),
+                title=_("Double Booking")
+            )
+
+
+def get_overlapping_booking(resource_type, resource, from_datetime, to_datetime, exclude_trip=None):
+    bookings = frappe.db.sql("""
+        SELECT trip_details, from_datetime, to_datetime
+        FROM `tabTrip Booking Interval`
+        WHERE resource_type = %(resource_type)s
+            AND resource = %(resource)s
+            AND from_datetime < %(to_datetime)s
+            AND to_datetime > %(from_datetime)s
+            AND trip_details != %(exclude_trip)s
+        ORDER BY from_datetime
+        LIMIT 1
+    """, {
+        "resource_type": resource_type,
+        "resource": resource,
+        "from_datetime": from_datetime,
+        "to_datetime": to_datetime,
+        "exclude_trip": exclude_trip or ""
+    }, as_dict=True)
+
+    return bookings[0] if bookings else None
+
+
+def sync_trip_booking(trip):
+    """Replace the trip's intervals with its current schedule"""
+    remove_trip_booking(trip)
+
+    if not is_active_trip(trip):
+        return
+
+    rows = get_interval_rows(trip)
+    if rows:
+        frappe.db.bulk_insert("Trip Booking Interval", fields=INTERVAL_FIELDS, values=rows)
+
+
+def remove_trip_booking(trip):
+    frappe.db.delete("Trip Booking Interval", {"trip_details": trip.name})
+
+
+def get_interval_rows(trip, timestamp=None):
+    interval = get_trip_interval(trip)
+    if not interval:
+        return []
+
+    timestamp = timestamp or now()
+    user = frappe.session.user
+    rows = []
+    for resource_type, fieldname in BOOKED_RESOURCES.items():
+        if trip.get(fieldname):
+            rows.append((
+                frappe.generate_hash(length=10), timestamp, timestamp, user, user,
+                resource_type, trip.get(fieldname), trip.name, interval[0], interval[1]
+            ))
+
+    return rows
+
+
+def rebuild_trip_booking_intervals():
+    """Rebuild every interval from Trip Details; used for backfill and repair"""
+    frappe.db.delete("Trip Booking Interval")
+
+    trips = frappe.get_all(
+        "Trip Details",
+        filters={"status": ["not in", INACTIVE_TRIP_STATUSES]},
+        fields=["name", "vehicle", "driver"] + TRIP_SCHEDULE_FIELDS
+    )
+
+    timestamp = now()
+    rows = []
+    for trip in trips:
+        rows.extend(get_interval_rows(trip, timestamp))
+
+    if rows:
+        frappe.db.bulk_insert("Trip Booking Interval", fields=INTERVAL_FIELDS, values=rows)
+
+
+@frappe.whitelist()
+def find_available(vehicle_type=None, from_datetime=None, to_datetime=None, employee=None,
+                   transporter=None, is_external=None, limit=20):
+    """
+    Vehicles with no booking overlapping [from_datetime, to_datetime).
+
+    `vehicle_type` matches the Vehicle Type link on Vehicle; `employee`, `transporter` and
+    `is_external` ("Internal"/"External") narrow the fleet further. The window defaults to
+    the rest of today from now, or the whole day of `from_datetime` when no end is given.
+    """
+    frappe.has_permission("Vehicle", "read", throw=True)
+
+    from_datetime = get_datetime(from_datetime) if from_datetime else now_datetime()
+    to_datetime = get_datetime(to_datetime) if to_datetime else get_datetime(add_days(getdate(from_datetime), 1))
+
+    conditions = []
+    values = {
+        "from_datetime": from_datetime,
+        "to_datetime": to_datetime,
+        "limit": cint(limit) or 20
+    }
+
+    if vehicle_type:
+        conditions.append("v.custom_vehicle_type = %(vehicle_type)s")
+        values["vehicle_type"] = vehicle_type
+    if employee:
+        conditions.append("v.employee = %(employee)s")
+        values["employee"] = employee
+    if transporter:
+        conditions.append("v.custom_transporter = %(transporter)s")
+        values["transporter"] = transporter
+    if is_external:
+        conditions.append("v.custom_is_external = %(is_external)s")
+        values["is_external"] = is_external
+
+    return frappe.db.sql("""
+        SELECT
+            v.name,
+            v.custom_vehicle_type AS vehicle_type,
+            v.custom_is_external AS is_external,
+            v.employee,
+            v.custom_transporter AS transporter
+        FROM `tabVehicle` v
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM `tabTrip Booking Interval` b
+            WHERE b.resource_type = 'Vehicle'
+                AND b.resource = v.name
+                AND b.from_datetime < %(to_datetime)s
+                AND b.to_datetime > %(from_datetime)s
+        )
+        {conditions}
+        ORDER BY v.name
+        LIMIT %(limit)s
+    """.format(conditions="".join(f" AND {c}" for c in conditions)), values, as_dict=True)
@@ -0,0 +1,258 @@
+"""
+Vehicle P&L aggregation.
+
+Credit and debit per vehicle are kept pre-summed in the `Vehicle Daily PL`
+rollup, one row per (vehicle, posting_date, source_type). Rows are adjusted
+by delta from document events and can be rebuilt from the source vouchers
+with `rebuild_vehicle_daily_pl`. The reports read month or year ranges from
+this table instead of scanning every voucher child row.
+"""
+
+import frappe
+from frappe.utils import flt, now
+
+TRIP_CREDIT = "Trip Credit"
+PURCHASE_INVOICE = "Purchase Invoice"
+JOURNAL_ENTRY = "Journal Entry"
+
+# Grouped source queries used for rebuilds. Each yields vehicle, posting_date and amount.
+ROLLUP_SOURCES = {
+    TRIP_CREDIT: """
+        SELECT ja.vehicle AS vehicle, jr.date AS posting_date,
+            SUM(IFNULL(ja.trip_amount, 0)) AS amount
+        FROM `tabJob Assignment` ja
+        JOIN `tabJob Record` jr ON jr.name = ja.parent
+        WHERE ja.parenttype = 'Job Record'
+            AND jr.docstatus < 2
+            AND IFNULL(ja.vehicle, '') != ''
+            AND jr.date IS NOT NULL
+            {conditions}
+        GROUP BY ja.vehicle, jr.date
+    """,
+    PURCHASE_INVOICE: """
+        SELECT pii.custom_vehicle AS vehicle, pi.posting_date AS posting_date,
+            SUM(COALESCE(NULLIF(pii.base_amount, 0), pii.amount, 0)) AS amount
+        FROM `tabPurchase Invoice Item` pii
+        JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent
+        WHERE pii.parenttype = 'Purchase Invoice'
+            AND pi.docstatus = 1
+            AND IFNULL(pii.custom_vehicle, '') != ''
+            {conditions}
+        GROUP BY pii.custom_vehicle, pi.posting_date
+    """,
+    JOURNAL_ENTRY: """
+        SELECT jea.custom_vehicle AS vehicle, je.posting_date AS posting_date,
+            SUM(COALESCE(NULLIF(jea.debit, 0), jea.debit_in_account_currency, 0)) AS amount
+        FROM `tabJournal Entry Account` jea
+        JOIN `tabJournal Entry` je ON je.name = jea.parent
+        WHERE jea.parenttype = 'Journal Entry'
+            AND je.docstatus = 1
+            AND IFNULL(jea.custom_vehicle, '') != ''
+            {conditions}
+        GROUP BY jea.custom_vehicle, je.posting_date
+    """,
+}
+
+# Voucher doctype -> (source type, child table, amount field with fallback)
+VOUCHER_SOURCES = {
+    "Purchase Invoice": (PURCHASE_INVOICE, "items", ("base_amount", "amount")),
+    "Journal Entry": (JOURNAL_ENTRY, "accounts", ("debit", "debit_in_account_currency")),
+}
+
+ROLLUP_SOURCE_DATE_FIELDS = {
+    TRIP_CREDIT: "jr.date",
+    PURCHASE_INVOICE: "pi.posting_date",
+    JOURNAL_ENTRY: "je.posting_date",
+}
+
+
+def get_vehicle_conditions(filters=None, alias="v"):
+    """
+    Build the `tabVehicle` conditions shared by all vehicle P&L queries.
+
+    Supported filters: vehicle, vehicles (list), employee, vehicle_type ("Internal"/"External").
+    """
+    filters = frappe._dict(filters or {})
+    conditions = []
+    values = {}
+
+    if filters.get("vehicle_type"):
+        conditions.append(f"{alias}.custom_is_external = %(vehicle_type)s")
+        values["vehicle_type"] = filters.vehicle_type
+
+    if filters.get("vehicle"):
+        conditions.append(f"{alias}.name = %(vehicle)s")
+        values["vehicle"] = filters.vehicle
+
+    if filters.get("vehicles"):
+        conditions.append(f"{alias}.name IN %(vehicles)s")
+        values["vehicles"] = tuple(filters.vehicles)
+
+    if filters.get("employee"):
+        conditions.append(f"{alias}.employee = %(employee)s")
+        values["employee"] = filters.employee
+
+    return conditions, values
+
+
+def get_date_conditions(fieldname, from_date=None, to_date=None):
+    conditions = []
+    values = {}
+
+    if from_date:
+        conditions.append(f"{fieldname} >= %(from_date)s")
+        values["from_date"] = from_date
+    if to_date:
+        conditions.append(f"{fieldname} <= %(to_date)s")
+        values["to_date"] = to_date
+
+    return conditions, values
+
+
+def get_vehicle_totals(from_date=None, to_date=None, filters=None):
+    """
+    Return credit and debit for every vehicle matching `filters` in one grouped query on the rollup:
+        {vehicle: {"total_credit": .., "total_purchase": .., "total_journal": .., "total_debit": ..}}
+    """
+    vehicle_conditions, values = get_vehicle_conditions(filters)
+    date_conditions, date_values = get_date_conditions("r.posting_date", from_date, to_date)
+    values.update(date_values)
+    values.update({"trip_credit": TRIP_CREDIT, "purchase_invoice": PURCHASE_INVOICE, "journal_entry": JOURNAL_ENTRY})
+
+    conditions = vehicle_conditions + date_conditions
+    rows = frappe.db.sql("""
+        SELECT r.vehicle,
+            SUM(CASE WHEN r.source_type = %(trip_credit)s THEN r.amount ELSE 0 END) AS total_credit,
+            SUM(CASE WHEN r.source_type = %(purchase_invoice)s THEN r.amount ELSE 0 END) AS total_purchase,
+            SUM(CASE WHEN r.source_type = %(journal_entry)s THEN r.amount ELSE 0 END) AS total_journal
+        FROM `tabVehicle Daily PL` r
+        JOIN `tabVehicle` v ON v.name = r.vehicle
+        {where}
+        GROUP BY r.vehicle
+    """.format(where=("WHERE " + " AND ".join(conditions)) if conditions else ""), values, as_dict=True)
+
+    totals = {}
+    for row in rows:
+        row.total_debit = flt(row.total_purchase) + flt(row.total_journal)
+        totals[row.vehicle] = row
+
+    return totals
+
+
+def update_vehicle_daily_pl(doc, method=None):
+    """
+    doc_events handler: apply the voucher's contribution to the rollup by delta.
+
+    Purchase Invoice / Journal Entry add on submit and subtract on cancel.
+    Job Record is not submittable, so its trip credit is diffed against the
+    version before save and removed again when the record is deleted.
+    """
+    if doc.doctype == "Job Record":
+        deltas = get_trip_credit_contribution(doc)
+        if method == "on_trash":
+            deltas = {key: -amount for key, amount in deltas.items()}
+        else:
+            for key, amount in get_trip_credit_contribution(doc.get_doc_before_save()).items():
+                deltas[key] = deltas.get(key, 0) - amount
+    else:
+        sign = -1 if method == "on_cancel" else 1
+        deltas = {key: sign * amount for key, amount in get_voucher_contribution(doc).items()}
+
+    apply_rollup_deltas(deltas)
+
+
+def get_trip_credit_contribution(job_record):
+    contribution = {}
+    if not job_record or not job_record.get("date"):
+        return contribution
+
+    for row in job_record.get("job_assignment") or []:
+        if row.vehicle and row.trip_amount:
+            key = (row.vehicle, str(job_record.date), TRIP_CREDIT)
+            contribution[key] = contribution.get(key, 0) + flt(row.trip_amount)
+
+    return contribution
+
+
+def get_voucher_contribution(doc):
+    contribution = {}
+    if doc.doctype not in VOUCHER_SOURCES:
+        return contribution
+
+    source_type, table_field, amount_fields = VOUCHER_SOURCES[doc.doctype]
+
+    for row in doc.get(table_field) or []:
+        if not row.get("custom_vehicle"):
+            continue
+        amount = flt(row.get(amount_fields[0])) or flt(row.get(amount_fields[1]))
+        key = (row.custom_vehicle, str(doc.posting_date), source_type)
+        contribution[key] = contribution.get(key, 0) + amount
+
+    return contribution
+
+
+def apply_rollup_deltas(deltas):
+    """Upsert (vehicle, posting_date, source_type) -> amount deltas into the rollup"""
+    timestamp = now()
+    user = frappe.session.user
+
+    for (vehicle, posting_date, source_type), amount in deltas.items():
+        if not flt(amount, 6):
+            continue
+
+        frappe.db.sql("""
+            INSERT INTO `tabVehicle Daily PL`
+                (name, creation, modified, owner, modified_by, vehicle, posting_date, source_type, amount)
+            VALUES (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, %(vehicle)s, %(posting_date)s, %(source_type)s, %(amount)s)
+            ON DUPLICATE KEY UPDATE amount = amount + VALUES(amount), modified = VALUES(modified)
+        """, {
+            "name": frappe.generate_hash(length=12),
+            "now": timestamp,
+            "user": user,
+            "vehicle": vehicle,
+            "posting_date": posting_date,
+            "source_type": source_type,
+            "amount": amount,
+        })
+
+
+@frappe.whitelist()
+def rebuild_vehicle_daily_pl(from_date=None, to_date=None, enqueue=True):
+    """
+    Rebuild the Vehicle Daily PL rollup from source vouchers for the given range (all dates if empty).
+    Used for backfill and repair; runs in the background unless `enqueue` is falsy.
+    """
+    frappe.only_for("System Manager")
+
+    if frappe.parse_json(enqueue):
+        frappe.enqueue(
+            "fateh_logistics.vehicle_pl.rebuild_vehicle_daily_pl",
+            queue="long",
+            timeout=3600,
+            from_date=from_date,
+            to_date=to_date,
+            enqueue=False
+        )
+        return {"status": "queued", "message": "Vehicle Daily PL rebuild queued"}
+
+    date_conditions, values = get_date_conditions("posting_date", from_date, to_date)
+    frappe.db.sql("""
+        DELETE FROM `tabVehicle Daily PL`
+        {where}
+    """.format(where=("WHERE " + " AND ".join(date_conditions)) if date_conditions else ""), values)
+
+    values.update({"now": now(), "user": frappe.session.user})
+
+    for source_type, query in ROLLUP_SOURCES.items():
+        source_conditions, _ = get_date_conditions(ROLLUP_SOURCE_DATE_FIELDS[source_type], from_date, to_date)
+        values["source_type"] = source_type
+
+        frappe.db.sql("""
+            INSERT INTO `tabVehicle Daily PL`
+                (name, creation, modified, owner, modified_by, vehicle, posting_date, source_type, amount)
+            SELECT SUBSTRING(MD5(CONCAT_WS('|', src.vehicle, src.posting_date, %(source_type)s)), 1, 20),
+                %(now)s, %(now)s, %(user)s, %(user)s, src.vehicle, src.posting_date, %(source_type)s, src.amount
+            FROM ({query}) src
+        """.format(query=query.format(conditions="".join(f" AND {c}" for c in source_conditions))), values)
+
+    return {"status": "success", "message": "Vehicle Daily PL rebuilt"}
@@ -0,0 +1,367 @@
+"""
+Server-side sync of the Related Voucher table.
+
+Job Record (`vouchers2`) and Warehouse Job Record (`vouchers`) list the
+invoices and journal entries booked against the job. `sync_related_vouchers`
+optionally adds the submitted vouchers linked to the job, refreshes status and
+totals of every row with one query per voucher doctype, updates the child rows
+in place and writes the sales/cost/GP totals on the parent without a full
+document save.
+
+Consolidated transporter Purchase Invoices carry the Job Record on each line
+instead of the header. They are linked to every job on their lines and count
+on each job with that job's lines only: the net amount of the lines and the
+same share of the grand total.
+
+A nightly resync applies the same refresh to every job not Closed/Cancelled,
+in chunks of jobs handled with set-based queries. It checkpoints after each
+chunk in Fateh Logistics Settings, pauses between chunks and stops after a
+maximum run time, so the next scheduled run resumes where it left off. Each
+run is recorded as a Voucher Resync Run with its counters.
+"""
+
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, flt, get_datetime, now, now_datetime
+
+# Parent doctype -> (Related Voucher table field, link field on the vouchers)
+VOUCHER_TABLES = {
+    "Job Record": ("vouchers2", "custom_job_record"),
+    "Warehouse Job Record": ("vouchers", "custom_warehouse_job_record"),
+}
+
+# Voucher doctype -> party field and amount field shown on linked rows
+VOUCHER_SOURCES = {
+    "Sales Invoice": {"party": "customer_name", "amount": "base_total"},
+    "Purchase Invoice": {"party": "supplier", "amount": "base_total"},
+    "Journal Entry": {"party": "name", "amount": "total_debit"},
+}
+
+DOCSTATUS_LABELS = {0: "Draft", 1: "Submitted", 2: "Cancelled"}
+
+CLOSED_JOB_STATUSES = ("Closed", "Cancelled")
+
+# A completed full pass is not restarted within this many hours
+RESYNC_INTERVAL_HOURS = 20
+
+RELATED_VOUCHER_FIELDS = [
+    "name", "parent", "idx", "voucher_type", "voucher_id", "link_type", "voucher_record_link",
+    "status", "voucher_totalwo_vat", "voucher_total"
+]
+
+
+@frappe.whitelist()
+def sync_related_vouchers(doctype, name, fetch_linked=False):
+    """Refresh the Related Voucher rows of a job and its voucher totals; with `fetch_linked`, add missing linked vouchers"""
+    if doctype not in VOUCHER_TABLES:
+        frappe.throw(_("Voucher sync is not available for {0}").format(doctype))
+
+    frappe.has_permission(doctype, "write", name, throw=True)
+
+    table_field, link_field = VOUCHER_TABLES[doctype]
+    rows = frappe.get_all(
+        "Related Voucher",
+        filters={"parenttype": doctype, "parent": name, "parentfield": table_field},
+        fields=RELATED_VOUCHER_FIELDS,
+        order_by="idx"
+    )
+
+    for row in rows:
+        row.voucher_type = (row.voucher_type or "").strip()
+        row.voucher_id = (row.voucher_id or "").strip()
+        if row.voucher_id and row.voucher_type not in VOUCHER_SOURCES:
+            frappe.throw(_("Row {0}: Voucher Type should be one of {1}").format(
+                row.idx, ", ".join(VOUCHER_SOURCES)))
+
+    added = add_linked_vouchers(doctype, name, table_field, link_field, rows) if frappe.parse_json(fetch_linked) else 0
+
+    updates, totals = get_row_updates(rows, get_vouchers(rows))
+
+    if updates:
+        frappe.db.bulk_update("Related Voucher", updates, update_modified=False)
+
+    frappe.db.set_value(doctype, name, totals)
+
+    return {"added": added, "updated": len(updates), **totals}
+
+
+def get_row_updates(rows, vouchers):
+    """({row name: changed values}, parent totals) for the Related Voucher rows of one job"""
+    updates = {}
+    total_sales = total_cost = 0
+
+    for row in rows:
+        voucher = vouchers.get((row.voucher_type, row.voucher_id))
+        if not voucher:
+            continue
+
+        # Line-linked invoices count with this job's lines only
+        voucher = (voucher.get("job_shares") or {}).get(row.parent) or voucher
+
+        values = {
+            "link_type": row.voucher_type,
+            "voucher_record_link": voucher.name,
+            "status": voucher.status,
+            "voucher_totalwo_vat": flt(voucher.total),
+            "voucher_total": flt(voucher.grand_total),
+        }
+        if any(row.get(field) != value for field, value in values.items()):
+            updates[row.name] = values
+
+        if voucher.docstatus == 1:
+            if row.voucher_type == "Sales Invoice":
+                total_sales += flt(voucher.total)
+            elif row.voucher_type == "Purchase Invoice":
+                total_cost += flt(voucher.total)
+
+    totals = {
+        "total_sales_sar": total_sales,
+        "total_cost_sar": total_cost,
+        "gp_sar": total_sales - total_cost,
+    }
+
+    return updates, totals
+
+
+def add_linked_vouchers(doctype, name, table_field, link_field, rows):
+    """Append submitted vouchers linked to the job that are not in the table yet; `rows` is extended in place"""
+    existing = {(row.voucher_type, row.voucher_id) for row in rows}
+    idx = max([row.idx for row in rows] or [0])
+
+    new_rows = []
+    for voucher_type, source in VOUCHER_SOURCES.items():
+        vouchers = frappe.get_all(
+            voucher_type,
+            filters={link_field: name, "docstatus": 1},
+            fields=["name", f"{source['party']} AS party", f"{source['amount']} AS amount"],
+            order_by="creation"
+        )
+        if voucher_type == "Purchase Invoice" and link_field == "custom_job_record":
+            vouchers += get_line_linked_purchase_invoices(name)
+
+        for voucher in vouchers:
+            if (voucher_type, voucher.name) in existing:
+                continue
+
+            idx += 1
+            row = frappe._dict(
+                name=frappe.generate_hash(length=10),
+                parent=name,
+                idx=idx,
+                voucher_type=voucher_type,
+                voucher_id=voucher.name,
+                name1=voucher.party,
+                amount=flt(voucher.amount),
+            )
+            new_rows.append(row)
+            rows.append(row)
+
+    if new_rows:
+        timestamp = now()
+        user = frappe.session.user
+        frappe.db.bulk_insert(
+            "Related Voucher",
+            fields=["name", "creation", "modified", "owner", "modified_by", "parent", "parenttype", "parentfield",
+                    "idx", "voucher_type", "voucher_id", "name1", "amount"],
+            values=[
+                (row.name, timestamp, timestamp, user, user, name, doctype, table_field,
+                    row.idx, row.voucher_type, row.voucher_id, row.name1, row.amount)
+                for row in new_rows
+            ]
+        )
+
+    return len(new_rows)
+
+
+def get_line_linked_purchase_invoices(job_record):
+    """Submitted Purchase Invoices without a header Job Record that have lines for the job, with the lines' amount"""
+    return frappe.db.sql("""
+        SELECT pi.name, pi.supplier AS party, SUM(pii.base_amount) AS amount
+        FROM `tabPurchase Invoice Item` pii
+        JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent
+        WHERE pii.custom_job_record = %(job_record)s AND pi.docstatus = 1
+            AND IFNULL(pi.custom_job_record, '') = ''
+        GROUP BY pi.name
+        ORDER BY MIN(pi.creation)
+    """, {"job_record": job_record}, as_dict=True)
+
+
+def get_job_shares(purchase_invoices):
+    """{invoice: {job_record: voucher}} for invoices attributed per line, each job with its lines' share"""
+    shares = {}
+    for line in frappe.db.sql("""
+        SELECT pi.name, pi.docstatus, pi.status, pii.custom_job_record AS job_record,
+            SUM(pii.amount) AS total,
+            SUM(pii.amount * pi.grand_total / pi.total) AS grand_total
+        FROM `tabPurchase Invoice Item` pii
+        JOIN `tabPurchase Invoice` pi ON pi.name = pii.parent
+        WHERE pi.name IN %(invoices)s AND IFNULL(pi.custom_job_record, '') = ''
+            AND IFNULL(pii.custom_job_record, '') != '' AND pi.total != 0
+        GROUP BY pi.name, pii.custom_job_record
+    """, {"invoices": tuple(purchase_invoices)}, as_dict=True):
+        shares.setdefault(line.name, {})[line.job_record] = line
+
+    return shares
+
+
+def get_vouchers(rows):
+    """{(voucher_type, name): voucher} with status and totals, one query per voucher doctype"""
+    names = {}
+    for row in rows:
+        if row.voucher_id:
+            names.setdefault(row.voucher_type, set()).add(row.voucher_id)
+
+    vouchers = {}
+    for voucher_type, voucher_names in names.items():
+        if voucher_type == "Journal Entry":
+            fields = ["name", "docstatus", "total_debit AS total", "total_debit AS grand_total"]
+        else:
+            fields = ["name", "docstatus", "status", "total", "grand_total"]
+
+        job_shares = get_job_shares(voucher_names) if voucher_type == "Purchase Invoice" else {}
+        for voucher in frappe.get_all(voucher_type, filters={"name": ["in", list(voucher_names)]}, fields=fields):
+            voucher.status = voucher.get("status") or DOCSTATUS_LABELS.get(voucher.docstatus)
+            voucher.job_shares = job_shares.get(voucher.name)
+            vouchers[(voucher_type, voucher.name)] = voucher
+
+    return vouchers
+
+
+def resync_voucher_totals():
+    """Scheduler: queue a resync run unless disabled or a full pass finished recently"""
+    settings = frappe.get_single("Fateh Logistics Settings")
+    if not settings.enable_voucher_resync:
+        return
+
+    if not settings.voucher_resync_doctype and settings.voucher_resync_last_completed and \
+        get_datetime(settings.voucher_resync_last_completed) > add_to_date(now_datetime(), hours=-RESYNC_INTERVAL_HOURS):
+        return
+
+    frappe.enqueue(
+        "fateh_logistics.voucher_sync.run_voucher_resync",
+        queue="long",
+        timeout=(settings.voucher_resync_max_minutes or 50) * 60 + 600,
+        job_id="fateh_logistics:voucher_resync",
+        deduplicate=True
+    )
+
+
+def run_voucher_resync():
+    """Background job: resync open jobs chunk by chunk from the checkpoint, committing after every chunk"""
+    settings = frappe.get_single("Fateh Logistics Settings")
+    chunk_size = settings.voucher_resync_chunk_size or 200
+    deadline = time.monotonic() + (settings.voucher_resync_max_minutes or 50) * 60
+
+    checkpoint_doctype = settings.voucher_resync_doctype if settings.voucher_resync_doctype in VOUCHER_TABLES else None
+    doctypes = list(VOUCHER_TABLES)
+    if checkpoint_doctype:
+        doctypes = doctypes[doctypes.index(checkpoint_doctype):]
+
+    run = frappe.get_doc({
+        "doctype": "Voucher Resync Run",
+        "status": "Running",
+        "started_on": now(),
+        "resumed_from": f"{checkpoint_doctype}: {settings.voucher_resync_last_name}" if checkpoint_doctype else None
+    }).insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    counters = {"chunks": 0, "jobs_scanned": 0, "jobs_changed": 0, "rows_updated": 0}
+
+    try:
+        for doctype in doctypes:
+            after = settings.voucher_resync_last_name if doctype == checkpoint_doctype else ""
+
+            while True:
+                names = frappe.get_all(
+                    doctype,
+                    filters={"job_status": ["not in", CLOSED_JOB_STATUSES], "name": [">", after or ""]},
+                    pluck="name",
+                    order_by="name asc",
+                    limit=chunk_size
+                )
+                if not names:
+                    break
+
+                jobs_changed, rows_updated = resync_chunk(doctype, names)
+                after = names[-1]
+
+                counters["chunks"] += 1
+                counters["jobs_scanned"] += len(names)
+                counters["jobs_changed"] += jobs_changed
+                counters["rows_updated"] += rows_updated
+
+                set_checkpoint(doctype, after)
+                run.db_set(counters)
+                frappe.db.commit()
+
+                if time.monotonic() > deadline:
+                    run.db_set({"status": "Paused", "finished_on": now()})
+                    frappe.db.commit()
+                    return
+
+                time.sleep(flt(settings.voucher_resync_pause))
+
+        set_checkpoint(None, None)
+        frappe.db.set_single_value("Fateh Logistics Settings", "voucher_resync_last_completed", now())
+        run.db_set({"status": "Completed", "finished_on": now()})
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        run.db_set({"status": "Failed", "finished_on": now(), "error": frappe.get_traceback(), **counters})
+        frappe.db.commit()
+        frappe.log_error(frappe.get_traceback(), "Voucher resync failed")
+
+
+def resync_chunk(doctype, names):
+    """Refresh voucher rows and totals of a chunk of jobs; returns (jobs changed, rows updated)"""
+    table_field = VOUCHER_TABLES[doctype][0]
+
+    rows = frappe.get_all(
+        "Related Voucher",
+        filters={"parenttype": doctype, "parentfield": table_field, "parent": ["in", names]},
+        fields=RELATED_VOUCHER_FIELDS,
+        order_by="parent, idx"
+    )
+
+    rows_by_job = {}
+    for row in rows:
+        row.voucher_type = (row.voucher_type or "").strip()
+        row.voucher_id = (row.voucher_id or "").strip()
+        if row.voucher_type in VOUCHER_SOURCES:
+            rows_by_job.setdefault(row.parent, []).append(row)
+
+    vouchers = get_vouchers([row for job_rows in rows_by_job.values() for row in job_rows])
+    current = {
+        job.name: job for job in frappe.get_all(
+            doctype,
+            filters={"name": ["in", names]},
+            fields=["name", "total_sales_sar", "total_cost_sar", "gp_sar"]
+        )
+    }
+
+    row_updates, job_updates, changed = {}, {}, set()
+    for name in names:
+        updates, totals = get_row_updates(rows_by_job.get(name, []), vouchers)
+        if updates:
+            row_updates.update(updates)
+            changed.add(name)
+
+        if any(flt(current[name].get(field), 2) != flt(value, 2) for field, value in totals.items()):
+            job_updates[name] = totals
+            changed.add(name)
+
+    if row_updates:
+        frappe.db.bulk_update("Related Voucher", row_updates, update_modified=False)
+    if job_updates:
+        frappe.db.bulk_update(doctype, job_updates, update_modified=False)
+
+    return len(changed), len(row_updates)
+
+
+def set_checkpoint(doctype, name):
+    frappe.db.set_single_value("Fateh Logistics Settings", {
+        "voucher_resync_doctype": doctype,
+        "voucher_resync_last_name": name
+    })